@@ -1,6 +1,20 @@
+import contextlib
+import functools
+import json
+import struct
+import threading
 from datetime import datetime
 from json import JSONEncoder, JSONDecoder
 
+from berkeleydb import db
+
+from myMsgs import NoTransactionError, TransactionInProgressError
+from myRow import Row, schema_row_class
+from myTable import Table
+from myTypes import *
+
+INDEX_SCAN_BATCH = 1000  # Index entries an ordered index scan reads with one cursor (see MyDB.scan_index_ordered)
+
 
 class MyEncoder(JSONEncoder):
     """Extended JSONEncoder to support tuples, sets, and datetime objects"""
@@ -48,5 +62,602 @@ def tname_to_schema_key(tname: str) -> str:
     return tname + '.schema'
 
 
+def tname_to_stats_key(tname: str) -> str:
+    return tname + '.stats'
+
+
 def tname_to_data_key(tname: str) -> str:
+    """Key of the legacy layout, where the whole table is stored as one JSON list"""
     return tname + '.data'
+
+
+def tname_to_next_row_id_key(tname: str) -> str:
+    """Key of the row id the next new row of the table gets, kept so that the row id of a deleted row is not reused"""
+    return tname + '.next_row_id'
+
+
+def tname_to_row_count_key(tname: str) -> str:
+    """Key of the number of rows of the table, kept so that COUNT(*) does not read them. Tables created before it was
+    kept have none."""
+    return tname + '.row_count'
+
+
+def tname_to_row_prefix(tname: str) -> bytes:
+    return tname.encode() + b'\x00'
+
+
+def row_key(tname: str, row_id: RowId) -> bytes:
+    # Big-endian row id, so that the rows of a table are sorted by row id in the B-tree
+    return tname_to_row_prefix(tname) + row_id.to_bytes(8, 'big')
+
+
+def index_prefix(index_name: IndexName) -> bytes:
+    return index_name.encode() + b'\x00'
+
+
+def index_value_key(value: Value) -> bytes:
+    """Order-preserving, prefix-free encoding of a value for B-tree indexes.
+
+    NULL sorts first. Strings are lowered, as the where clause compares them case-insensitively.
+    """
+    if value is None:
+        return b'\x00'
+    if isinstance(value, int):
+        magnitude = abs(value).to_bytes(max(1, (abs(value).bit_length() + 7) // 8), 'big')
+        if value >= 0:
+            return b'\x02' + bytes([len(magnitude)]) + magnitude
+        # Negative: longer (and then larger) magnitudes sort first
+        return b'\x01' + bytes([0xff - len(magnitude)]) + bytes(0xff - b for b in magnitude)
+    if isinstance(value, datetime):
+        return b'\x03' + value.toordinal().to_bytes(4, 'big')
+    # Escape NUL bytes so that the terminator sorts before any content
+    return b'\x04' + value.lower().encode().replace(b'\x00', b'\x00\xff') + b'\x00\x00'
+
+
+NON_NULL_INDEX_KEY = b'\x01'  # Smallest encoding of a non-null value
+
+
+def index_entry_key(index_name: IndexName, value: Value, row_id: RowId) -> bytes:
+    return index_prefix(index_name) + index_value_key(value) + row_id.to_bytes(8, 'big')
+
+
+class JsonRowCodec:
+    """Legacy row format: the row as a JSON object, through MyEncoder/MyDecoder"""
+
+    name = 'json'
+
+    def encode(self, schema: TableSchema, row: TableRow) -> bytes:
+        return json.dumps(dict(row), cls=MyEncoder).encode()
+
+    def decode(self, schema: TableSchema, data: bytes) -> TableRow:
+        return schema_row_class(schema).from_mapping(json.loads(data.decode(), cls=MyDecoder))
+
+
+BINARY_ROW_TAG = 0x01  # First byte of a binary row (a JSON row always starts with '{')
+
+_INT = struct.Struct('<q')
+_DATE = struct.Struct('<i')
+
+
+class BinaryRowCodec:
+    """Compact row format driven by the table schema.
+
+    Layout: tag byte, null bitmap (one bit per column in schema order), then every non-null value in column order:
+    int as 8-byte signed integer, date as 4-byte day ordinal, char as UTF-8 bytes prefixed by their length (the width
+    of the prefix is chosen from char_len). Ints that do not fit in 8 bytes fall back to JSON for that row.
+    """
+
+    name = 'binary'
+
+    def __init__(self):
+        # Compiled layout and row class per schema. The schema object is kept to detect a table being recreated with
+        # the same name.
+        self._layouts: dict[int, tuple[TableSchema, list[tuple[ColumnName, str, struct.Struct | None]], type[Row]]] = {}
+
+    def _layout(self, schema: TableSchema) -> tuple[list[tuple[ColumnName, str, struct.Struct | None]], type[Row]]:
+        cached = self._layouts.get(id(schema))
+        if cached is not None and cached[0] is schema:
+            return cached[1:]
+        layout = []
+        for column_name, column in schema['columns'].items():
+            length_struct = None
+            if column['data_type'] == 'char':
+                max_bytes = column['char_len'] * 4  # UTF-8 uses at most 4 bytes per character
+                length_struct = struct.Struct('<B' if max_bytes <= 0xff else '<H' if max_bytes <= 0xffff else '<I')
+            layout.append((column_name, column['data_type'], length_struct))
+        cls = schema_row_class(schema)
+        self._layouts[id(schema)] = (schema, layout, cls)
+        return layout, cls
+
+    def encode(self, schema: TableSchema, row: TableRow) -> bytes:
+        layout, cls = self._layout(schema)
+        values = row.values() if isinstance(row, Row) else [row[column_name] for (column_name, _, _) in layout]
+        body = bytearray()
+        null_bits = 0
+        try:
+            for i, ((column_name, data_type, length_struct), value) in enumerate(zip(layout, values)):
+                if value is None:
+                    null_bits |= 1 << i
+                elif data_type == 'int':
+                    body += _INT.pack(value)
+                elif data_type == 'date':
+                    body += _DATE.pack(value.toordinal())
+                else:
+                    encoded = value.encode()
+                    body += length_struct.pack(len(encoded))
+                    body += encoded
+        except struct.error:
+            return JSON_ROW_CODEC.encode(schema, row)
+        return bytes([BINARY_ROW_TAG]) + null_bits.to_bytes((len(layout) + 7) // 8, 'little') + body
+
+    def decode(self, schema: TableSchema, data: bytes) -> TableRow:
+        layout, cls = self._layout(schema)
+        offset = 1 + (len(layout) + 7) // 8
+        null_bits = int.from_bytes(data[1:offset], 'little')
+        values: list[Value] = []
+        for i, (column_name, data_type, length_struct) in enumerate(layout):
+            if null_bits >> i & 1:
+                values.append(None)
+            elif data_type == 'int':
+                values.append(_INT.unpack_from(data, offset)[0])
+                offset += 8
+            elif data_type == 'date':
+                values.append(datetime.fromordinal(_DATE.unpack_from(data, offset)[0]))
+                offset += 4
+            else:
+                length = length_struct.unpack_from(data, offset)[0]
+                offset += length_struct.size
+                values.append(data[offset:offset + length].decode())
+                offset += length
+        return cls(*values)
+
+
+JSON_ROW_CODEC = JsonRowCodec()
+BINARY_ROW_CODEC = BinaryRowCodec()
+ROW_CODECS = {codec.name: codec for codec in (JSON_ROW_CODEC, BINARY_ROW_CODEC)}
+
+
+def decode_row(schema: TableSchema, data: bytes) -> TableRow:
+    """Decode a stored row, whichever codec wrote it"""
+    if data[0] == BINARY_ROW_TAG:
+        return BINARY_ROW_CODEC.decode(schema, data)
+    return JSON_ROW_CODEC.decode(schema, data)
+
+
+def _serialized(method):
+    """Run the method of MyDB holding its mutex"""
+
+    @functools.wraps(method)
+    def serialized(self, *args, **kwargs):
+        with self.mutex:
+            return method(self, *args, **kwargs)
+
+    return serialized
+
+
+def _writing(method):
+    """Run the method of MyDB holding its mutex, noting that the statement being run has written"""
+
+    @functools.wraps(method)
+    def writing(self, *args, **kwargs):
+        with self.mutex:
+            self.statement_wrote = True
+            return method(self, *args, **kwargs)
+
+    return writing
+
+
+class MyDB:
+    """Berkeley DB handles of the database.
+
+    Catalog records (table schemas) are kept in a hash database. Every row of every table is its own record in a
+    B-tree database, keyed by table name and row id, so that a statement only writes the rows it touches and the rows
+    of one table can be read with a single range scan.
+
+    Rows are written with the codec named by row_codec ('binary' or the legacy 'json'); both can be read back.
+    table_schemas is the (shared, live) dictionary of table schemas, used by the codecs and to find indexes.
+
+    Secondary indexes (CREATE INDEX) share a third, B-tree database: an entry per row, keyed by index name, encoded
+    column value (see index_value_key) and row id, so that equality and range predicates are cursor range scans.
+    put_row and delete_row keep the entries of the table's indexes up to date.
+
+    The databases live in a transactional environment in the home directory. Every read and write goes through the
+    current transaction: the one statement() opens for a statement, nested in the explicit one between begin and
+    commit/rollback, or else (when batching) in the one of all statements up to the next checkpoint(). A commit of the
+    outermost transaction flushes the log once for all its writes. A statement that fails is aborted, with its writes.
+
+    The handles may be used from several threads (as the server does). Berkeley DB locking is not initialized, so the
+    methods hold mutex around their Berkeley DB calls (iterating iter_rows should too). The transaction of a statement
+    belongs to the thread running it: reads of other threads go through no transaction (or BEGIN's, which the server
+    only lets its connection use), and the server keeps them off the tables being modified.
+
+    Writing statements take turns on purpose: statement() holds statement_lock, so that only one transaction writes at
+    a time. Without Berkeley DB locking, transactions writing at the same time could change the same B-tree pages (the
+    rows of all tables share one), and aborting one of them would undo the writes of the others.
+    """
+
+    def __init__(self, file_name: str, table_schemas: dict[TableName, TableSchema], row_codec: str = 'binary',
+                 home: str = '.'):
+        self.table_schemas = table_schemas
+        self.row_codec = ROW_CODECS[row_codec]
+        self.env = db.DBEnv()
+        # Only this process uses the environment, so Berkeley DB locking is not initialized (see mutex). DB_RECOVER
+        # brings the databases back to the last commit if the previous run did not close them.
+        self.env.open(home, db.DB_CREATE | db.DB_INIT_MPOOL | db.DB_INIT_LOG | db.DB_INIT_TXN | db.DB_RECOVER
+                      | db.DB_THREAD)
+        self.mutex = threading.RLock()  # Held by each call to Berkeley DB
+        self.statement_lock = threading.Lock()  # Held by the statement writing, see statement()
+        self.outer_txn = None  # Transaction of BEGIN ... COMMIT, or of the batched statements (see txn)
+        self.in_transaction = False  # Whether outer_txn was started by BEGIN
+        self._statement_txns = threading.local()  # Transaction of the statement each thread runs (see statement())
+        self.statement_failed = False  # Whether the statement being run is to be rolled back (see fail_statement)
+        self.statement_wrote = False  # Whether the statement being run (or the last one) has written
+        self.batching = False  # Whether statements outside of BEGIN ... COMMIT share a transaction until checkpoint()
+        self.catalog = db.DB(self.env)
+        self.catalog.open(file_name, dbtype=db.DB_HASH, flags=db.DB_CREATE | db.DB_AUTO_COMMIT | db.DB_THREAD)
+        self.rows = db.DB(self.env)
+        self.rows.open(file_name + '.rows', dbtype=db.DB_BTREE, flags=db.DB_CREATE | db.DB_AUTO_COMMIT | db.DB_THREAD)
+        self.indexes = db.DB(self.env)
+        self.indexes.open(file_name + '.indexes', dbtype=db.DB_BTREE,
+                          flags=db.DB_CREATE | db.DB_AUTO_COMMIT | db.DB_THREAD)
+
+    @_serialized
+    def begin(self):
+        if self.in_transaction:
+            raise TransactionInProgressError()
+        self.checkpoint()  # Statements batched before BEGIN are not rolled back with the transaction
+        self.outer_txn = self.env.txn_begin()
+        self.in_transaction = True
+
+    @_serialized
+    def commit(self):
+        if not self.in_transaction:
+            raise NoTransactionError('Commit')
+        self.outer_txn.commit()
+        self.outer_txn = None
+        self.in_transaction = False
+
+    @_serialized
+    def rollback(self):
+        if not self.in_transaction:
+            raise NoTransactionError('Rollback')
+        self.outer_txn.abort()
+        self.outer_txn = None
+        self.in_transaction = False
+
+    @_serialized
+    def checkpoint(self):
+        """Commit the statements batched since the last checkpoint"""
+        if self.outer_txn is not None and not self.in_transaction:
+            self.outer_txn.commit()
+            self.outer_txn = None
+
+    @contextlib.contextmanager
+    def statement(self):
+        """Run a statement in a transaction of its own, nested in the current one: BEGIN's or, when batching, the one of
+        the statements up to the next checkpoint. It commits after the statement (into the enclosing transaction, if
+        any), unless fail_statement() has been called or an exception gets out of the statement: then it is aborted,
+        so that the statement leaves no write. An exception out of a batched statement also rolls back the batch."""
+        if self.in_transaction:
+            with self._statement_txn():
+                yield
+            return
+        with self.statement_lock:
+            if not self.batching:
+                with self._statement_txn():
+                    yield
+                return
+            self._begin_batch_txn()
+            try:
+                with self._statement_txn():
+                    yield
+            except BaseException:
+                self._abort_batch_txn()
+                raise
+
+    def fail_statement(self):
+        """Have statement() roll back the statement being run, which has failed"""
+        self.statement_failed = True
+
+    @property
+    def txn(self):
+        """Transaction the calling thread accesses the databases through: that of the statement it runs, or else
+        outer_txn (None outside of a transaction, for the SELECTs the server runs outside of statement())"""
+        return getattr(self._statement_txns, 'txn', None) or self.outer_txn
+
+    @contextlib.contextmanager
+    def _statement_txn(self):
+        with self.mutex:
+            parent = self.txn
+            txn = self._statement_txns.txn = self.env.txn_begin(parent)
+            self.statement_failed = self.statement_wrote = False
+        try:
+            yield
+        except BaseException:
+            self.statement_failed = True
+            raise
+        finally:
+            with self.mutex:
+                self._statement_txns.txn = None
+                if self.statement_failed:
+                    txn.abort()
+                else:
+                    txn.commit()
+
+    @_serialized
+    def _begin_batch_txn(self):
+        if self.outer_txn is None:
+            self.outer_txn = self.env.txn_begin()
+
+    @_serialized
+    def _abort_batch_txn(self):
+        self.outer_txn.abort()
+        self.outer_txn = None
+
+    @_serialized
+    def load_catalog(self, table_stats: dict[TableName, TableStats]):
+        """(Re)load table_schemas and table_stats from the catalog"""
+        self.table_schemas.clear()
+        table_stats.clear()
+        for key, value in self.items():
+            if key.decode().endswith('.schema'):
+                self.table_schemas[key.decode()[:-7]] = json.loads(value.decode(), cls=MyDecoder)
+            elif key.decode().endswith('.stats'):
+                table_stats[key.decode()[:-6]] = json.loads(value.decode(), cls=MyDecoder)
+
+    @_writing
+    def put(self, key: bytes, value: bytes):
+        self.catalog.put(key, value, txn=self.txn)
+
+    @_serialized
+    def get(self, key: bytes) -> bytes | None:
+        return self.catalog.get(key, txn=self.txn)
+
+    @_writing
+    def delete(self, key: bytes):
+        self.catalog.delete(key, txn=self.txn)
+
+    @_serialized
+    def items(self) -> list[tuple[bytes, bytes]]:
+        return self.catalog.items(txn=self.txn)
+
+    @_writing
+    def put_row(self, tname: TableName, row_id: RowId, row: TableRow,
+                old_values: dict[ColumnName, Value] | None = None):
+        """Write the row. old_values has the previous values of the columns that changed (None for a new row)."""
+        self.rows.put(row_key(tname, row_id), self.row_codec.encode(self.table_schemas[tname], row), txn=self.txn)
+        for index_name, column_name in self.table_schemas[tname].get('indexes', {}).items():
+            if old_values is None:
+                self.put_index_entry(index_name, row[column_name], row_id)
+            elif column_name in old_values:
+                self.delete_index_entry(index_name, old_values[column_name], row_id)
+                self.put_index_entry(index_name, row[column_name], row_id)
+
+    @_writing
+    def put_rows(self, tname: TableName, rows: list[tuple[RowId, TableRow]]):
+        """Write a batch of new rows, whose row ids are above those of all the rows the table has had (see
+        next_row_id).
+
+        The records of the batch and the entries of each index are written in key order, so consecutive puts land on
+        the same B-tree pages.
+        """
+        schema = self.table_schemas[tname]
+        for key, data in sorted((row_key(tname, row_id), self.row_codec.encode(schema, row)) for row_id, row in rows):
+            self.rows.put(key, data, txn=self.txn)
+        if rows:
+            next_row_id = max(row_id for row_id, _ in rows) + 1
+            self.catalog.put(tname_to_next_row_id_key(tname).encode(), str(next_row_id).encode(), txn=self.txn)
+            self._add_row_count(tname, len(rows))
+        for index_name, column_name in schema.get('indexes', {}).items():
+            for key in sorted(index_entry_key(index_name, row[column_name], row_id) for row_id, row in rows):
+                self.indexes.put(key, b'', txn=self.txn)
+
+    @_serialized
+    def next_row_id(self, tname: TableName) -> RowId:
+        """Row id of the next new row of the table, as of the last put_rows (0 if there has been none)"""
+        value = self.catalog.get(tname_to_next_row_id_key(tname).encode(), txn=self.txn)
+        return 0 if value is None else int(value)
+
+    @_serialized
+    def row_count(self, tname: TableName) -> int | None:
+        """Number of rows of the table, None if the table has no row count (see tname_to_row_count_key)"""
+        value = self.catalog.get(tname_to_row_count_key(tname).encode(), txn=self.txn)
+        return None if value is None else int(value)
+
+    def _add_row_count(self, tname: TableName, delta: int):
+        key = tname_to_row_count_key(tname).encode()
+        value = self.catalog.get(key, txn=self.txn)
+        if value is not None:
+            self.catalog.put(key, str(int(value) + delta).encode(), txn=self.txn)
+
+    @_writing
+    def delete_row_batch(self, tname: TableName, rows: list[tuple[RowId, TableRow]]):
+        """Delete the rows (see delete_row), and take them off the row count of the table"""
+        for row_id, row in rows:
+            self.delete_row(tname, row_id, row)
+        self._add_row_count(tname, -len(rows))
+
+    @_writing
+    def delete_row(self, tname: TableName, row_id: RowId, row: TableRow):
+        """Delete the row and its index entries. The row count of the table is left as it is (see delete_row_batch)."""
+        self.rows.delete(row_key(tname, row_id), txn=self.txn)
+        for index_name, column_name in self.table_schemas[tname].get('indexes', {}).items():
+            self.delete_index_entry(index_name, row[column_name], row_id)
+
+    @_writing
+    def put_index_entry(self, index_name: IndexName, value: Value, row_id: RowId):
+        self.indexes.put(index_entry_key(index_name, value, row_id), b'', txn=self.txn)
+
+    @_writing
+    def delete_index_entry(self, index_name: IndexName, value: Value, row_id: RowId):
+        self.indexes.delete(index_entry_key(index_name, value, row_id), txn=self.txn)
+
+    @_writing
+    def drop_index(self, index_name: IndexName):
+        """Delete all entries of the index"""
+        prefix = index_prefix(index_name)
+        cursor = self.indexes.cursor(txn=self.txn)
+        record = cursor.set_range(prefix)
+        while record is not None and record[0].startswith(prefix):
+            cursor.delete()
+            record = cursor.next()
+        cursor.close()
+
+    @_serialized
+    def scan_index(self, index_name: IndexName, comp_operator: Literal['lt', 'gt', 'eq', 'gte', 'lte', 'is_null'],
+                   value: Value = None) -> list[RowId]:
+        """Row ids of the rows whose indexed value satisfies '<value> <comp_operator> value', in value order"""
+        prefix = index_prefix(index_name)
+        bound = index_value_key(value)
+        start = {'lt': NON_NULL_INDEX_KEY, 'lte': NON_NULL_INDEX_KEY, 'is_null': index_value_key(None)}.get(
+            comp_operator, bound)
+        row_ids: list[RowId] = []
+        cursor = self.indexes.cursor(txn=self.txn)
+        record = cursor.set_range(prefix + start)
+        while record is not None and record[0].startswith(prefix):
+            value_key = record[0][len(prefix):-8]
+            if comp_operator == 'is_null' and value_key != index_value_key(None):
+                break
+            if (comp_operator == 'eq' and value_key != bound) or (comp_operator == 'lt' and value_key >= bound) \
+                    or (comp_operator == 'lte' and value_key > bound):
+                break
+            if not (comp_operator == 'gt' and value_key == bound):
+                row_ids.append(int.from_bytes(record[0][-8:], 'big'))
+            record = cursor.next()
+        cursor.close()
+        return row_ids
+
+    def scan_index_ordered(self, index_name: IndexName, descending: bool = False) -> Iterator[RowId]:
+        """Row ids of all the rows of the index, in the order of their indexed values (in reverse if descending). Rows
+        with equal values come in row id order either way.
+
+        The entries are read INDEX_SCAN_BATCH at a time, each batch with its own cursor and holding mutex, so that a
+        scan stopped early (by a LIMIT) reads little, and other threads can use the handles between batches.
+        """
+        prefix = index_prefix(index_name)
+        run_value_key: bytes | None = None
+        run: list[RowId] = []  # Row ids of the current value, when descending
+        after: bytes | None = None
+        while keys := self._index_keys(prefix, descending, after):
+            for key in keys:
+                row_id = int.from_bytes(key[-8:], 'big')
+                if not descending:
+                    yield row_id
+                    continue
+                if key[len(prefix):-8] != run_value_key:
+                    yield from reversed(run)
+                    run_value_key, run = key[len(prefix):-8], []
+                run.append(row_id)
+            after = keys[-1]
+        yield from reversed(run)
+
+    @_serialized
+    def _index_keys(self, prefix: bytes, descending: bool, after: bytes | None) -> list[bytes]:
+        """The next INDEX_SCAN_BATCH keys of the index with the prefix, after the given key (from the first or, if
+        descending, the last one if None)"""
+        cursor = self.indexes.cursor(txn=self.txn)
+        try:
+            if not descending:
+                record = cursor.set_range(prefix if after is None else after)
+                if record is not None and record[0] == after:
+                    record = cursor.next()
+                step = cursor.next
+            else:
+                # The entries of other indexes follow those of the index (see index_prefix)
+                record = cursor.set_range(prefix[:-1] + b'\x01' if after is None else after)
+                record = cursor.prev() if record is not None else cursor.last()
+                step = cursor.prev
+            keys: list[bytes] = []
+            while record is not None and record[0].startswith(prefix) and len(keys) < INDEX_SCAN_BATCH:
+                keys.append(record[0])
+                record = step()
+            return keys
+        finally:
+            cursor.close()
+
+    def iter_rows(self, tname: TableName) -> Iterator[tuple[RowId, TableRow]]:
+        """Read all rows of the table, in row id order"""
+        prefix = tname_to_row_prefix(tname)
+        schema = self.table_schemas[tname]
+        cursor = self.rows.cursor(txn=self.txn)
+        try:
+            record = cursor.set_range(prefix)
+            while record is not None and record[0].startswith(prefix):
+                key, value = record
+                yield int.from_bytes(key[len(prefix):], 'big'), decode_row(schema, value)
+                record = cursor.next()
+        finally:
+            cursor.close()
+
+    @_writing
+    def delete_rows(self, tname: TableName):
+        """Delete all rows of the table (in either layout), with its next row id and row count"""
+        for key in (tname_to_data_key(tname).encode(), tname_to_next_row_id_key(tname).encode(),
+                    tname_to_row_count_key(tname).encode()):
+            if self.catalog.get(key, txn=self.txn) is not None:
+                self.catalog.delete(key, txn=self.txn)
+        prefix = tname_to_row_prefix(tname)
+        cursor = self.rows.cursor(txn=self.txn)
+        record = cursor.set_range(prefix)
+        while record is not None and record[0].startswith(prefix):
+            cursor.delete()
+            record = cursor.next()
+        cursor.close()
+
+    @_writing
+    def migrate_table_data(self, tname: TableName):
+        """Move a table stored in the legacy '<table>.data' blob into one record per row.
+
+        Row ids are the positions in the blob, so re-running an interrupted migration rewrites the same records.
+        """
+        data_key = tname_to_data_key(tname).encode()
+        blob = self.catalog.get(data_key, txn=self.txn)
+        if blob is None:
+            return
+        for row_id, row in enumerate(json.loads(blob.decode(), cls=MyDecoder)):
+            self.put_row(tname, row_id, row)
+        self.catalog.delete(data_key, txn=self.txn)
+
+    @_serialized
+    def close(self):
+        """Close the databases. A transaction still open (including statements batched since the last checkpoint) is
+        rolled back."""
+        if self.outer_txn is not None:
+            self.outer_txn.abort()
+            self.outer_txn = None
+            self.in_transaction = False
+        self.indexes.close()
+        self.rows.close()
+        self.catalog.close()
+        self.env.close()
+
+
+class LazyTableData(dict[TableName, TableData]):
+    """table_data whose tables are read from Berkeley DB the first time they are accessed.
+
+    Tables that are never referenced stay unloaded (and, if still in the legacy layout, unmigrated).
+    """
+
+    def __init__(self, my_db: MyDB):
+        super().__init__()
+        self.my_db = my_db
+
+    def __missing__(self, tname: TableName) -> TableData:
+        with self.my_db.mutex:
+            if tname in self:  # Loaded by another thread meanwhile
+                return dict.__getitem__(self, tname)
+            if tname not in self.my_db.table_schemas:
+                raise KeyError(tname)
+            self.my_db.migrate_table_data(tname)
+            table = self[tname] = Table(self.my_db.table_schemas[tname], self.my_db.iter_rows(tname))
+            table.next_row_id = max(table.next_row_id, self.my_db.next_row_id(tname))
+            return table
+
+    def row_count(self, tname: TableName) -> int:
+        """Number of rows of the table, read from the catalog if the table has not been loaded (and has a row
+        count)"""
+        if tname not in self:
+            count = self.my_db.row_count(tname)
+            if count is not None:
+                return count
+        return len(self[tname])
@@ -0,0 +1,399 @@
+"""Micro benchmarks of the storage and query layers.
+
+Usage: python benchmark.py codec|load|txn|scan|parallel|aggregate|order|rows|prepare|startup|script [num_rows]
+"""
+
+import contextlib
+import csv
+import io
+import operator
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+import myColumns
+import myParallel
+from bdbUtils import ROW_CODECS, MyDB, LazyTableData
+from execute import copy_data, create_index, create_table, insert_data, select_data, select_rows
+from myParallel import SharedColumnarTable, shutdown_worker_pool
+from myPlanner import join_rows
+from myRow import row_class, schema_row_class
+from myStatements import StatementParser
+from myTable import Table
+from myTypes import *
+from myUtils import value_to_str
+from transformers import load_sql_parser
+
+
+def sample_table(num_rows: int) -> tuple[TableSchema, list[TableRow]]:
+    schema: TableSchema = {
+        'columns': {
+            'id': {'data_type': 'int', 'char_len': None, 'not_null': True},
+            'name': {'data_type': 'char', 'char_len': 20, 'not_null': False},
+            'born': {'data_type': 'date', 'char_len': None, 'not_null': False},
+            'score': {'data_type': 'int', 'char_len': None, 'not_null': False},
+            'note': {'data_type': 'char', 'char_len': 100, 'not_null': False},
+        },
+        'primary_key': ['id'],
+        'foreign_keys': {}
+    }
+    row_type = schema_row_class(schema)
+    rows: list[TableRow] = [row_type(
+        i,
+        f'name{i}',
+        datetime(1970, 1, 1) + timedelta(days=i % 20000),
+        i * 7 % 1000 if i % 10 else None,
+        'x' * (i % 100) if i % 3 else None,
+    ) for i in range(num_rows)]
+    return schema, rows
+
+
+def bench_codec(num_rows: int):
+    """Encode and decode throughput of every row codec"""
+    schema, rows = sample_table(num_rows)
+    print(f"{'codec':<10}  {'encode rows/s':>15}  {'decode rows/s':>15}  {'bytes/row':>10}")
+    for name, codec in ROW_CODECS.items():
+        encoded = [codec.encode(schema, row) for row in rows]
+        assert [codec.decode(schema, data) for data in encoded] == rows
+        encode_time = min(timeit.repeat(lambda: [codec.encode(schema, row) for row in rows], number=1, repeat=3))
+        decode_time = min(timeit.repeat(lambda: [codec.decode(schema, data) for data in encoded], number=1, repeat=3))
+        bytes_per_row = sum(len(data) for data in encoded) / num_rows
+        print(f'{name:<10}  {num_rows / encode_time:>15,.0f}  {num_rows / decode_time:>15,.0f}  {bytes_per_row:>10.1f}')
+
+
+def insertable_table(num_rows: int) -> tuple[TableElementList, list[TableRow]]:
+    """sample_table as a CREATE TABLE element list and rows that pass the insertion checks"""
+    schema, rows = sample_table(num_rows)
+    # Insertion only accepts strings of at least char_len characters (longer ones are truncated)
+    for row in rows:
+        for name, column in schema['columns'].items():
+            if column['data_type'] == 'char' and row[name] is not None:
+                row[name] = row[name].ljust(column['char_len'], '.')
+    table_element_list: TableElementList = [
+        ('col', name, (column['data_type'], column['char_len']), column['not_null'])
+        for name, column in schema['columns'].items()]
+    table_element_list.append(('cons', ('pkey', schema['primary_key'])))
+    return table_element_list, rows
+
+
+@contextlib.contextmanager
+def temp_database(table_element_list: TableElementList):
+    """MyDB in a temporary directory (also made the working directory), with table 't' created"""
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        table_schemas: dict[TableName, TableSchema] = {}
+        my_db = MyDB('myDB', table_schemas)
+        table_data = LazyTableData(my_db)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), my_db.statement():
+                create_table(my_db, table_schemas, table_data, ('create_table', 't', table_element_list))
+            yield my_db, table_schemas, table_data
+        finally:
+            my_db.close()
+            os.chdir(cwd)
+
+
+def bench_load(num_rows: int):
+    """Loading rows with one INSERT statement per row (parsing included) versus one COPY statement"""
+    table_element_list, rows = insertable_table(num_rows)
+    sql_parser = load_sql_parser(cache_file=None)
+    statements = ['insert into t values (' + ', '.join(
+        f"'{value}'" if isinstance(value, str) else value_to_str(value) for value in row.values()) + ');'
+        for row in rows]
+    for name in ('insert', 'copy'):
+        with temp_database(table_element_list) as (my_db, table_schemas, table_data):
+            with open('rows.csv', 'w', newline='') as file:
+                csv.writer(file).writerows([value_to_str(value) for value in row.values()] for row in rows)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                if name == 'insert':
+                    for statement in statements:
+                        with my_db.statement():
+                            insert_data(my_db, table_schemas, table_data, sql_parser.parse(statement)[0])
+                else:
+                    with my_db.statement():
+                        copy_data(my_db, table_schemas, table_data, ('copy', 't', 'rows.csv'))
+                elapsed = time.perf_counter() - start
+            assert len(table_data['t']) == num_rows
+        print(f'{name:<10}  {num_rows / elapsed:>12,.0f} rows/s')
+
+
+def bench_txn(num_rows: int):
+    """Single-row inserts each committed on its own versus all in one transaction"""
+    table_element_list, rows = insertable_table(num_rows)
+    queries: list[InsertQuery] = [('insert', 't', None, [list(row.values())]) for row in rows]
+    print(f"{'mode':<12}  {'rows/s':>12}  {'log syncs':>10}")
+    for name in ('autocommit', 'transaction'):
+        with temp_database(table_element_list) as (my_db, table_schemas, table_data):
+            syncs = my_db.env.log_stat()['scount']
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                if name == 'transaction':
+                    my_db.begin()
+                for query in queries:
+                    with my_db.statement():
+                        insert_data(my_db, table_schemas, table_data, query)
+                if name == 'transaction':
+                    my_db.commit()
+                elapsed = time.perf_counter() - start
+            syncs = my_db.env.log_stat()['scount'] - syncs
+            assert len(table_data['t']) == num_rows
+        print(f'{name:<12}  {num_rows / elapsed:>12,.0f}  {syncs:>10}')
+
+
+def bench_scan(num_rows: int):
+    """Filtering a table row by row versus on its columnar copy"""
+    schema, rows = sample_table(num_rows)
+    table = Table(schema, enumerate(rows))
+    sql_parser = load_sql_parser(cache_file=None)
+    where_clause = sql_parser.parse(
+        "select * from t where score < 500 and born >= 2000-01-01 and note is not null;")[0][3]
+    min_rows, parallel_min_rows = myColumns.COLUMNAR_MIN_ROWS, myParallel.PARALLEL_SCAN_MIN_ROWS
+    myParallel.PARALLEL_SCAN_MIN_ROWS = None
+    print(f"{'mode':<10}  {'rows/s':>12}  {'matches':>8}")
+    try:
+        for name, columnar_min_rows, update in (('row', None, False), ('columnar', 0, False), ('updated', 0, True)):
+            myColumns.COLUMNAR_MIN_ROWS = columnar_min_rows
+            table.columnar()  # Built once; later changes are made to it in place
+
+            def scan():
+                if update:  # A row is modified before each scan
+                    table.set_value(0, 'score', table[0]['score'])
+                return list(join_rows(None, {'t': table}, {'t': schema}, where_clause))
+            scan_time = min(timeit.repeat(scan, number=1, repeat=3))
+            matches = len(list(join_rows(None, {'t': table}, {'t': schema}, where_clause)))
+            print(f'{name:<10}  {num_rows / scan_time:>12,.0f}  {matches:>8}')
+    finally:
+        myColumns.COLUMNAR_MIN_ROWS = min_rows
+        myParallel.PARALLEL_SCAN_MIN_ROWS = parallel_min_rows
+
+
+def bench_parallel(num_rows: int):
+    """Filtering a table in this process versus by worker processes mapping its shared memory copy, with a conjunct
+    evaluated row by row and two evaluated on the column vectors"""
+    schema, rows = sample_table(num_rows)
+    table = Table(schema, enumerate(rows))
+    sql_parser = load_sql_parser(cache_file=None)
+    where_clause = sql_parser.parse(
+        "select * from t where score < id and born >= 2000-01-01 and note is not null;")[0][3]
+    copy_time = min(timeit.repeat(lambda: SharedColumnarTable(table.columnar()), number=1, repeat=3))
+    print(f'shared memory copy of the columnar table: {copy_time * 1000:.1f} ms')
+    min_rows, num_workers = myParallel.PARALLEL_SCAN_MIN_ROWS, myParallel.PARALLEL_SCAN_WORKERS
+    print(f"{'mode':<10}  {'rows/s':>12}  {'matches':>8}")
+    try:
+        for name, parallel_min_rows, workers in [('serial', None, num_workers)] + [
+                (f'{workers} workers', 0, workers) for workers in sorted({2, 4, os.cpu_count() or 1} - {1})]:
+            myParallel.PARALLEL_SCAN_MIN_ROWS = parallel_min_rows
+            myParallel.PARALLEL_SCAN_WORKERS = workers
+            shutdown_worker_pool()
+            # The first scan starts the workers and copies the table into shared memory
+            matches = len(list(join_rows(None, {'t': table}, {'t': schema}, where_clause)))
+            scan_time = min(timeit.repeat(lambda: list(join_rows(None, {'t': table}, {'t': schema}, where_clause)),
+                                          number=1, repeat=3))
+            print(f'{name:<10}  {num_rows / scan_time:>12,.0f}  {matches:>8}')
+    finally:
+        myParallel.PARALLEL_SCAN_MIN_ROWS, myParallel.PARALLEL_SCAN_WORKERS = min_rows, num_workers
+        shutdown_worker_pool()
+
+
+def bench_prepare(num_rows: int):
+    """Inserting rows with statements parsed one by one versus with a prepared statement bound to each row, and
+    parsing one statement again with and without the parse cache"""
+    table_element_list, rows = insertable_table(num_rows)
+    sql_parser = load_sql_parser(cache_file=None)
+    statement_parser = StatementParser(sql_parser)
+    statements = ['insert into t values (' + ', '.join(
+        f"'{value}'" if isinstance(value, str) else value_to_str(value) for value in row.values()) + ');'
+        for row in rows]
+    prepared = statement_parser.parse('prepare ins as insert into t values (?, ?, ?, ?, ?);')[2]
+    for name in ('parse', 'prepared'):
+        with temp_database(table_element_list) as (my_db, table_schemas, table_data):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                for statement, row in zip(statements, rows):
+                    query = statement_parser.parse(statement) if name == 'parse' else prepared.bind(list(row.values()))
+                    with my_db.statement():
+                        insert_data(my_db, table_schemas, table_data, query)
+                elapsed = time.perf_counter() - start
+            assert len(table_data['t']) == num_rows
+        print(f'{name:<10}  {num_rows / elapsed:>12,.0f} rows/s')
+    statement = 'select id, name from t where score < 500 and born >= 2000-01-01;'
+    for name, parse in (('uncached', sql_parser.parse), ('cached', statement_parser.parse)):
+        parse_time = min(timeit.repeat(lambda: parse(statement), number=1000, repeat=3)) / 1000
+        print(f'{name:<10}  {1 / parse_time:>12,.0f} parses/s')
+
+
+def bench_startup(num_rows: int):
+    """Startup of run.py: building the parser with and without its cache file, then opening the database and loading
+    the catalog (and the rows of a table on its first access) for a table of num_rows rows"""
+    table_element_list, rows = insertable_table(num_rows)
+    grammar_file = os.path.abspath('grammar.lark')
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            table_schemas: dict[TableName, TableSchema] = {}
+            my_db = MyDB('myDB', table_schemas)
+            table_data = LazyTableData(my_db)
+            with open('rows.csv', 'w', newline='') as file:
+                csv.writer(file).writerows([value_to_str(value) for value in row.values()] for row in rows)
+            with contextlib.redirect_stdout(io.StringIO()), my_db.statement():
+                create_table(my_db, table_schemas, table_data, ('create_table', 't', table_element_list))
+                copy_data(my_db, table_schemas, table_data, ('copy', 't', 'rows.csv'))
+            my_db.close()
+
+            print(f"{'step':<16}  {'ms':>8}")
+            for name, cache_file in (('parser', None), ('parser (cold)', 'grammar.lark.cache'),
+                                     ('parser (cached)', 'grammar.lark.cache')):
+                start = time.perf_counter()
+                load_sql_parser(grammar_file, cache_file)
+                print(f'{name:<16}  {(time.perf_counter() - start) * 1000:>8.1f}')
+
+            start = time.perf_counter()
+            my_db = MyDB('myDB', table_schemas)
+            my_db.load_catalog({})
+            print(f"{'catalog':<16}  {(time.perf_counter() - start) * 1000:>8.1f}")
+            start = time.perf_counter()
+            assert len(LazyTableData(my_db)['t']) == num_rows
+            print(f"{'first access':<16}  {(time.perf_counter() - start) * 1000:>8.1f}")
+            my_db.close()
+        finally:
+            os.chdir(cwd)
+
+
+def bench_script(num_rows: int):
+    """run.py reading one INSERT statement per row at the prompt (piped) versus as a script, committing once or at
+    checkpoints"""
+    table_element_list, rows = insertable_table(num_rows)
+    run_file = os.path.abspath('run.py')
+    grammar_file = os.path.abspath('grammar.lark')
+    columns = ', '.join(name + ' ' + data_type + (f'({char_len})' if char_len else '') + (' not null' * not_null)
+                        for _, name, (data_type, char_len), not_null in table_element_list[:-1])
+    script = f"create table t ({columns}, primary key (id));\n" + ''.join('insert into t values (' + ', '.join(
+        f"'{value}'" if isinstance(value, str) else value_to_str(value) for value in row.values()) + ');\n'
+        for row in rows) + 'exit;\n'
+    cwd = os.getcwd()
+    print(f"{'mode':<18}  {'rows/s':>12}")
+    for name, arguments in (('prompt', []), ('script', ['-f', '-']),
+                            ('script, ckpt 100', ['-f', '-', '--checkpoint', '100'])):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            os.chdir(temp_dir)
+            try:
+                shutil.copy(grammar_file, 'grammar.lark')
+                start = time.perf_counter()
+                subprocess.run([sys.executable, run_file, *arguments], input=script, text=True, check=True,
+                               stdout=subprocess.DEVNULL)
+                elapsed = time.perf_counter() - start
+            finally:
+                os.chdir(cwd)
+        print(f'{name:<18}  {num_rows / elapsed:>12,.0f}')
+
+
+def bench_aggregate(num_rows: int):
+    """Grouping a table by printing its rows and counting them versus with GROUP BY, and COUNT(*) without a WHERE
+    clause versus with an always true one (which counts the rows one by one)"""
+    schema, rows = sample_table(num_rows)
+    table_schemas = {'t': schema}
+    table_data = {'t': Table(schema, enumerate(rows))}
+    sql_parser = load_sql_parser(cache_file=None)
+
+    def print_and_count():
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            select_data(None, table_schemas, table_data, {}, sql_parser.parse('select score from t;')[0])
+        counts: dict[str, int] = {}
+        for line in output.getvalue().splitlines()[3:-1]:
+            counts[line] = counts.get(line, 0) + 1
+        return len(counts)
+
+    def group_by():
+        query = sql_parser.parse('select score, count(*) from t group by score;')[0]
+        return len(list(select_rows(None, table_schemas, table_data, {}, query)[2]))
+
+    def count(statement: str):
+        return list(select_rows(None, table_schemas, table_data, {}, sql_parser.parse(statement)[0])[2])[0][0]
+
+    print(f"{'mode':<18}  {'rows/s':>14}  {'result':>8}")
+    for name, run in (('print and count', print_and_count), ('group by', group_by),
+                      ('count(*) where', lambda: count('select count(*) from t where id >= 0;')),
+                      ('count(*)', lambda: count('select count(*) from t;'))):
+        elapsed = min(timeit.repeat(run, number=1, repeat=3))
+        print(f'{name:<18}  {num_rows / elapsed:>14,.0f}  {run():>8}')
+
+
+def bench_order(num_rows: int):
+    """Time and peak memory of a sort of the whole table, a top 10 (heap), a LIMIT 10 alone (stops the scan) and, once
+    the column is indexed, a top 10 read in index order"""
+    table_element_list, rows = insertable_table(num_rows)
+    sql_parser = load_sql_parser(cache_file=None)
+    with temp_database(table_element_list) as (my_db, table_schemas, table_data):
+        with open('rows.csv', 'w', newline='') as file:
+            csv.writer(file).writerows([value_to_str(value) for value in row.values()] for row in rows)
+        with contextlib.redirect_stdout(io.StringIO()), my_db.statement():
+            copy_data(my_db, table_schemas, table_data, ('copy', 't', 'rows.csv'))
+        print(f"{'mode':<14}  {'ms':>8}  {'peak KiB':>9}")
+        for name, statement in (('sort', 'select id from t order by score desc;'),
+                                ('top 10', 'select id from t order by score desc limit 10;'),
+                                ('limit 10', 'select id from t limit 10;'),
+                                ('index top 10', 'select id from t order by score desc limit 10;')):
+            if name == 'index top 10':
+                with contextlib.redirect_stdout(io.StringIO()), my_db.statement():
+                    create_index(my_db, table_schemas, table_data, ('create_index', 't_score', 't', 'score'))
+            query = sql_parser.parse(statement)[0]
+            elapsed = min(timeit.repeat(lambda: list(select_rows(my_db, table_schemas, table_data, {}, query)[2]),
+                                        number=1, repeat=3))
+            tracemalloc.start()
+            list(select_rows(my_db, table_schemas, table_data, {}, query)[2])
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f'{name:<14}  {elapsed * 1000:>8.1f}  {peak / 1024:>9.0f}')
+
+
+def bench_rows(num_rows: int):
+    """Memory per row and time to read every value of a row, for rows as dicts versus as Row records"""
+    print(f"{'columns':>7}  {'dict bytes':>10}  {'Row bytes':>10}  {'dict reads/s':>14}  {'Row reads/s':>14}")
+    for num_columns in (3, 10, 30):
+        columns = tuple(f'c{i}' for i in range(num_columns))
+        row_type = row_class(columns)
+        results = []
+        for make_row in (lambda i: dict.fromkeys(columns, i), lambda i: row_type(*[i] * num_columns)):
+            tracemalloc.start()
+            rows = [make_row(i) for i in range(num_rows)]
+            bytes_per_row = tracemalloc.get_traced_memory()[0] / num_rows
+            tracemalloc.stop()
+            if isinstance(rows[0], dict):
+                getters = [operator.itemgetter(column) for column in columns]
+            else:
+                getters = [row_type.getter(column) for column in columns]
+            read_time = min(timeit.repeat(lambda: [get(row) for row in rows for get in getters], number=1, repeat=3))
+            results += [bytes_per_row, num_rows * num_columns / read_time]
+            del rows
+        print(f'{num_columns:>7}  {results[0]:>10.0f}  {results[2]:>10.0f}  {results[1]:>14,.0f}  {results[3]:>14,.0f}')
+
+
+BENCHMARKS = {
+    'codec': bench_codec,
+    'load': bench_load,
+    'txn': bench_txn,
+    'scan': bench_scan,
+    'parallel': bench_parallel,
+    'aggregate': bench_aggregate,
+    'order': bench_order,
+    'rows': bench_rows,
+    'prepare': bench_prepare,
+    'startup': bench_startup,
+    'script': bench_script,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
@@ -0,0 +1,96 @@
+"""Client of the database server (see server.py).
+
+Usage: python client.py [--host HOST] [--port PORT]     interactive prompt, printing results as run.py does
+"""
+
+import argparse
+import asyncio
+import json
+
+from myStatements import split_statements
+from myTypes import *
+from myUtils import PROMPT, print_result_table, value_to_str
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5455
+
+
+class StatementResult:
+    """The answer of the server to a statement: the result set of a SELECT (columns is None otherwise) and the
+    messages"""
+
+    def __init__(self):
+        self.columns: list[ColumnName] | None = None
+        self.rows: list[list[Value]] = []  # Dates are 'YYYY-MM-DD' strings
+        self.messages: list[str] = []
+
+
+class Client:
+    """A connection to the server, running one statement at a time"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> 'Client':
+        reader, writer = await asyncio.open_connection(host, port, limit=2 ** 24)
+        return cls(reader, writer)
+
+    async def execute(self, statement: str) -> StatementResult:
+        """Run one statement (ending with ';') and read its result. Raises ConnectionError if the server closed the
+        connection instead (as it does for EXIT)."""
+        self.writer.write(statement.encode() + b'\n')
+        await self.writer.drain()
+        result = StatementResult()
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError('The server closed the connection')
+            answer = json.loads(line)
+            if 'end' in answer:
+                return result
+            elif 'columns' in answer:
+                result.columns = answer['columns']
+            elif 'rows' in answer:
+                result.rows += answer['rows']
+            elif 'message' in answer:
+                result.messages.append(answer['message'])
+
+    async def close(self):
+        if not self.writer.is_closing():
+            self.writer.write(b'exit;\n')
+            self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def run_prompt(host: str, port: int):
+    client = await Client.connect(host, port)
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # Get input until query ends with semicolon
+            buf = (await loop.run_in_executor(None, input, PROMPT)).rstrip()
+            while not buf.endswith(';'):
+                buf += ' ' + (await loop.run_in_executor(None, input)).rstrip()
+            for statement in split_statements([buf]):
+                result = await client.execute(statement)
+                if result.columns is not None:
+                    rows = [[value_to_str(value) for value in row] for row in result.rows]
+                    # The whole result set is here, so the widths are those of its longest values
+                    widths = [max((len(row[i]) for row in rows), default=0) for i in range(len(result.columns))]
+                    print_result_table(result.columns, iter(rows), widths)
+                for message in result.messages:
+                    print(PROMPT + message)
+    except ConnectionError:
+        pass  # EXIT
+    finally:
+        await client.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Client of the database server.')
+    arg_parser.add_argument('--host', default=DEFAULT_HOST)
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = arg_parser.parse_args()
+    asyncio.run(run_prompt(args.host, args.port))
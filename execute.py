@@ -1,16 +1,27 @@
-import copy
+import csv
+import itertools
 import json
+import math
 
 from lark.exceptions import VisitError
 
 from bdbUtils import *
+from myAggregates import count_row, hash_aggregate
+from myLocks import CATALOG_STATEMENTS, statement_tables
 from myMsgs import *
+from myOrder import order_rows
+from myPlanner import candidate_rows, index_ordered_rows, join_key_value, join_rows
+from myStatements import PreparedStatement
+from myTable import Table
 from myUtils import *
-from transformers import WhereClauseTransformer
+from transformers import WhereClauseCompiler, compile_where
+
+COPY_BATCH_ROWS = 10000  # Rows of a CSV file checked and written together by COPY
+INT_WIDTH = len(str(-2 ** 63))  # Width of the widest 8-byte int, as the binary row codec stores ints
 
 
 def create_table(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-                 query: CreateTableQuery):
+                 query: CreateTableQuery) -> bool:
     try:
         table_name, table_element_list = query[1:]
         if table_name in table_schemas:
@@ -41,7 +52,8 @@ def create_table(my_db, table_schemas: dict[TableName, TableSchema], table_data:
         schema: TableSchema = {
             'columns': {},
             'primary_key': [],
-            'foreign_keys': {}
+            'foreign_keys': {},
+            'indexes': {}
         }
         for column_definition in column_definitions:
             column_name, data_type, not_null = column_definition[1:]
@@ -102,21 +114,22 @@ def create_table(my_db, table_schemas: dict[TableName, TableSchema], table_data:
 
         # Create table
         table_schemas[table_name] = schema
-        table_data[table_name] = []
+        table_data[table_name] = Table(schema)
 
         # Use berkleyDB to store data
         my_db.put(tname_to_schema_key(table_name).encode(), json.dumps(
             schema, cls=MyEncoder).encode())
-        my_db.put(tname_to_data_key(table_name).encode(), json.dumps(
-            [], cls=MyEncoder).encode())
+        my_db.put(tname_to_row_count_key(table_name).encode(), b'0')
 
         print_after_prompt(CreateTableSuccess(table_name))
+        return True
     except Exception as e:
         print_after_prompt(e)
+        return False
 
 
 def drop_table(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-               table_name: TableName):
+               table_stats: dict[TableName, TableStats], table_name: TableName) -> bool:
     try:
         if table_name not in table_schemas:
             raise NoSuchTable(table_name)
@@ -127,15 +140,19 @@ def drop_table(my_db, table_schemas: dict[TableName, TableSchema], table_data: d
                 if foreign_key[0] == table_name:
                     raise DropReferencedTableError(table_name)
 
+        for index_name in table_schemas[table_name].get('indexes', {}):
+            my_db.drop_index(index_name)
         del table_schemas[table_name]
-        del table_data[table_name]
-        schema_file_name = table_name + '.schema'
-        data_file_name = table_name + '.data'
-        my_db.delete(schema_file_name.encode())
-        my_db.delete(data_file_name.encode())
+        table_data.pop(table_name, None)  # The table may not have been loaded
+        my_db.delete(tname_to_schema_key(table_name).encode())
+        my_db.delete_rows(table_name)
+        if table_stats.pop(table_name, None) is not None:
+            my_db.delete(tname_to_stats_key(table_name).encode())
         print_after_prompt(DropSuccess(table_name))
+        return True
     except Exception as e:
         print_after_prompt(e)
+        return False
 
 
 def desc_table(table_schemas: dict[TableName, TableSchema], table_name: TableName):
@@ -177,82 +194,266 @@ def show_tables(table_schemas: dict[TableName, TableSchema]):
     print('----------------')
 
 
+def create_index(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                 query: CreateIndexQuery) -> bool:
+    """Create a B-tree index on a column of the table"""
+    try:
+        index_name, table_name, column_name = query[1:]
+        if table_name not in table_schemas:
+            raise NoSuchTable(table_name)
+        if any(index_name in schema.get('indexes', {}) for schema in table_schemas.values()):
+            raise IndexExistenceError(index_name)
+        if column_name not in table_schemas[table_name]['columns']:
+            raise CreateIndexColumnExistenceError(column_name)
+
+        for row_id, row in table_data[table_name].items():
+            my_db.put_index_entry(index_name, row[column_name], row_id)
+        schema = table_schemas[table_name]
+        schema.setdefault('indexes', {})[index_name] = column_name
+        my_db.put(tname_to_schema_key(table_name).encode(), json.dumps(
+            schema, cls=MyEncoder).encode())
+
+        print_after_prompt(CreateIndexSuccess(index_name))
+        return True
+    except Exception as e:
+        print_after_prompt(e)
+        return False
+
+
+def drop_index(my_db, table_schemas: dict[TableName, TableSchema], query: DropIndexQuery) -> bool:
+    try:
+        index_name: IndexName = query[1]
+        for table_name, schema in table_schemas.items():
+            if index_name in schema.get('indexes', {}):
+                break
+        else:
+            raise NoSuchIndex(index_name)
+
+        del schema['indexes'][index_name]
+        my_db.drop_index(index_name)
+        my_db.put(tname_to_schema_key(table_name).encode(), json.dumps(
+            schema, cls=MyEncoder).encode())
+
+        print_after_prompt(DropIndexSuccess(index_name))
+        return True
+    except Exception as e:
+        print_after_prompt(e)
+        return False
+
+
+def begin_transaction(my_db):
+    try:
+        my_db.begin()
+        print_after_prompt(TransactionResult('begun'))
+    except Exception as e:
+        print_after_prompt(e)
+
+
+def commit_transaction(my_db):
+    """Commit the transaction; its writes are flushed to the log together"""
+    try:
+        my_db.commit()
+        print_after_prompt(TransactionResult('committed'))
+    except Exception as e:
+        print_after_prompt(e)
+
+
+def rollback_transaction(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                         table_stats: dict[TableName, TableStats]):
+    """Roll back the transaction and discard the in-memory state it may have changed"""
+    try:
+        my_db.rollback()
+        # Schemas and statistics are reloaded and tables are read again on their next access
+        my_db.load_catalog(table_stats)
+        table_data.clear()
+        print_after_prompt(TransactionResult('rolled back'))
+    except Exception as e:
+        print_after_prompt(e)
+
+
+def prepare_statement(prepared_statements: dict[StatementName, PreparedStatement], query: PrepareQuery):
+    """Keep the parsed statement under its name (replacing a statement of the same name)"""
+    statement_name, statement = query[1:]
+    prepared_statements[statement_name] = statement
+    print_after_prompt(PrepareResult(statement_name))
+
+
+def deallocate_statement(prepared_statements: dict[StatementName, PreparedStatement], query: DeallocateQuery):
+    try:
+        statement_name: StatementName = query[1]
+        if statement_name not in prepared_statements:
+            raise NoSuchPreparedStatement(statement_name)
+        del prepared_statements[statement_name]
+        print_after_prompt(DeallocateResult(statement_name))
+    except Exception as e:
+        print_after_prompt(e)
+
+
+def bind_statement(prepared_statements: dict[StatementName, PreparedStatement], query: ExecuteQuery) -> Query | None:
+    """The prepared statement with the values of EXECUTE in place of its placeholders, or None if it can't be bound"""
+    try:
+        statement_name, values = query[1:]
+        if statement_name not in prepared_statements:
+            raise NoSuchPreparedStatement(statement_name)
+        return prepared_statements[statement_name].bind(values)
+    except Exception as e:
+        print_after_prompt(e)
+        return None
+
+
+def analyze_table(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                  table_stats: dict[TableName, TableStats], query: AnalyzeQuery) -> bool:
+    """Collect statistics of the table (of all tables if not specified) for the planner"""
+    try:
+        table_name: TableName | None = query[1]
+        if table_name is not None and table_name not in table_schemas:
+            raise NoSuchTable(table_name)
+
+        for t in [table_name] if table_name is not None else list(table_schemas):
+            rows = table_data[t].values()
+            # Values of each column, as the where clause compares them (strings case-insensitively)
+            columns = list(zip(*[row.values() for row in rows])) or [()] * len(table_schemas[t]['columns'])
+            stats: TableStats = {
+                'row_count': len(rows),
+                'distinct_counts': {c: len({join_key_value(value) for value in values} - {None})
+                                    for c, values in zip(table_schemas[t]['columns'], columns)}
+            }
+            table_stats[t] = stats
+            my_db.put(tname_to_stats_key(t).encode(), json.dumps(
+                stats, cls=MyEncoder).encode())
+            print_after_prompt(AnalyzeResult(t))
+        return True
+    except Exception as e:
+        print_after_prompt(e)
+        return False
+
+
+def check_rows(table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+               table_name: TableName, column_name_list: ColumnNameList | None,
+               value_lists: list[ValueList]) -> list[TableRow]:
+    """Build the rows to be inserted from the value lists, checking the whole batch against the schema and the rows
+    of the table"""
+    schema = table_schemas[table_name]
+    if column_name_list is None:
+        column_name_list = list(schema['columns'].keys())
+
+    num_cols = len(schema['columns'])
+    if len(column_name_list) != num_cols or any(len(value_list) != num_cols for value_list in value_lists):
+        raise InsertTypeMismatchError()
+
+    row_dicts: list[dict[ColumnName, Value]] = [dict(zip(column_name_list, value_list)) for value_list in value_lists]
+
+    # Check the values column by column
+    for column_name in column_name_list:
+        if column_name not in schema['columns']:
+            raise InsertColumnExistenceError(column_name)
+        column = schema['columns'][column_name]
+
+        # Check if not_null constraint is met
+        if column['not_null'] and any(row[column_name] is None for row in row_dicts):
+            raise InsertionColumnNonNullableError(column_name)
+
+        # Check if types match
+        if not all(type_check(column['data_type'], column['char_len'], row[column_name]) for row in row_dicts):
+            raise InsertTypeMismatchError()
+
+        # If string is longer than char_len, truncate it
+        if column['data_type'] == 'char':
+            char_len = column['char_len']
+            for row in row_dicts:
+                if row[column_name] is not None and len(row[column_name]) > char_len:
+                    row[column_name] = row[column_name][:char_len]
+
+    table: Table = table_data[table_name]
+    rows: list[TableRow] = [table.row_class.from_mapping(row) for row in row_dicts]
+
+    # Check for foreign key constraint, once per distinct value
+    for column_name, (ref_table, ref_col) in schema['foreign_keys'].items():
+        values = {row[column_name] for row in rows}
+        values.discard(None)
+        if not all(table_data[ref_table].has_value(ref_col, value) for value in values):
+            raise InsertReferentialIntegrityError()
+
+    # Check if primary keys are unique, within the batch and against the table
+    if table.pkey_cols:
+        pkeys = [table.pkey_of(row) for row in rows]
+        batch_pkeys = set(pkeys)
+        if len(batch_pkeys) < len(pkeys) or any(table.find_pkey(pkey) is not None for pkey in batch_pkeys):
+            raise InsertDuplicatePrimaryKeyError()
+
+    return rows
+
+
+def insert_rows(my_db, table_data: dict[TableName, TableData], table_name: TableName, rows: list[TableRow]):
+    """Add checked rows to the table and write them to Berkeley DB as one batch"""
+    table: Table = table_data[table_name]
+    batch = list(enumerate(rows, table.next_row_id))
+    for row_id, row in batch:
+        table.add_row(row_id, row)
+    my_db.put_rows(table_name, batch)
+
+
 def insert_data(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-                query: InsertQuery):
-    """Insert data(tuple) into the table"""
+                query: InsertQuery) -> bool:
+    """Insert data(tuples) into the table. Either all rows are inserted or none of them."""
     try:
         table_name: TableName = query[1]
         column_name_list: ColumnNameList | None = query[2]
-        value_list: ValueList = query[3]
+        value_lists: list[ValueList] = query[3]
 
         if table_name not in table_schemas:
             raise NoSuchTable(table_name)
 
-        if column_name_list is None:
-            column_name_list = list(
-                table_schemas[table_name]['columns'].keys())
+        rows = check_rows(table_schemas, table_data, table_name, column_name_list, value_lists)
+
+        # All checks passed, insert rows and save
+        insert_rows(my_db, table_data, table_name, rows)
+
+        print_after_prompt(InsertResult(len(rows)))
+        return True
+    except Exception as e:
+        print_after_prompt(e)
+        return False
 
-        num_cols = len(table_schemas[table_name]['columns'])
-        if len(column_name_list) != num_cols or len(value_list) != num_cols:
-            raise InsertTypeMismatchError()
 
-        row: dict[ColumnName, Value] = {}
-
-        for i in range(len(column_name_list)):
-            column_name = column_name_list[i]
-            value = value_list[i]
-
-            # Check column existence
-            if column_name not in table_schemas[table_name]['columns']:
-                raise InsertColumnExistenceError(column_name)
-
-            # Check if not_null constraint is met
-            if table_schemas[table_name]['columns'][column_name]['not_null'] and value is None:
-                raise InsertionColumnNonNullableError(column_name)
-
-            # Check if types match
-            column_type = table_schemas[table_name]['columns'][column_name]['data_type']
-            char_len = table_schemas[table_name]['columns'][column_name]['char_len']
-            if not type_check(column_type, char_len, value):
-                raise InsertTypeMismatchError()
-
-            # If string is longer than char_len, truncate it
-            if column_type == 'char' and value is not None:
-                if len(value) > char_len:
-                    value = value[:char_len]
-
-            # Check for foreign key constraint
-            if value is not None and column_name in table_schemas[table_name]['foreign_keys']:
-                (ref_table,
-                 ref_col) = table_schemas[table_name]['foreign_keys'][column_name]
-                available_values = set([row[ref_col]
-                                        for row in table_data[ref_table]])
-                if value not in available_values:
-                    raise InsertReferentialIntegrityError()
-
-            row[column_name] = value
-
-        # Check if primary key is unique
-        if len(table_schemas[table_name]['primary_key']) > 0:
-            pkey = select_pkey_cols(table_schemas[table_name], row)
-            existing_pkeys = [select_pkey_cols(table_schemas[table_name], row)
-                              for row in table_data[table_name]]
-            if pkey in existing_pkeys:
-                raise InsertDuplicatePrimaryKeyError()
-
-        # All checks passed, insert row and save
-        table_data[table_name].append(row)
-        my_db.put(tname_to_data_key(table_name).encode(),
-                  json.dumps(table_data[table_name], cls=MyEncoder).encode())
-
-        print_after_prompt(InsertResult())
+def copy_data(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+              query: CopyQuery) -> bool:
+    """Load the rows of a CSV file into the table. Either all rows are loaded or none of them.
 
+    Fields are in the order of the table's columns. The file is read COPY_BATCH_ROWS rows at a time, and each batch is
+    checked and inserted before the next one is read, so that only one batch of the file is held in memory. If a batch
+    fails, the statement is rolled back with the batches inserted before it (see run_query).
+    """
+    try:
+        table_name, file_name = query[1:]
+        if table_name not in table_schemas:
+            raise NoSuchTable(table_name)
+        data_types = [column['data_type'] for column in table_schemas[table_name]['columns'].values()]
+
+        try:
+            file = open(file_name, newline='')
+        except OSError:
+            raise CopyFileError(file_name)
+        num_rows = 0
+        with file:
+            records = csv.reader(file)
+            while batch := list(itertools.islice(records, COPY_BATCH_ROWS)):
+                value_lists = [[parse_csv_value(data_type, field) for data_type, field in zip(data_types, record)]
+                               if len(record) == len(data_types) else record for record in batch]
+                # The rows of the earlier batches are in the table, so its primary-key index checks against them
+                rows = check_rows(table_schemas, table_data, table_name, None, value_lists)
+                insert_rows(my_db, table_data, table_name, rows)
+                num_rows += len(rows)
+
+        print_after_prompt(CopyResult(num_rows, file_name))
+        return True
     except Exception as e:
         print_after_prompt(e)
+        return False
 
 
 def delete_data(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-                query: DeleteQuery):
+                query: DeleteQuery) -> bool:
     """Delete data from the table"""
     try:
         table_name: TableName = query[1]
@@ -263,7 +464,8 @@ def delete_data(my_db, table_schemas: dict[TableName, TableSchema], table_data:
 
         delete_count = 0
         cant_delete: int = 0  # number of rows that can't be deleted due to referential constraints
-        modified_tables: set[TableName] = set()  # tables that have been modified
+        # rows of other tables that have been modified, with the previous values of the modified columns
+        modified_rows: dict[tuple[TableName, RowId], dict[ColumnName, Value]] = {}
 
         referenced_by: dict[ColumnName, list[tuple[TableName, ColumnName]]] = {}
         for table in table_schemas:
@@ -274,176 +476,247 @@ def delete_data(my_db, table_schemas: dict[TableName, TableSchema], table_data:
                         referenced_by[ref_col] = []
                     referenced_by[ref_col].append((table, column))
 
-        new_data: list[TableRow] = []  # new data after deletion
+        deleted_rows: list[RowId] = []
+        where = None
+        if where_clause is not None:
+            where = compile_where(where_clause, {table_name: list(table_schemas[table_name]['columns'])})
 
         # Deletion rule : ON DELETE SET NULL
-        for row in table_data[table_name]:
-            if where_clause is not None:
-                if not WhereClauseTransformer({table_name: row}).transform(
-                        where_clause):  # Where clause is not met, so add to new_data
-                    new_data.append(row)
+        for row_id, row in candidate_rows(my_db, table_name, table_schemas[table_name], table_data[table_name],
+                                          where_clause):
+            if where is not None:
+                if not where({table_name: row}):  # Where clause is not met, so keep the row
                     continue
 
-            is_referenced: bool = False  # whether the current row is referenced by any row in other tables
+            # rows in other tables referencing the current row, found through their foreign key indexes
+            references: list[tuple[TableName, ColumnName, list[RowId]]] = []
             for column in referenced_by:
                 for (ref_table, ref_col) in referenced_by[column]:
-                    for ref_row in table_data[ref_table]:
-                        if ref_row[ref_col] == row[column]:
-                            is_referenced = True
-                            if table_schemas[ref_table]['columns'][ref_col]['not_null']:
-                                cant_delete += 1
-                                new_data.append(row)
-                                continue
-
-            if is_referenced:
-                # The row is referenced by other rows, but they are all nullable.
-                # Therefore, set them to NULL, then we can delete the row.
-                for column in referenced_by:
-                    for (ref_table, ref_col) in referenced_by[column]:
-                        for ref_row in table_data[ref_table]:
-                            if ref_row[ref_col] == row[column]:
-                                ref_row[ref_col] = None
-                                modified_tables.add(ref_table)
+                    ref_row_ids = table_data[ref_table].find_referencing(ref_col, row[column])
+                    if ref_row_ids:
+                        references.append((ref_table, ref_col, ref_row_ids))
+
+            if any(table_schemas[ref_table]['columns'][ref_col]['not_null']
+                   for (ref_table, ref_col, _) in references):
+                cant_delete += 1
+                continue
+
+            # The row may be referenced by other rows, but they are all nullable.
+            # Therefore, set them to NULL, then we can delete the row.
+            for (ref_table, ref_col, ref_row_ids) in references:
+                for ref_row_id in ref_row_ids:
+                    old_values = modified_rows.setdefault((ref_table, ref_row_id), {})
+                    old_values.setdefault(ref_col, table_data[ref_table][ref_row_id][ref_col])
+                    table_data[ref_table].set_value(ref_row_id, ref_col, None)
 
             delete_count += 1
-
-        table_data[table_name] = new_data
-        modified_tables.add(table_name)
-
-        # Save modified tables
-        for table in modified_tables:
-            my_db.put(tname_to_data_key(table).encode(),
-                      json.dumps(table_data[table], cls=MyEncoder).encode())
+            deleted_rows.append(row_id)
+
+        # Save modified rows only
+        removed_rows: list[tuple[RowId, TableRow]] = []
+        for row_id in deleted_rows:
+            row = table_data[table_name].remove_row(row_id)
+            # If the row referenced its own table and has been set to NULL above, its stored values are the old ones
+            removed_rows.append((row_id, {**row, **modified_rows.pop((table_name, row_id), {})}))
+        my_db.delete_row_batch(table_name, removed_rows)
+        for (table, row_id), old_values in modified_rows.items():
+            my_db.put_row(table, row_id, table_data[table][row_id], old_values)
 
         print_after_prompt(DeleteResult(delete_count))
         if cant_delete > 0:
             print_after_prompt(DeleteReferentialIntegrityPassed(cant_delete))
+        return True
     except VisitError as e:
         print_after_prompt(e.orig_exc)
+        return False
     except Exception as e:
         print_after_prompt(e)
-
-
-def select_data(table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-                query: SelectQuery):
+        return False
+
+
+def resolve_select_column(table_columns: dict[TableName, list[ColumnName]], table_name: TableName | None,
+                          column_name: ColumnName) -> TableName:
+    """The table (or alias) of a column the select list or the GROUP BY clause references"""
+    if table_name is None:
+        # If table name is not specified, check column name and infer table name
+        for t in table_columns:
+            if column_name in table_columns[t]:
+                if table_name is not None:
+                    # Column name is ambiguous
+                    raise SelectColumnResolveError(column_name)
+                table_name = t
+        if table_name is None:
+            raise SelectColumnResolveError(column_name)
+    elif table_name not in table_columns or column_name not in table_columns[table_name]:
+        raise SelectColumnResolveError(f'{table_name}.{column_name}')
+    return table_name
+
+
+def width_bound(column: ColumnMeta) -> int:
+    """Values of the column are never wider than this once converted to strings"""
+    if column['data_type'] == 'char':
+        assert (column['char_len'] is not None)
+        return max(column['char_len'], len('NULL'))
+    elif column['data_type'] == 'date':
+        return len('YYYY-MM-DD')
+    return INT_WIDTH
+
+
+def table_row_count(table_data: dict[TableName, TableData], table_name: TableName) -> int:
+    """Number of rows of the table, without loading it if its row count is kept (see LazyTableData.row_count)"""
+    if isinstance(table_data, LazyTableData):
+        return table_data.row_count(table_name)
+    return len(table_data[table_name])
+
+
+def select_rows(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                table_stats: dict[TableName, TableStats],
+                query: SelectQuery) -> tuple[list[ColumnName], list[int], Iterator[list[Value]]]:
+    """The column names of the result, the bound of the width of each column once its values are converted to strings,
+    and the rows of the result, produced as they are found. Errors are raised, either here or while the rows are
+    produced.
+
+    With aggregate columns or a GROUP BY clause, the rows are those of the groups (see hash_aggregate), produced once
+    every row has been aggregated. COUNT(*) alone without WHERE and GROUP BY is the product of the row counts.
+
+    An ORDER BY key is a column of the result, named as in the result if that name is unique, or else any column of
+    the tables (a grouped one with GROUP BY). The rows are sorted or, with a LIMIT, the first ones kept in a heap (see
+    order_rows). A single table ordered by one indexed column is read in the order of the index instead.
+    """
+    c_a_list: list[C_A | AggregateColumn] = list(query[1])  # The query may be cached, so it is left as it is
+    t_a_list: list[T_A] = query[2]
+    where_clause: WhereClause | None = query[3]
+    group_by: list[ColumnReference] | None = query[4]
+    order_by: list[SortKey] = query[5] or []
+    limit: int | None = query[6]
+    offset: int = query[7]
+    if (limit is not None and limit < 0) or offset < 0:
+        raise SelectLimitError()
+
+    table_names: dict[TableName, TableName] = {}  # Table of each name (alias or table name) in the FROM clause
+    table_columns: dict[TableName, list[ColumnName]] = {}
+    alias_schemas: dict[TableName, TableSchema] = {}
+    alias_stats: dict[TableName, TableStats] = {}
+    for (t, a) in t_a_list:
+        if t not in table_schemas:
+            raise SelectTableExistenceError(t)
+        name_to_use = a if a is not None else t
+        if name_to_use in table_names:
+            raise NotUniqueTableAlias(name_to_use)
+        table_names[name_to_use] = t
+        table_columns[name_to_use] = list(table_schemas[t]['columns'].keys())
+        alias_schemas[name_to_use] = table_schemas[t]
+        if t in table_stats:
+            alias_stats[name_to_use] = table_stats[t]
+
+    # Empty c_a_list means "select *". In this case, first supply c_a_list with all columns
+    if len(c_a_list) == 0:
+        for t in table_columns:
+            for c in table_columns[t]:
+                c_a_list.append((t, c, None))
+
+    # Resolve the table of each column, and replace (t, c, None) with (t, c, c) (and name aggregates as written)
+    for i, item in enumerate(c_a_list):
+        if len(item) == 3:
+            (t, c, a) = item
+            c_a_list[i] = (resolve_select_column(table_columns, t, c), c, c if a is None else a)
+            continue
+        (function, t, c, a) = item
+        if c is None:  # COUNT(*)
+            if function != 'count':
+                raise SelectAggregateError(function, '*')
+            c_a_list[i] = (function, None, None, f'{function}(*)' if a is None else a)
+            continue
+        written = c if t is None else f'{t}.{c}'
+        t = resolve_select_column(table_columns, t, c)
+        if function in ('sum', 'avg') and alias_schemas[t]['columns'][c]['data_type'] != 'int':
+            raise SelectAggregateError(function, written)
+        c_a_list[i] = (function, t, c, f'{function}({written})' if a is None else a)
+
+    # Values of a column are never wider than this once converted to strings (counts and sums are ints, averages have
+    # 4 decimals)
+    width_bounds: list[int] = []
+    for item in c_a_list:
+        if len(item) == 3:
+            width_bounds.append(width_bound(alias_schemas[item[0]]['columns'][item[1]]))
+        elif item[0] in ('min', 'max'):
+            width_bounds.append(width_bound(alias_schemas[item[1]]['columns'][item[2]]))
+        elif item[0] == 'avg':
+            width_bounds.append(INT_WIDTH + len('.0000'))
+        else:
+            width_bounds.append(INT_WIDTH)
+    headers = [item[-1] for item in c_a_list]
+
+    # Each ORDER BY key is either the position of a column of the result or a column of the tables
+    sort_columns: list[int | tuple[TableName, ColumnName]] = [
+        headers.index(c) if t is None and headers.count(c) == 1 else (resolve_select_column(table_columns, t, c), c)
+        for ((t, c), _) in order_by]
+    descending = [desc for (_, desc) in order_by]
+    compiler = WhereClauseCompiler(table_columns)
+
+    if where_clause is None and not group_by and all(len(item) == 4 and item[2] is None for item in c_a_list) \
+            and all(isinstance(key, int) for key in sort_columns):
+        # The row counts of the tables are kept, so there is no need to read the tables or enumerate the combinations
+        count = math.prod(table_row_count(table_data, t) for t in table_names.values())
+        return headers, width_bounds, order_rows(iter([[count] * len(c_a_list)]), [], [], limit, offset)
+
+    # The tables are loaded here, on their first use
+    table_dict: dict[TableName, Table] = {name: table_data[t] for name, t in table_names.items()}
+    if group_by is None and all(len(item) == 3 for item in c_a_list):
+        sort_keys = [c_a_list[key][:2] if isinstance(key, int) else key for key in sort_columns]
+        index_name = None
+        if len(table_dict) == 1 and len(sort_keys) == 1:
+            (t, c), = sort_keys
+            index_name = next((i for i, column in alias_schemas[t].get('indexes', {}).items() if column == c), None)
+        if index_name is not None:
+            combinations = order_rows(index_ordered_rows(my_db, t, table_dict[t], alias_schemas[t], where_clause,
+                                                         index_name, descending[0]), [], [], limit, offset)
+        else:
+            combinations = order_rows(join_rows(my_db, table_dict, alias_schemas, where_clause, alias_stats),
+                                      [compiler.column_getter(t, c) for (t, c) in sort_keys], descending, limit,
+                                      offset)
+        getters = [(t, table_dict[t].row_class.getter(c)) for (t, c, a) in c_a_list]
+        rows = ([get_value(curr_rows[t]) for (t, get_value) in getters] for curr_rows in combinations)
+        return headers, width_bounds, rows
+
+    group_columns = [(resolve_select_column(table_columns, t, c), c) for (t, c) in group_by or []]
+    for item in c_a_list:
+        if len(item) == 3 and (item[0], item[1]) not in group_columns:
+            raise SelectGroupByError(item[1])
+    aggregates = [item for item in c_a_list if len(item) == 4]
+    # Position of each column of the result in the grouping values, or in the aggregate results
+    positions = [(False, group_columns.index((item[0], item[1]))) if len(item) == 3 else (True, aggregates.index(item))
+                 for item in c_a_list]
+    for key in sort_columns:
+        if not isinstance(key, int) and key not in group_columns:
+            raise SelectGroupByError(key[1])
+    sort_getters = [group_getter(*positions[key]) if isinstance(key, int)
+                    else group_getter(False, group_columns.index(key)) for key in sort_columns]
+
+    groups = hash_aggregate(
+        join_rows(my_db, table_dict, alias_schemas, where_clause, alias_stats),
+        [compiler.column_getter(t, c) for (t, c) in group_columns],
+        [(function, compiler.column_getter(t, c) if c is not None else count_row)
+         for (function, t, c, a) in aggregates])
+    rows = ([results[i] if is_aggregate else values[i] for (is_aggregate, i) in positions]
+            for values, results in order_rows(groups, sort_getters, descending, limit, offset))
+    return headers, width_bounds, rows
+
+
+def group_getter(is_aggregate: bool, i: int) -> Callable[[tuple[list[Value], list[Value | float]]], Value | float]:
+    """Getter of an aggregate result or a grouping value of the groups of hash_aggregate"""
+    if is_aggregate:
+        return lambda group: group[1][i]
+    return lambda group: group[0][i]
+
+
+def select_data(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                table_stats: dict[TableName, TableStats], query: SelectQuery):
     """Select data from the table"""
     try:
-        c_a_list: list[C_A] = query[1]
-        t_a_list: list[T_A] = query[2]
-        where_clause: WhereClause | None = query[3]
-
-        table_dict: dict[TableName, TableData] = {}
-        table_columns: dict[TableName, list[ColumnName]] = {}
-        for (t, a) in t_a_list:
-            if t not in table_schemas:
-                raise SelectTableExistenceError(t)
-            name_to_use = a if a is not None else t
-            if name_to_use in table_dict:
-                raise NotUniqueTableAlias(name_to_use)
-            table_dict[name_to_use] = table_data[t]
-            table_columns[name_to_use] = list(table_schemas[t]['columns'].keys())
-
-        # Empty c_a_list means "select *". In this case, first supply c_a_list with all columns
-        if len(c_a_list) == 0:
-            for t in table_dict:
-                for c in table_columns[t]:
-                    c_a_list.append((t, c, None))
-
-        for i, (t, c, a) in enumerate(c_a_list):
-            # If table name is not specified, check column name and infer table name
-            if t is None:
-                table_name = None
-                for t in table_dict:
-                    if c in table_columns[t]:
-                        if table_name is not None:
-                            # Column name is ambiguous
-                            raise SelectColumnResolveError(c)
-                        table_name = t
-                if table_name is None:
-                    raise SelectColumnResolveError(c)
-                c_a_list[i] = (table_name, c, a)
-            else:
-                if t not in table_dict:
-                    raise SelectColumnResolveError(f'{t}.{c}')
-                elif c not in table_columns[t]:
-                    raise SelectColumnResolveError(f'{t}.{c}')
-
-        # replace (t, c, None) with (t, c, c) in c_a_list
-        c_a_list = [(t, c, c if a is None else a) for (t, c, a) in c_a_list]
-
-        # selected rows to be printed
-        select_result: list[dict[tuple[TableName, ColumnName], Value]] = []
-        curr: dict[TableName, int] = {
-            t: 0 for t in table_dict.keys()}  # current row index
-
-        # Iterate through rows in table_dict (Cartesian product)
-        while True:
-            try:
-                curr_rows = {t: table_dict[t][curr[t]]
-                             for t in table_dict.keys()}
-                # Check if where_clause is satisfied
-                where_clause_satisfied = False
-                if where_clause is None:
-                    where_clause_satisfied = True
-                elif WhereClauseTransformer(curr_rows).transform(where_clause):
-                    where_clause_satisfied = True
-
-                if where_clause_satisfied:
-                    zipped: dict[tuple[TableName, ColumnName], Value] = {}
-                    for (t, c, a) in c_a_list:
-                        assert (t is not None)
-                        zipped[(t, c)] = curr_rows[t][c]
-                    select_result.append(zipped)
-
-                for t in table_dict.keys():
-                    curr[t] += 1
-                    if curr[t] < len(table_dict[t]):
-                        break
-                    else:
-                        curr[t] = 0
-
-                # If all rows have been iterated through, break
-                if all([curr[t] == 0 for t in table_dict.keys()]):
-                    break
-            except IndexError:  # At least one table is empty
-                break
-
-        # Print columns (Cell width of each column is determined by the longest value in the column)
-
-        # Before printing, cast every value in select_result to string
-        printable_result = [{(t, c): value_to_str(v) for (
-            (t, c), v) in row.items()} for row in select_result]
-
-        col_widths: dict[C_A, int] = {}
-        for (t, c, a) in c_a_list:
-            assert (t is not None and a is not None)
-            col_widths[(t, c, a)] = max([len(str(result[(t, c)]))
-                                         for result in printable_result] + [len(a)])
-
-        # Print column names
-        hr_line: str = '+'  # horizontal line (to be reused)
-        for (t, c, a) in c_a_list:
-            assert (a is not None)
-            hr_line += '-' * (col_widths[(t, c, a)] + 2) + '+'
-
-        print(hr_line)
-
-        print('|', end='')
-        for (t, c, a) in c_a_list:
-            assert (t is not None and a is not None)
-            print(f' {a:<{col_widths[(t, c, a)]}} |', end='')
-        print()
-
-        print(hr_line)
-
-        for row in printable_result:
-            print('|', end='')
-            for (t, c, a) in c_a_list:
-                assert (t is not None and a is not None)
-                print(f' {row[(t, c)]:<{col_widths[(t, c, a)]}} |', end='')
-            print()
-
-        print(hr_line)
+        headers, width_bounds, rows = select_rows(my_db, table_schemas, table_data, table_stats, query)
+        # Rows are converted and printed as join_rows produces them, without materializing the result
+        print_result_table(headers, ([value_to_str(value) for value in row] for row in rows), width_bounds)
 
     except VisitError as e:
         print_after_prompt(e.orig_exc)
@@ -452,7 +725,7 @@ def select_data(table_schemas: dict[TableName, TableSchema], table_data: dict[Ta
 
 
 def update_data(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
-                query: UpdateQuery):
+                query: UpdateQuery) -> bool:
     try:
         (_, table_name, column_name, value, where_clause) = query
         if table_name not in table_schemas:
@@ -481,42 +754,133 @@ def update_data(my_db, table_schemas: dict[TableName, TableSchema], table_data:
         if is_fkey:
             # Check if the new value doesn't violate foreign key constraint
             (ref_table, ref_col) = table_schemas[table_name]['foreign_keys'][column_name]
-            if not any([ref_row[ref_col] == value for ref_row in table_data[ref_table]]):
+            if not table_data[ref_table].has_value(ref_col, value):
                 fkey_violated = True
 
-        update_count = 0
-        orig_data = copy.deepcopy(table_data[table_name])
+        where = None
+        if where_clause is not None:
+            where = compile_where(where_clause, {table_name: list(table_schemas[table_name]['columns'])})
 
-        for row in table_data[table_name]:
-            to_update: bool = False
+        # Find the rows to update and check them, before modifying anything
+        table: Table = table_data[table_name]
+        targets: list[tuple[RowId, TableRow]] = []
+        for row_id, row in candidate_rows(my_db, table_name, table_schemas[table_name], table, where_clause):
             if row[column_name] == value:  # No need to update
-                to_update = False
-            elif where_clause is None:
-                to_update = True
-            elif WhereClauseTransformer({table_name: row}).transform(where_clause):
-                to_update = True
-            if to_update:
-                if is_fkey and fkey_violated:
-                    raise UpdateReferentialIntegrityError()
-                if is_pkey:
-                    # Check if there is a foreign key that references the row
-                    for (ref_table, ref_col) in referenced_by:
-                        for ref_row in table_data[ref_table]:
-                            if ref_row[ref_col] == ref_row[column_name]:
-                                # TODO: Currently - cancel update and raise error
-                                table_data[table_name] = orig_data  # roll back all changes
-                                raise UpdateReferentialIntegrityError()
-                    row[column_name] = value
-                    # Primary key uniqueness check
-                    if not pkey_unique_check(table_schemas[table_name], table_data[table_name]):
-                        table_data[table_name] = orig_data  # roll back all changes
-                        raise UpdateDuplicatePrimaryKeyError()
-                row[column_name] = value
-                update_count += 1
-        my_db.put(tname_to_data_key(table_name).encode(),
-                  json.dumps(table_data[table_name], cls=MyEncoder).encode())
+                continue
+            if where is not None and not where({table_name: row}):
+                continue
+            if is_fkey and fkey_violated:
+                raise UpdateReferentialIntegrityError()
+            # Check if there is a foreign key that references the row
+            # TODO: Currently - cancel update and raise error
+            if any(table_data[ref_table].find_referencing(ref_col, row[column_name])
+                   for (ref_table, ref_col) in referenced_by):
+                raise UpdateReferentialIntegrityError()
+            targets.append((row_id, row))
+
+        # Primary key uniqueness check, once for the set of new keys. Every new key holds the new value, which no
+        # updated row held before, so a key already in the index belongs to a row that is not updated.
+        if is_pkey:
+            new_pkeys = {table.pkey_of(row.with_value(column_name, value)) for (row_id, row) in targets}
+            if len(new_pkeys) < len(targets) or any(table.find_pkey(pkey) is not None for pkey in new_pkeys):
+                raise UpdateDuplicatePrimaryKeyError()
+
+        # Undo log of the statement: (row id, previous value) of each modified row
+        undo_log: list[tuple[RowId, Value]] = []
+        try:
+            for row_id, row in targets:
+                undo_log.append((row_id, row[column_name]))
+                table.set_value(row_id, column_name, value)
+            for row_id, old_value in undo_log:
+                my_db.put_row(table_name, row_id, table[row_id], {column_name: old_value})
+        except Exception:
+            for row_id, old_value in reversed(undo_log):  # roll back all changes
+                table.set_value(row_id, column_name, old_value)
+            raise
+        update_count = len(targets)
         print_after_prompt(UpdateResult(update_count))
+        return True
     except VisitError as e:
         print_after_prompt(e.orig_exc)
+        return False
     except Exception as e:
         print_after_prompt(e)
+        return False
+
+
+def run_query(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+              table_stats: dict[TableName, TableStats], prepared_statements: dict[StatementName, PreparedStatement],
+              query: Query) -> bool:
+    """Execute the query. Returns False for EXIT."""
+    if query == 'exit':
+        return False
+    elif query[0] == 'begin':
+        begin_transaction(my_db)
+        return True
+    elif query[0] == 'commit':
+        commit_transaction(my_db)
+        return True
+    elif query[0] == 'rollback':
+        rollback_transaction(my_db, table_schemas, table_data, table_stats)
+        return True
+    elif query[0] == 'prepare':
+        prepare_statement(prepared_statements, query)
+        return True
+    elif query[0] == 'deallocate':
+        deallocate_statement(prepared_statements, query)
+        return True
+    elif query[0] == 'execute':
+        # The prepared statement is executed as if its values had been written in it
+        query = bind_statement(prepared_statements, query)
+        if query is None:
+            return True
+
+    # Outside of BEGIN ... COMMIT, each statement is committed on its own (or at the next checkpoint of a script). A
+    # statement that fails is rolled back, with the writes it had made.
+    succeeded = True
+    with my_db.statement():
+        if query[0] == 'create_table':
+            succeeded = create_table(my_db, table_schemas, table_data, query)
+        elif query[0] == 'drop_table':
+            table_name: TableName = query[1]
+            succeeded = drop_table(my_db, table_schemas, table_data, table_stats, table_name)
+        elif query[0] == 'desc_table':
+            table_name: TableName = query[1]
+            desc_table(table_schemas, table_name)
+        elif query[0] == 'show_tables':
+            show_tables(table_schemas)
+        elif query[0] == 'insert':
+            succeeded = insert_data(my_db, table_schemas, table_data, query)
+        elif query[0] == 'copy':
+            succeeded = copy_data(my_db, table_schemas, table_data, query)
+        elif query[0] == 'delete':
+            succeeded = delete_data(my_db, table_schemas, table_data, query)
+        elif query[0] == 'update':
+            succeeded = update_data(my_db, table_schemas, table_data, query)
+        elif query[0] == 'select':
+            select_data(my_db, table_schemas, table_data, table_stats, query)
+        elif query[0] == 'create_index':
+            succeeded = create_index(my_db, table_schemas, table_data, query)
+        elif query[0] == 'drop_index':
+            succeeded = drop_index(my_db, table_schemas, query)
+        elif query[0] == 'analyze':
+            succeeded = analyze_table(my_db, table_schemas, table_data, table_stats, query)
+        if not succeeded:
+            my_db.fail_statement()
+    if not succeeded and my_db.statement_wrote:
+        discard_statement_changes(my_db, table_schemas, table_data, table_stats, query)
+    return True
+
+
+def discard_statement_changes(my_db, table_schemas: dict[TableName, TableSchema],
+                              table_data: dict[TableName, TableData], table_stats: dict[TableName, TableStats],
+                              query: Query):
+    """Discard the in-memory state a failed statement may have changed along with its writes, which have been rolled
+    back: the tables it modifies are read again on their next access (all of them, with the schemas and statistics,
+    for a statement changing the catalog)"""
+    if query[0] in CATALOG_STATEMENTS:
+        my_db.load_catalog(table_stats)
+        table_data.clear()
+        return
+    for t in statement_tables(table_schemas, query)[1]:
+        table_data.pop(t, None)
@@ -0,0 +1,179 @@
+"""Load test of the database server: concurrent clients running statements, timed.
+
+Usage: python loadtest.py [--workload insert-select|read|mixed] [--clients N[,N...]] [--statements N] [--host HOST]
+                          [--port PORT] [--spawn]
+
+With --spawn, a server is started on the port in a temporary directory (and stopped at the end). Workloads:
+  insert-select   each client inserts rows of its own into table load_test and, after every insert, selects one of its
+                  rows by id
+  read            each client scans load_test (READ_TABLE_ROWS rows) for the rows of one name
+  mixed           half of the clients insert WRITE_BATCH_ROWS rows per INSERT into load_writes, the others scan
+                  load_test and read all of load_writes, checking that they never see part of an INSERT and that no
+                  row is lost
+
+Given several numbers of clients, the workload is run once per number (on the same server), to show how throughput
+scales.
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from client import DEFAULT_HOST, DEFAULT_PORT, Client, StatementResult
+
+READ_TABLE_ROWS = 5000  # Rows of load_test in the read and mixed workloads
+WRITE_BATCH_ROWS = 10  # Rows of each INSERT of the mixed workload
+
+
+async def timed(client: Client, statement: str, latencies: list[float]) -> StatementResult:
+    start = time.perf_counter()
+    result = await client.execute(statement)
+    latencies.append(time.perf_counter() - start)
+    return result
+
+
+async def run_client(host: str, port: int, client_id: int, num_statements: int) -> list[float]:
+    """Latencies of the statements of one client of the insert-select workload"""
+    client = await Client.connect(host, port)
+    latencies = []
+    try:
+        for i in range(num_statements // 2):
+            row_id = client_id * num_statements + i
+            for statement in (f"insert into load_test values ({row_id}, 'client{client_id:04}', 2024-01-01);",
+                              f"select * from load_test where id = {client_id * num_statements + i // 2};"):
+                result = await timed(client, statement, latencies)
+                assert result.columns is not None or result.messages == ['The row is inserted'], result.messages
+    finally:
+        await client.close()
+    return latencies
+
+
+async def run_reader(host: str, port: int, client_id: int, num_statements: int) -> list[float]:
+    """Latencies of the statements of one client of the read workload"""
+    client = await Client.connect(host, port)
+    latencies = []
+    try:
+        for i in range(num_statements):
+            result = await timed(client, f"select id, day from load_test where name = 'client{i % 100:04}';", latencies)
+            assert len(result.rows) == READ_TABLE_ROWS // 100, result.messages
+    finally:
+        await client.close()
+    return latencies
+
+
+async def run_mixed_client(host: str, port: int, client_id: int, num_statements: int) -> list[float]:
+    """Latencies of the statements of one client of the mixed workload: a writer if client_id is even"""
+    client = await Client.connect(host, port)
+    latencies = []
+    try:
+        for i in range(num_statements):
+            if client_id % 2 == 0:
+                first_id = (client_id * num_statements + i) * WRITE_BATCH_ROWS
+                values = ', '.join(f'({row_id}, {client_id})'
+                                   for row_id in range(first_id, first_id + WRITE_BATCH_ROWS))
+                result = await timed(client, f'insert into load_writes values {values};', latencies)
+                assert result.messages == [f'{WRITE_BATCH_ROWS} row(s) are inserted'], result.messages
+            elif i % 2 == 0:
+                result = await timed(client, 'select id from load_writes;', latencies)
+                # An INSERT is seen whole or not at all
+                assert len(result.rows) % WRITE_BATCH_ROWS == 0, f'{len(result.rows)} rows seen'
+            else:
+                result = await timed(client, f"select id, day from load_test where name = 'client{i % 100:04}';",
+                                     latencies)
+                assert len(result.rows) == READ_TABLE_ROWS // 100, result.messages
+    finally:
+        await client.close()
+    return latencies
+
+
+async def wait_for_server(host: str, port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client = await Client.connect(host, port)
+            await client.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def set_up(host: str, port: int, workload: str):
+    client = await Client.connect(host, port)
+    await client.execute('create table load_test (id int not null, name char(10), day date, primary key (id));')
+    if workload == 'insert-select':
+        # Selections by id are index scans rather than scans of the table
+        await client.execute('create index load_test_id on load_test (id);')
+    else:
+        for first_id in range(0, READ_TABLE_ROWS, 500):
+            values = ', '.join(f"({row_id}, 'client{row_id % 100:04}', 2024-01-01)"
+                               for row_id in range(first_id, first_id + 500))
+            await client.execute(f'insert into load_test values {values};')
+    if workload == 'mixed':
+        await client.execute('create table load_writes (id int not null, client int, primary key (id));')
+    await client.close()
+
+
+async def load_test(host: str, port: int, workload: str, clients: list[int], num_statements: int):
+    await wait_for_server(host, port)
+    await set_up(host, port, workload)
+    run = {'insert-select': run_client, 'read': run_reader, 'mixed': run_mixed_client}[workload]
+
+    for num_clients in clients:
+        if workload == 'insert-select':  # Clients insert rows of their own ids, so each run uses a new table
+            client = await Client.connect(host, port)
+            await client.execute('delete from load_test;')
+            await client.close()
+        start = time.perf_counter()
+        results = await asyncio.gather(*[run(host, port, i, num_statements) for i in range(num_clients)])
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for latencies in results for latency in latencies)
+        print(f'{workload}: {num_clients} clients, {len(latencies)} statements in {elapsed:.2f} s: '
+              f'{len(latencies) / elapsed:,.0f} statements/s')
+        print(f'latency ms: p50 {statistics.median(latencies) * 1000:.2f}, '
+              f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f}, max {latencies[-1] * 1000:.2f}')
+
+        if workload == 'mixed':
+            client = await Client.connect(host, port)
+            result = await client.execute('select id from load_writes;')
+            await client.execute('delete from load_writes;')
+            await client.close()
+            writers = (num_clients + 1) // 2
+            assert len(result.rows) == writers * num_statements * WRITE_BATCH_ROWS, f'{len(result.rows)} rows written'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Load test of the database server.')
+    arg_parser.add_argument('--workload', choices=('insert-select', 'read', 'mixed'), default='insert-select')
+    arg_parser.add_argument('--clients', default='10', help='number of clients, or numbers separated by commas')
+    arg_parser.add_argument('--statements', type=int, default=1000, help='statements per client')
+    arg_parser.add_argument('--host', default=DEFAULT_HOST)
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    arg_parser.add_argument('--spawn', action='store_true', help='start a server in a temporary directory')
+    args = arg_parser.parse_args()
+    clients = [int(num_clients) for num_clients in args.clients.split(',')]
+
+    if not args.spawn:
+        asyncio.run(load_test(args.host, args.port, args.workload, clients, args.statements))
+        return
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        shutil.copy(os.path.join(source_dir, 'grammar.lark'), temp_dir)
+        server = subprocess.Popen([sys.executable, os.path.join(source_dir, 'server.py'), '--port', str(args.port)],
+                                  cwd=temp_dir, stdout=subprocess.DEVNULL)
+        try:
+            asyncio.run(load_test(args.host, args.port, args.workload, clients, args.statements))
+        finally:
+            server.terminate()  # The server closes the database on SIGTERM
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Aggregate functions and GROUP BY, evaluated by hash aggregation while the rows of the FROM and WHERE parts stream in.
+
+Each group keeps one accumulator per aggregate column, in a dict keyed by the grouping values. Strings are grouped and
+compared case-insensitively, as the where clause compares them; a group shows the values of the first of its rows.
+"""
+
+from myPlanner import TableRows, join_key_value
+from myTypes import *
+from transformers import OperandGetter
+
+
+class Accumulator:
+    """State of an aggregate function over the rows of one group"""
+
+    __slots__ = ()
+
+    def add(self, value: Value):
+        raise NotImplementedError
+
+    def result(self) -> Value | float:
+        raise NotImplementedError
+
+
+class Count(Accumulator):
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value: Value):
+        if value is not None:
+            self.count += 1
+
+    def result(self) -> int:
+        return self.count
+
+
+class Sum(Accumulator):
+    __slots__ = ('total',)
+
+    def __init__(self):
+        self.total: int | None = None  # NULL until a non-null value is added
+
+    def add(self, value: Value):
+        if value is not None:
+            self.total = value if self.total is None else self.total + value
+
+    def result(self) -> int | None:
+        return self.total
+
+
+class Avg(Accumulator):
+    __slots__ = ('total', 'count')
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def add(self, value: Value):
+        if value is not None:
+            self.total += value
+            self.count += 1
+
+    def result(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+
+class Min(Accumulator):
+    __slots__ = ('value', 'key')
+
+    def __init__(self):
+        self.value: Value = None
+        self.key: Value = None
+
+    def add(self, value: Value):
+        if value is not None:
+            key = join_key_value(value)
+            if self.key is None or key < self.key:
+                self.value, self.key = value, key
+
+    def result(self) -> Value:
+        return self.value
+
+
+class Max(Min):
+    __slots__ = ()
+
+    def add(self, value: Value):
+        if value is not None:
+            key = join_key_value(value)
+            if self.key is None or key > self.key:
+                self.value, self.key = value, key
+
+
+ACCUMULATORS: dict[AggregateFunction, type[Accumulator]] = {'count': Count, 'sum': Sum, 'avg': Avg, 'min': Min,
+                                                            'max': Max}
+
+
+def count_row(table_rows: TableRows) -> Value:
+    """Argument of COUNT(*): every row counts, as if each had a non-null value"""
+    return 1
+
+
+def hash_aggregate(combinations: Iterable[TableRows], group_getters: list[OperandGetter],
+                   aggregates: list[tuple[AggregateFunction, OperandGetter]]
+                   ) -> Iterator[tuple[list[Value], list[Value | float]]]:
+    """The grouping values and the aggregate results of each group of the combinations, groups in the order of their
+    first rows.
+
+    Without group getters all the combinations make one group, which exists (COUNT 0, other aggregates NULL) even if
+    there are no combinations.
+    """
+    factories = [ACCUMULATORS[function] for (function, _) in aggregates]
+    aggregate_getters = [get for (_, get) in aggregates]
+    # Key -> the grouping values, the accumulators and their add methods
+    groups: dict[Value | tuple, tuple[list[Value], list[Accumulator], list[Callable[[Value], None]]]] = {}
+
+    def new_group(values: list[Value]) -> tuple[list[Value], list[Accumulator], list[Callable[[Value], None]]]:
+        accumulators = [factory() for factory in factories]
+        return values, accumulators, [accumulator.add for accumulator in accumulators]
+
+    if not group_getters:
+        groups[()] = new_group([])
+    single_getter = group_getters[0] if len(group_getters) == 1 else None
+    for table_rows in combinations:
+        if single_getter is not None:  # The key is the value itself rather than a tuple of one
+            value = single_getter(table_rows)
+            key = join_key_value(value)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = new_group([value])
+        else:
+            values = [get(table_rows) for get in group_getters]
+            key = tuple([join_key_value(value) for value in values])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = new_group(values)
+        for add, get in zip(group[2], aggregate_getters):
+            add(get(table_rows))
+    for values, accumulators, _ in groups.values():
+        yield values, [accumulator.result() for accumulator in accumulators]
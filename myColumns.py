@@ -0,0 +1,283 @@
+"""Columnar copies of tables, whose column vectors are filtered in batches.
+
+The storage of a columnar table is a flat list of buffers (see ColumnarTable.buffers), which can be copied into shared
+memory and mapped back as a read-only columnar table by another process (see myParallel).
+"""
+
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import compress, repeat
+
+from myTypes import *
+
+COLUMNAR_MIN_ROWS: int | None = 4096  # Tables with fewer rows are always filtered row by row (None: always)
+COLUMN_BATCH_ROWS = 4096  # Rows filtered together
+
+ColumnComparison = Literal['lt', 'gt', 'eq', 'gte', 'lte', 'neq', 'is_null', 'is_not_null']
+ColumnCondition = tuple[ColumnName, ColumnComparison, Value]  # <column> <comparison> <value>
+Positions = range | list[int]  # Positions of rows in the column vectors
+
+_COMPARISON_OPERATORS = {'lt': operator.lt, 'gt': operator.gt, 'eq': operator.eq,
+                         'gte': operator.ge, 'lte': operator.le, 'neq': operator.ne}
+
+
+class ColumnVector:
+    """Values of a column: typed storage defined by the subclass and a null map (one byte per row, 1 for NULL)"""
+
+    def __init__(self):
+        self.nulls = bytearray()
+
+    @classmethod
+    def from_buffers(cls, buffers: Iterator[memoryview]) -> 'ColumnVector':
+        """Read-only vector over buffers laid out as those of buffers() (consumed from the iterator)"""
+        vector = cls.__new__(cls)
+        vector.nulls = next(buffers)
+        return vector
+
+    def buffers(self) -> list[array | bytearray]:
+        return [self.nulls]
+
+    def append(self, value: Value):
+        raise NotImplementedError
+
+    def set(self, position: int, value: Value):
+        """Replace the value at the position"""
+        raise NotImplementedError
+
+    def __getitem__(self, position: int) -> Value:
+        raise NotImplementedError
+
+    def keys(self, positions: Positions) -> Iterable:
+        """Keys of the values at the positions, which compare as the values do in a where clause"""
+        raise NotImplementedError
+
+    def key_of(self, value: Value):
+        raise NotImplementedError
+
+    def filter(self, comparison: ColumnComparison, value: Value, positions: Positions) -> list[int]:
+        """Positions whose value satisfies '<value at position> <comparison> value' (NULL never does)"""
+        if isinstance(positions, range):
+            nulls = self.nulls[positions.start:positions.stop]
+        else:
+            nulls = map(self.nulls.__getitem__, positions)
+        if comparison == 'is_null':
+            return list(compress(positions, nulls))
+        not_nulls = map(operator.not_, nulls)
+        if comparison == 'is_not_null':
+            return list(compress(positions, not_nulls))
+        matches = map(_COMPARISON_OPERATORS[comparison], self.keys(positions), repeat(self.key_of(value)))
+        return list(compress(positions, map(operator.and_, matches, not_nulls)))
+
+
+class IntColumn(ColumnVector):
+    """array('q') of the values (0 for NULL). Appending an int that does not fit in 64 bits raises OverflowError."""
+
+    typecode = 'q'
+
+    def __init__(self):
+        super().__init__()
+        self.values = array(self.typecode)
+
+    @classmethod
+    def from_buffers(cls, buffers: Iterator[memoryview]) -> 'IntColumn':
+        vector = super().from_buffers(buffers)
+        vector.values = next(buffers)
+        return vector
+
+    def buffers(self) -> list[array | bytearray]:
+        return [self.nulls, self.values]
+
+    def append(self, value: int | None):
+        self.values.append(0 if value is None else self.key_of(value))
+        self.nulls.append(value is None)
+
+    def set(self, position: int, value: int | None):
+        self.values[position] = 0 if value is None else self.key_of(value)
+        self.nulls[position] = value is None
+
+    def __getitem__(self, position: int) -> Value:
+        return None if self.nulls[position] else self.values[position]
+
+    def keys(self, positions: Positions) -> Iterable:
+        if isinstance(positions, range):
+            return self.values[positions.start:positions.stop]
+        return map(self.values.__getitem__, positions)
+
+    def key_of(self, value: Value):
+        return value
+
+
+class DateColumn(IntColumn):
+    """array('i') of the day ordinals of the dates (0 for NULL)"""
+
+    typecode = 'i'
+
+    def __getitem__(self, position: int) -> Value:
+        return None if self.nulls[position] else datetime.fromordinal(self.values[position])
+
+    def key_of(self, value: Value):
+        return value.toordinal()
+
+
+class CharColumn(ColumnVector):
+    """UTF-8 encoded values in a buffer, and where each starts and ends (NULL is empty).
+
+    Values are appended one after another. A replaced value is written over the old one if it fits, or else appended;
+    the buffer is compacted once more than half of it is no longer used.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.starts = array('q')
+        self.ends = array('q')  # Value i is buffer[starts[i]:ends[i]]
+        self.buffer = bytearray()
+        self.unused = 0  # Bytes of the buffer left by replaced values
+
+    @classmethod
+    def from_buffers(cls, buffers: Iterator[memoryview]) -> 'CharColumn':
+        vector = super().from_buffers(buffers)
+        vector.starts = next(buffers)
+        vector.ends = next(buffers)
+        vector.buffer = next(buffers)
+        return vector
+
+    def buffers(self) -> list[array | bytearray]:
+        return [self.nulls, self.starts, self.ends, self.buffer]
+
+    def append(self, value: str | None):
+        self.starts.append(len(self.buffer))
+        if value is not None:
+            self.buffer += value.encode()
+        self.ends.append(len(self.buffer))
+        self.nulls.append(value is None)
+
+    def set(self, position: int, value: str | None):
+        encoded = b'' if value is None else value.encode()
+        start, end = self.starts[position], self.ends[position]
+        if len(encoded) <= end - start:
+            self.buffer[start:start + len(encoded)] = encoded
+            self.unused += end - start - len(encoded)
+        else:
+            self.unused += end - start
+            start = self.starts[position] = len(self.buffer)
+            self.buffer += encoded
+        self.ends[position] = start + len(encoded)
+        self.nulls[position] = value is None
+        if self.unused > len(self.buffer) // 2:
+            self._compact()
+
+    def _compact(self):
+        buffer, starts, ends = bytearray(), array('q'), array('q')
+        for start, end in zip(self.starts, self.ends):
+            starts.append(len(buffer))
+            buffer += self.buffer[start:end]
+            ends.append(len(buffer))
+        self.buffer, self.starts, self.ends, self.unused = buffer, starts, ends, 0
+
+    # The buffer may be a memoryview, which has no decode
+    def __getitem__(self, position: int) -> Value:
+        if self.nulls[position]:
+            return None
+        return str(self.buffer[self.starts[position]:self.ends[position]], 'utf-8')
+
+    def keys(self, positions: Positions) -> Iterable:
+        # Strings are compared case-insensitively
+        buffer, starts, ends = self.buffer, self.starts, self.ends
+        return (str(buffer[starts[position]:ends[position]], 'utf-8').lower() for position in positions)
+
+    def key_of(self, value: Value):
+        return value.lower()
+
+
+_COLUMN_VECTORS: dict[str, type[ColumnVector]] = {'int': IntColumn, 'char': CharColumn, 'date': DateColumn}
+
+
+class ColumnarTable:
+    """The rows of a table as one column vector per column, plus their row ids, in row id order.
+
+    A row is at a position of the vectors. Modified rows are updated in place; removed rows keep their position,
+    marked in a map of removed positions (one byte per position, 1 if removed), so that the vectors never need to be
+    built again. version counts the changes.
+    """
+
+    def __init__(self, schema: TableSchema, rows: Iterable[tuple[RowId, TableRow]] = ()):
+        self.row_ids = array('q')
+        self.removed = bytearray()
+        self.num_removed = 0
+        self.version = 0
+        self.columns: dict[ColumnName, ColumnVector] = {
+            name: _COLUMN_VECTORS[column['data_type']]() for name, column in schema['columns'].items()}
+        for row_id, row in rows:
+            self.append(row_id, row)
+
+    @classmethod
+    def from_buffers(cls, schema: TableSchema, buffers: Iterable[memoryview]) -> 'ColumnarTable':
+        """Read-only columnar table over buffers laid out as those of buffers(), e.g. mapped from shared memory"""
+        buffers = iter(buffers)
+        columnar = cls.__new__(cls)
+        columnar.row_ids = next(buffers)
+        columnar.removed = next(buffers)
+        columnar.columns = {name: _COLUMN_VECTORS[column['data_type']].from_buffers(buffers)
+                            for name, column in schema['columns'].items()}
+        return columnar
+
+    def buffers(self) -> list[array | bytearray]:
+        """The storage of the table: the row ids, the map of removed positions, then the buffers of each column vector
+        in column order"""
+        column_buffers = [buffer for column in self.columns.values() for buffer in column.buffers()]
+        return [self.row_ids, self.removed] + column_buffers
+
+    def __len__(self) -> int:
+        """Number of positions, those of removed rows included"""
+        return len(self.row_ids)
+
+    def append(self, row_id: RowId, row: TableRow):
+        """Append a row. Raises ValueError if its row id is not larger than any other (the columnar table is left as
+        it is), and OverflowError if a value does not fit, which leaves the columnar table inconsistent."""
+        if self.row_ids and row_id <= self.row_ids[-1]:
+            raise ValueError(f'row id {row_id} is not larger than {self.row_ids[-1]}')
+        for column, value in zip(self.columns.values(), row.values()):  # Both in the order of the columns
+            column.append(value)
+        self.row_ids.append(row_id)
+        self.removed.append(False)
+        self.version += 1
+
+    def position(self, row_id: RowId) -> int:
+        """Position of a row that has not been removed. Raises KeyError if there is none."""
+        position = bisect_left(self.row_ids, row_id)
+        if position == len(self.row_ids) or self.row_ids[position] != row_id or self.removed[position]:
+            raise KeyError(row_id)
+        return position
+
+    def remove(self, row_id: RowId):
+        """Remove a row. Raises KeyError if there is none."""
+        self.removed[self.position(row_id)] = True
+        self.num_removed += 1
+        self.version += 1
+
+    def set_value(self, row_id: RowId, column_name: ColumnName, value: Value):
+        """Replace a value of a row. Raises KeyError if there is none, and OverflowError if the value does not fit,
+        which leaves the columnar table inconsistent."""
+        position = self.position(row_id)
+        self.version += 1
+        self.columns[column_name].set(position, value)
+
+    def filter(self, conditions: list[ColumnCondition], start: int = 0, stop: int | None = None) -> Iterator[RowId]:
+        """Row ids of the rows (at positions start to stop) that satisfy all the conditions, evaluated column by column,
+        COLUMN_BATCH_ROWS rows at a time"""
+        return map(self.row_ids.__getitem__, self.filter_positions(conditions, start, stop))
+
+    def filter_positions(self, conditions: list[ColumnCondition], start: int = 0,
+                         stop: int | None = None) -> Iterator[int]:
+        stop = len(self.row_ids) if stop is None else stop
+        for batch_start in range(start, stop, COLUMN_BATCH_ROWS):
+            positions: Positions = range(batch_start, min(batch_start + COLUMN_BATCH_ROWS, stop))
+            removed = bytes(self.removed[positions.start:positions.stop])
+            if 1 in removed:
+                positions = list(compress(positions, map(operator.not_, removed)))
+            for column_name, comparison, value in conditions:
+                positions = self.columns[column_name].filter(comparison, value, positions)
+                if not positions:
+                    break
+            yield from positions
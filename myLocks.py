@@ -0,0 +1,136 @@
+"""Table-level reader/writer locks of the server (see server.py).
+
+A statement holds the catalog lock shared, then the lock of each table it reads shared and the lock of each table it
+modifies exclusively. The table locks are taken in table name order, so statements waiting for each other never form a
+cycle. Statements that change the catalog (and transactions) hold the catalog lock exclusively instead, which waits for
+every other statement and keeps them all out.
+"""
+
+import asyncio
+from collections import defaultdict, deque
+
+from myTypes import *
+
+# Statements holding the catalog lock exclusively: they change schemas, indexes or statistics, or begin or end a
+# transaction
+CATALOG_STATEMENTS = {'create_table', 'drop_table', 'create_index', 'drop_index', 'analyze', 'begin', 'commit',
+                      'rollback'}
+
+
+class ReadWriteLock:
+    """Lock held either by any number of readers or by one writer.
+
+    Waiters get the lock in the order they arrived, readers next to each other in the queue together, so that neither
+    a stream of SELECTs nor a stream of writes can starve the other side.
+    """
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiters: deque[tuple[bool, asyncio.Future]] = deque()  # (exclusive, future set when granted)
+
+    async def acquire_read(self):
+        if self._writer or self._waiters:
+            await self._wait(False)
+        else:
+            self._readers += 1
+
+    async def acquire_write(self):
+        if self._writer or self._readers or self._waiters:
+            await self._wait(True)
+        else:
+            self._writer = True
+
+    def release_read(self):
+        self._readers -= 1
+        self._wake()
+
+    def release_write(self):
+        self._writer = False
+        self._wake()
+
+    async def _wait(self, exclusive: bool):
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((exclusive, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self._waiters.remove((exclusive, future))
+                self._wake()
+            elif exclusive:  # Granted just before the cancellation
+                self.release_write()
+            else:
+                self.release_read()
+            raise
+
+    def _wake(self):
+        """Grant the lock to the waiters at the front of the queue that can hold it together"""
+        while self._waiters and not self._writer:
+            exclusive, future = self._waiters[0]
+            if exclusive and self._readers:
+                return
+            self._waiters.popleft()
+            if exclusive:
+                self._writer = True
+            else:
+                self._readers += 1
+            future.set_result(None)
+
+
+def statement_tables(table_schemas: dict[TableName, TableSchema], query: Query) -> StatementTables:
+    """The tables the statement reads and the tables it modifies (neither for DESC and SHOW TABLES).
+
+    Foreign keys add tables: the referenced ones are read to check new values, and DELETE sets the referencing rows to
+    NULL (UPDATE of a primary key only reads them).
+    """
+    if query[0] == 'select':
+        return {t for (t, a) in query[2]}, set()
+    if query[0] not in ('insert', 'copy', 'delete', 'update'):
+        return set(), set()
+    table_name: TableName = query[1]
+    if table_name not in table_schemas:
+        return set(), {table_name}
+    referenced = {ref_table for (ref_table, ref_col) in table_schemas[table_name]['foreign_keys'].values()}
+    referencing = {t for t in table_schemas
+                   if any(ref_table == table_name for (ref_table, _) in table_schemas[t]['foreign_keys'].values())}
+    if query[0] == 'delete':
+        return set(), {table_name} | referencing
+    if query[0] == 'update':
+        return (referenced | referencing) - {table_name}, {table_name}
+    return referenced - {table_name}, {table_name}
+
+
+class TableLocks:
+    """The catalog lock and the lock of each table"""
+
+    def __init__(self):
+        self.catalog = ReadWriteLock()
+        self.tables: dict[TableName, ReadWriteLock] = defaultdict(ReadWriteLock)
+
+    async def acquire(self, table_schemas: dict[TableName, TableSchema], query: Query) -> StatementTables | None:
+        """Wait for the locks the statement needs. Returns what to pass to release (None: the catalog exclusively)."""
+        if query[0] in CATALOG_STATEMENTS:
+            await self.catalog.acquire_write()
+            return None
+        await self.catalog.acquire_read()
+        # The schemas do not change while the catalog lock is held
+        read_tables, write_tables = statement_tables(table_schemas, query)
+        read_tables -= write_tables
+        for t in sorted(read_tables | write_tables):
+            if t in write_tables:
+                await self.tables[t].acquire_write()
+            else:
+                await self.tables[t].acquire_read()
+        return read_tables, write_tables
+
+    def release(self, held: StatementTables | None):
+        if held is None:
+            self.catalog.release_write()
+            return
+        read_tables, write_tables = held
+        for t in write_tables:
+            self.tables[t].release_write()
+        for t in read_tables:
+            self.tables[t].release_read()
+        self.catalog.release_read()
@@ -144,10 +144,11 @@ class CharLengthError(Exception):
 
 
 class InsertResult:
-    """The row is inserted"""
+    """The row is inserted / [#count] row(s) are inserted"""
 
-    def __init__(self):
-        self.message = "The row is inserted"
+    def __init__(self, count=1):
+        self.count = count
+        self.message = "The row is inserted" if count == 1 else f"{count} row(s) are inserted"
 
     def __str__(self):
         return self.message
@@ -208,6 +209,29 @@ class InsertionColumnNonNullableError(Exception):
         return self.message
 
 
+class CopyResult:
+    """[#count] row(s) are copied from '[#fileName]'"""
+
+    def __init__(self, count, file_name):
+        self.count = count
+        self.file_name = file_name
+        self.message = f"{count} row(s) are copied from '{file_name}'"
+
+    def __str__(self):
+        return self.message
+
+
+class CopyFileError(Exception):
+    """Copy has failed: cannot read '[#fileName]'"""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.message = f"Copy has failed: cannot read '{file_name}'"
+
+    def __str__(self):
+        return self.message
+
+
 class DeleteResult:
     """[#count] row(s) are deleted"""
 
@@ -230,6 +254,72 @@ class DeleteReferentialIntegrityPassed:
         return self.message
 
 
+class CreateIndexSuccess:
+    """[#indexName] index is created"""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self.message = f"'{index_name}' index is created"
+
+    def __str__(self):
+        return self.message
+
+
+class IndexExistenceError(Exception):
+    """Create index has failed: index with the same name already exists"""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self.message = "Create index has failed: index with the same name already exists"
+
+    def __str__(self):
+        return self.message
+
+
+class CreateIndexColumnExistenceError(Exception):
+    """Create index has failed: '[#colName]' does not exist"""
+
+    def __init__(self, col_name):
+        self.col_name = col_name
+        self.message = f"Create index has failed: '{col_name}' does not exist"
+
+    def __str__(self):
+        return self.message
+
+
+class DropIndexSuccess:
+    """[#indexName] index is dropped"""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self.message = f"'{index_name}' index is dropped"
+
+    def __str__(self):
+        return self.message
+
+
+class NoSuchIndex(Exception):
+    """No such index"""
+
+    def __init__(self, index_name):
+        self.index_name = index_name
+        self.message = "No such index"
+
+    def __str__(self):
+        return self.message
+
+
+class AnalyzeResult:
+    """[#tableName] table is analyzed"""
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        self.message = f"'{table_name}' table is analyzed"
+
+    def __str__(self):
+        return self.message
+
+
 class SelectTableExistenceError(Exception):
     '''Selection has failed: '[#tableName]' does not exist'''
 
@@ -252,6 +342,39 @@ class SelectColumnResolveError(Exception):
         return self.message
 
 
+class SelectAggregateError(Exception):
+    '''Selection has failed: '[#function]' cannot be applied to '[#colName]'''
+
+    def __init__(self, function, col_name):
+        self.function = function
+        self.col_name = col_name
+        self.message = f"Selection has failed: '{function}' cannot be applied to '{col_name}'"
+
+    def __str__(self):
+        return self.message
+
+
+class SelectGroupByError(Exception):
+    '''Selection has failed: '[#colName]' is neither grouped nor aggregated'''
+
+    def __init__(self, col_name):
+        self.col_name = col_name
+        self.message = f"Selection has failed: '{col_name}' is neither grouped nor aggregated"
+
+    def __str__(self):
+        return self.message
+
+
+class SelectLimitError(Exception):
+    '''Selection has failed: LIMIT and OFFSET must not be negative'''
+
+    def __init__(self):
+        self.message = "Selection has failed: LIMIT and OFFSET must not be negative"
+
+    def __str__(self):
+        return self.message
+
+
 class UpdateResult:
     '''[#count] row(s) are updated'''
 
@@ -383,3 +506,90 @@ class NotUniqueTableAlias(Exception):
 
     def __str__(self):
         return self.message
+
+
+class TransactionResult:
+    """Transaction is [#begun|committed|rolled back]"""
+
+    def __init__(self, action):
+        self.action = action
+        self.message = f"Transaction is {action}"
+
+    def __str__(self):
+        return self.message
+
+
+class TransactionInProgressError(Exception):
+    """Begin has failed: a transaction is already in progress"""
+
+    def __init__(self):
+        self.message = "Begin has failed: a transaction is already in progress"
+
+    def __str__(self):
+        return self.message
+
+
+class NoTransactionError(Exception):
+    """[#Commit|Rollback] has failed: no transaction is in progress"""
+
+    def __init__(self, command):
+        self.command = command
+        self.message = f"{command} has failed: no transaction is in progress"
+
+    def __str__(self):
+        return self.message
+
+
+class PrepareResult:
+    """[#statementName] statement is prepared"""
+
+    def __init__(self, statement_name):
+        self.statement_name = statement_name
+        self.message = f"'{statement_name}' statement is prepared"
+
+    def __str__(self):
+        return self.message
+
+
+class DeallocateResult:
+    """[#statementName] statement is deallocated"""
+
+    def __init__(self, statement_name):
+        self.statement_name = statement_name
+        self.message = f"'{statement_name}' statement is deallocated"
+
+    def __str__(self):
+        return self.message
+
+
+class NoSuchPreparedStatement(Exception):
+    """No such prepared statement"""
+
+    def __init__(self, statement_name):
+        self.statement_name = statement_name
+        self.message = "No such prepared statement"
+
+    def __str__(self):
+        return self.message
+
+
+class ParameterCountError(Exception):
+    """Execute has failed: [#expected] parameter(s) are expected, [#given] given"""
+
+    def __init__(self, expected, given):
+        self.expected = expected
+        self.given = given
+        self.message = f"Execute has failed: {expected} parameter(s) are expected, {given} given"
+
+    def __str__(self):
+        return self.message
+
+
+class UnexpectedParameterError(Exception):
+    """Syntax error: '?' placeholders are only allowed in prepared statements"""
+
+    def __init__(self):
+        self.message = "Syntax error: '?' placeholders are only allowed in prepared statements"
+
+    def __str__(self):
+        return self.message
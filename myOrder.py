@@ -0,0 +1,60 @@
+"""ORDER BY, LIMIT and OFFSET of a select query.
+
+Values are ordered as indexes order them (see bdbUtils.index_value_key): NULL first, strings case-insensitively.
+ORDER BY ... LIMIT keeps only the first OFFSET + LIMIT rows, in a heap, and a LIMIT alone stops pulling rows (and so
+the scan and the joins producing them) once enough have come out.
+"""
+
+import heapq
+import itertools
+from typing import TypeVar
+
+from myPlanner import join_key_value
+from myTypes import *
+
+T = TypeVar('T')
+
+
+class Descending:
+    """Component of a sort key that orders its value in reverse"""
+
+    __slots__ = ('key',)
+
+    def __init__(self, key: tuple):
+        self.key = key
+
+    def __lt__(self, other: 'Descending') -> bool:
+        return other.key < self.key
+
+    def __eq__(self, other) -> bool:
+        return self.key == other.key
+
+
+def value_key(value: Value | float) -> tuple:
+    # NULL sorts first, and is never compared with a value
+    return (value is not None, join_key_value(value))
+
+
+def order_rows(rows: Iterable[T], key_getters: list[Callable[[T], Value | float]], descending: list[bool],
+               limit: int | None, offset: int) -> Iterator[T]:
+    """The rows sorted on the values the key getters take from them (each getter in reverse if descending), then
+    without the first offset rows and after limit rows (if not None). Equal rows keep their order.
+
+    Without key getters the rows are not sorted, and are only pulled from the iterable as they are needed.
+    """
+    if key_getters:
+        # If every key is descending, the whole order is reversed instead
+        reverse = all(descending)
+        if reverse or not any(descending):
+            def key(row: T) -> tuple:
+                return tuple([value_key(get(row)) for get in key_getters])
+        else:
+            def key(row: T) -> tuple:
+                return tuple([Descending(value_key(get(row))) if desc else value_key(get(row))
+                              for get, desc in zip(key_getters, descending)])
+        if limit is not None:
+            # Only the first offset + limit rows are ever kept
+            rows = (heapq.nlargest if reverse else heapq.nsmallest)(offset + limit, rows, key=key)
+        else:
+            rows = sorted(rows, key=key, reverse=reverse)
+    return itertools.islice(rows, offset, None if limit is None else offset + limit)
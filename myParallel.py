@@ -0,0 +1,184 @@
+"""Parallel scans: the WHERE conjuncts over one large table evaluated by worker processes, each on a range of rows.
+
+The rows are not sent to the workers. The columnar copy of the table (see myColumns) is copied once into a shared memory
+block, which every worker maps; a task is the name of the block, the conjuncts and a row range, and its answer the row
+ids of the matching rows. The copy is kept until the columnar table changes.
+
+Workers are forked (where the platform can fork), so that they start without importing the main script again, which
+for run.py would run the prompt. A fork copies only the thread calling it, so a process running threads forks them with
+start_worker_pool before starting any; run.py, which runs none, forks them at its first parallel scan.
+"""
+
+import multiprocessing
+import os
+import threading
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from lark import Tree
+
+from myColumns import COLUMN_BATCH_ROWS, ColumnarTable, ColumnCondition
+from myRow import row_class
+from myTable import Table
+from myTypes import *
+from transformers import compile_where
+
+PARALLEL_SCAN_MIN_ROWS: int | None = 200_000  # Tables with fewer rows are scanned by the calling process (None: never)
+PARALLEL_SCAN_WORKERS = os.cpu_count() or 1  # Worker processes, and ranges a table is split into
+
+BufferLayout = list[tuple[int, int, str]]  # (offset, size in bytes, memoryview format) of each buffer in the block
+
+
+class SharedColumnarTable:
+    """Copy of a columnar table in a shared memory block, unlinked when the copy is garbage collected"""
+
+    def __init__(self, columnar: ColumnarTable):
+        buffers = [memoryview(buffer) for buffer in columnar.buffers()]
+        self.layout: BufferLayout = []
+        offset = 0
+        for buffer in buffers:
+            self.layout.append((offset, buffer.nbytes, buffer.format))
+            offset += buffer.nbytes
+        self.num_rows = len(columnar)
+        self.version = columnar.version
+        self.memory = SharedMemory(create=True, size=max(offset, 1))
+        for buffer, (offset, size, _) in zip(buffers, self.layout):
+            self.memory.buf[offset:offset + size] = buffer.cast('B')
+        weakref.finalize(self, _unlink, self.memory)
+
+
+def _unlink(memory: SharedMemory):
+    memory.close()
+    memory.unlink()
+
+
+_shared_tables: weakref.WeakKeyDictionary[ColumnarTable, SharedColumnarTable] = weakref.WeakKeyDictionary()
+_shared_tables_lock = threading.Lock()  # Statements of the server scan from several threads
+_pool: ProcessPoolExecutor | None = None
+_forks_lazily = True  # Whether worker_pool may start the workers (see start_worker_pool)
+
+
+def shared_columnar_table(columnar: ColumnarTable) -> SharedColumnarTable:
+    """The shared memory copy of the columnar table, made again if the columnar table has changed since"""
+    with _shared_tables_lock:
+        shared = _shared_tables.get(columnar)
+        if shared is None or shared.version != columnar.version:
+            shared = _shared_tables[columnar] = SharedColumnarTable(columnar)
+        return shared
+
+
+def worker_pool() -> ProcessPoolExecutor | None:
+    """The pool of worker processes, started on first use unless start_worker_pool has been called. None if parallel
+    scans are disabled or cannot fork."""
+    global _pool
+    if PARALLEL_SCAN_WORKERS < 2 or 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    with _shared_tables_lock:
+        if _pool is None and _forks_lazily:
+            # The workers share the resource tracker that unlinks the shared memory blocks left over at exit
+            resource_tracker.ensure_running()
+            _pool = ProcessPoolExecutor(PARALLEL_SCAN_WORKERS, mp_context=multiprocessing.get_context('fork'))
+        return _pool
+
+
+def start_worker_pool():
+    """Fork the worker processes now, for a process about to start threads (such as the server). A lock another thread
+    held at a later fork would stay held forever in the workers. Parallel scans do not start workers afterwards: if one
+    dies, or after shutdown_worker_pool, tables are scanned by the calling process."""
+    global _forks_lazily
+    pool = worker_pool() if PARALLEL_SCAN_MIN_ROWS is not None else None
+    _forks_lazily = False
+    if pool is not None:
+        pool.submit(int).result()  # A pool with the fork start method starts all its workers at the first task
+
+
+def shutdown_worker_pool():
+    """Stop the worker processes. The next parallel scan starts new ones (e.g. with another PARALLEL_SCAN_WORKERS),
+    unless start_worker_pool has been called."""
+    global _pool
+    with _shared_tables_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def parallel_scan(table_name: TableName, table: Table, conjuncts: list[Tree],
+                  conditions: list[ColumnCondition | None],
+                  table_columns: dict[TableName, list[ColumnName]]) -> list[RowId] | None:
+    """Row ids (in row id order) of the rows of the table satisfying all the conjuncts, which only reference it (by
+    table_name). conditions has the column condition equivalent to each conjunct, if any (see as_column_condition),
+    evaluated on the column vectors rather than row by row.
+
+    None if the table has fewer than PARALLEL_SCAN_MIN_ROWS rows, if there is no worker pool or columnar copy of the
+    table, or if a task failed: the caller scans the table itself then (and raises the error of the WHERE clause, if
+    that was the failure).
+    """
+    global _pool
+    if PARALLEL_SCAN_MIN_ROWS is None or len(table) < PARALLEL_SCAN_MIN_ROWS or not conjuncts:
+        return None
+    columnar = table.columnar()
+    if columnar is None:
+        return None
+    shared = shared_columnar_table(columnar)
+    pool = worker_pool()
+    if pool is None:
+        return None
+
+    column_conditions = [condition for condition in conditions if condition is not None]
+    row_conjuncts = [conjunct for conjunct, condition in zip(conjuncts, conditions) if condition is None]
+    # Ranges of whole batches of rows
+    range_rows = -(-shared.num_rows // PARALLEL_SCAN_WORKERS // COLUMN_BATCH_ROWS) * COLUMN_BATCH_ROWS
+    starts = range(0, shared.num_rows, range_rows)
+    try:
+        results = list(pool.map(_scan_range, *zip(*[
+            (shared.memory.name, shared.layout, table.schema, table_name, column_conditions, row_conjuncts,
+             table_columns, start, min(start + range_rows, shared.num_rows)) for start in starts])))
+    except BrokenProcessPool:
+        with _shared_tables_lock:
+            _pool = None  # A worker died; the next scan starts a new pool (see worker_pool)
+        return None
+    if any(row_ids is None for row_ids in results):
+        return None
+    return [row_id for row_ids in results for row_id in row_ids]
+
+
+def _scan_range(memory_name: str, layout: BufferLayout, schema: TableSchema, table_name: TableName,
+                conditions: list[ColumnCondition], conjuncts: list[Tree],
+                table_columns: dict[TableName, list[ColumnName]], start: int, stop: int) -> array | None:
+    """Task of a worker: row ids of the matching rows at positions start to stop. None if evaluating raised."""
+    memory = SharedMemory(memory_name)
+    try:
+        row_ids = _filter_shared(memory, layout, schema, table_name, conditions, conjuncts, table_columns, start, stop)
+    except Exception:
+        row_ids = None
+    # The views of the block have been released with the frame of _filter_shared
+    memory.close()
+    return row_ids
+
+
+def _filter_shared(memory: SharedMemory, layout: BufferLayout, schema: TableSchema, table_name: TableName,
+                   conditions: list[ColumnCondition], conjuncts: list[Tree],
+                   table_columns: dict[TableName, list[ColumnName]], start: int, stop: int) -> array:
+    columnar = ColumnarTable.from_buffers(schema, (memory.buf[offset:offset + size].cast(buffer_format)
+                                                   for offset, size, buffer_format in layout))
+    positions: Iterable[int] = columnar.filter_positions(conditions, start, stop)
+    if conjuncts:
+        filters = [compile_where(conjunct, table_columns) for conjunct in conjuncts]
+        make_row = row_class(tuple(schema['columns']))
+        # Rows are made of the values of the columns the conjuncts reference; the other columns are left NULL
+        referenced = {node.children[1] for conjunct in conjuncts for node in conjunct.iter_subtrees()
+                      if node.data == 'null_predicate' or (node.data == 'comp_operand' and len(node.children) == 2)}
+        getters = [vector.__getitem__ if column_name in referenced else _null
+                   for column_name, vector in columnar.columns.items()]
+        positions = [position for position in positions
+                     if all(where({table_name: make_row(*[get(position) for get in getters])}) is True
+                            for where in filters)]
+    return array('q', map(columnar.row_ids.__getitem__, positions))
+
+
+def _null(position: int) -> None:
+    return None
@@ -0,0 +1,422 @@
+"""Evaluation of the FROM and WHERE parts of a select query"""
+
+from lark import Tree
+
+import myColumns
+from myColumns import ColumnCondition
+from myMsgs import WhereIncomparableError
+from myParallel import parallel_scan
+from myTable import Table
+from myTypes import *
+from transformers import WhereClauseCompiler, WherePredicate, compile_where
+
+EquiJoin = tuple[TableName, ColumnName, TableName, ColumnName]  # t1.c1 = t2.c2
+IndexScan = tuple[IndexName, Literal['lt', 'gt', 'eq', 'gte', 'lte', 'is_null'], Value]
+TableRows = dict[TableName, TableRow]  # One row per table (or alias), i.e. one combination of the Cartesian product
+JoinKey = tuple[TableName, Callable[[TableRow], Value], Callable[[TableRow], Value]]  # See hash_join
+
+
+def split_conjuncts(node: Tree) -> list[Tree]:
+    """Split a where clause into the sub-expressions that are AND-ed at its top level"""
+    if node.data == 'where_clause':
+        return split_conjuncts(node.children[1])
+    if node.data == 'boolean_expr':
+        boolean_terms = node.children[::2]
+        if len(boolean_terms) == 1:
+            return split_conjuncts(boolean_terms[0])
+    elif node.data == 'boolean_term':
+        return [conjunct for boolean_factor in node.children[::2] for conjunct in split_conjuncts(boolean_factor)]
+    elif node.data == 'boolean_factor' and node.children[0] is None:  # No NOT
+        boolean_test = node.children[1].children[0]
+        if boolean_test.data == 'parenthesized_boolean_expr':
+            return split_conjuncts(boolean_test.children[1])
+    return [node]
+
+
+def referenced_tables(where_clause: WhereClause, table_columns: dict[TableName, list[ColumnName]]) -> set[TableName]:
+    """Tables whose columns the (part of a) where clause references.
+
+    Raises the error of the first column reference that cannot be resolved.
+    """
+    compiler = WhereClauseCompiler(table_columns)
+    tables: set[TableName] = set()
+    for node in where_clause.iter_subtrees_topdown():
+        if node.data == 'null_predicate' or (node.data == 'comp_operand' and len(node.children) == 2):
+            tables.add(compiler.resolve_column(node.children[0], node.children[1]))
+    return tables
+
+
+def as_equi_join(conjunct: Tree, table_columns: dict[TableName, list[ColumnName]]) -> EquiJoin | None:
+    """If the conjunct is an equality between columns of two different tables, return those columns"""
+    if conjunct.data != 'boolean_factor' or conjunct.children[0] is not None:
+        return None
+    predicate = conjunct.children[1].children[0]
+    if predicate.data != 'predicate':
+        return None
+    comparison = predicate.children[0]
+    if comparison.data != 'comparison_predicate' or comparison.children[1].data != 'eq':
+        return None
+    left, right = comparison.children[0], comparison.children[2]
+    if len(left.children) != 2 or len(right.children) != 2:
+        return None  # At least one operand is a value
+    try:
+        compiler = WhereClauseCompiler(table_columns)
+        left_table = compiler.resolve_column(*left.children)
+        right_table = compiler.resolve_column(*right.children)
+    except Exception:
+        return None  # Leave it to the compiled predicate, which raises the error when evaluated
+    if left_table == right_table:
+        return None
+    return left_table, left.children[1], right_table, right.children[1]
+
+
+_FLIPPED_OPERATORS = {'lt': 'gt', 'gt': 'lt', 'lte': 'gte', 'gte': 'lte', 'eq': 'eq', 'neq': 'neq'}
+_ORDERING_OPERATORS = ('lt', 'gt', 'lte', 'gte')
+_INDEXABLE_TYPES = {'int': int, 'char': str, 'date': datetime}
+
+
+def check_where_clause(where_clause: WhereClause, table_schemas: dict[TableName, TableSchema]):
+    """Raise the error the where clause would raise on some row, whatever the rows: the error of the first column
+    reference that cannot be resolved, or else WhereIncomparableError if it orders values of different types (equality
+    between them is False instead).
+
+    Conjuncts are evaluated up to the first false one, and only on the rows the indexes, filters and joins leave, so
+    this is checked against the schemas before any row is read.
+    """
+    table_columns = {t: list(schema['columns']) for t, schema in table_schemas.items()}
+    referenced_tables(where_clause, table_columns)
+    compiler = WhereClauseCompiler(table_columns)
+
+    def operand_type(operand: Tree) -> type | None:
+        if len(operand.children) == 1:
+            value = compiler.comparable_value(operand.children[0].children)
+            return None if value is None else type(value)  # NULL compares as Unknown
+        table = compiler.resolve_column(*operand.children)
+        return _INDEXABLE_TYPES[table_schemas[table]['columns'][operand.children[1]]['data_type']]
+
+    for node in where_clause.iter_subtrees_topdown():
+        if node.data == 'comparison_predicate' and node.children[1].data in _ORDERING_OPERATORS:
+            left, right = operand_type(node.children[0]), operand_type(node.children[2])
+            if left is not None and right is not None and left is not right:
+                raise WhereIncomparableError()
+
+
+def as_column_condition(conjunct: Tree, table: TableName, schema: TableSchema,
+                        table_columns: dict[TableName, list[ColumnName]]) -> ColumnCondition | None:
+    """If the conjunct compares a column of the table with a value of the column's type, or checks whether the
+    column IS [NOT] NULL, return it as (column, comparison, value)"""
+    if conjunct.data != 'boolean_factor' or conjunct.children[0] is not None:
+        return None
+    predicate = conjunct.children[1].children[0]
+    if predicate.data != 'predicate':
+        return None
+    node = predicate.children[0]
+    compiler = WhereClauseCompiler(table_columns)
+    if node.data == 'null_predicate':
+        (column_table, column_name), value = node.children[:2], None
+        comparison = 'is_null' if node.children[2].children[1] is None else 'is_not_null'
+    else:
+        comparison = node.children[1].data
+        left, right = node.children[0], node.children[2]
+        if len(left.children) == 2 and len(right.children) == 1:
+            (column_table, column_name), literal = left.children, right.children[0]
+        elif len(left.children) == 1 and len(right.children) == 2:
+            (column_table, column_name), literal = right.children, left.children[0]
+            comparison = _FLIPPED_OPERATORS[comparison]
+        else:
+            return None
+        value = compiler.comparable_value(literal.children)
+    try:
+        if compiler.resolve_column(column_table, column_name) != table:
+            return None
+    except Exception:
+        return None  # Leave it to the compiled predicate, which raises the error when evaluated
+    # Values of other types are left to the predicate (NULL compares as Unknown, other types can't be compared)
+    data_type = schema['columns'][column_name]['data_type']
+    if comparison not in ('is_null', 'is_not_null') and not isinstance(value, _INDEXABLE_TYPES[data_type]):
+        return None
+    return column_name, comparison, value
+
+
+def as_index_scan(conjunct: Tree, table: TableName, schema: TableSchema,
+                  table_columns: dict[TableName, list[ColumnName]]) -> IndexScan | None:
+    """If the conjunct compares an indexed column of the table with a value, or checks that it IS NULL, return the
+    index scan that finds the rows satisfying it"""
+    indexed_columns = {column: index for index, column in schema.get('indexes', {}).items()}
+    if not indexed_columns:
+        return None
+    condition = as_column_condition(conjunct, table, schema, table_columns)
+    if condition is None or condition[0] not in indexed_columns or condition[1] in ('neq', 'is_not_null'):
+        return None
+    column_name, comp_operator, value = condition
+    return indexed_columns[column_name], comp_operator, value
+
+
+def index_row_ids(my_db, table: TableName, schema: TableSchema, conjuncts: list[Tree],
+                  table_columns: dict[TableName, list[ColumnName]]) -> list[RowId] | None:
+    """Row ids (in row id order) of the rows of the table that may satisfy all the conjuncts, found through an index.
+
+    Equality and IS NULL scans are preferred over range scans. None if no conjunct can use an index.
+    """
+    index_scans = [index_scan for index_scan in (as_index_scan(conjunct, table, schema, table_columns)
+                                                 for conjunct in conjuncts) if index_scan is not None]
+    if not index_scans:
+        return None
+    index_name, comp_operator, value = min(index_scans, key=lambda index_scan: index_scan[1] not in ('eq', 'is_null'))
+    return sorted(my_db.scan_index(index_name, comp_operator, value))
+
+
+def candidate_rows(my_db, table_name: TableName, schema: TableSchema, table: Table,
+                   where_clause: WhereClause | None) -> Iterable[tuple[RowId, TableRow]]:
+    """Rows of a single table that may satisfy the where clause (all rows, unless an index or a parallel scan narrows
+    them down).
+
+    The where clause still has to be evaluated on every candidate.
+    """
+    if where_clause is None:
+        return table.items()
+    # The errors of the where clause fail the statement whatever the rows, before an index narrows them down
+    check_where_clause(where_clause, {table_name: schema})
+    if len(table) == 0:
+        return table.items()
+    table_columns = {table_name: list(schema['columns'])}
+    conjuncts = split_conjuncts(where_clause)
+    row_ids = index_row_ids(my_db, table_name, schema, conjuncts, table_columns)
+    if row_ids is None:
+        row_ids = parallel_scan(table_name, table, conjuncts, [
+            as_column_condition(conjunct, table_name, schema, table_columns) for conjunct in conjuncts], table_columns)
+    if row_ids is None:
+        return table.items()
+    return [(row_id, table[row_id]) for row_id in row_ids]
+
+
+def join_key_value(value: Value) -> Value:
+    # Strings are compared case-insensitively
+    return value.lower() if isinstance(value, str) else value
+
+
+def nested_loop_join(partials: Iterable[TableRows], table: TableName, rows: list[TableRow]) -> Iterator[TableRows]:
+    for partial in partials:
+        for row in rows:
+            yield {**partial, table: row}
+
+
+def hash_join(partials: Iterable[TableRows], table: TableName, rows: list[TableRow],
+              keys: list[JoinKey]) -> Iterator[TableRows]:
+    """Join rows of the table (build side) to the partial combinations (probe side) on equal keys.
+
+    keys lists (joined table, getter of the joined column, getter of the column of the table) of the columns that must
+    be equal. NULL never matches.
+    """
+    buckets: dict[tuple[Value, ...], list[TableRow]] = {}
+    for row in rows:
+        key = tuple([join_key_value(get_value(row)) for (_, _, get_value) in keys])
+        if None not in key:
+            buckets.setdefault(key, []).append(row)
+
+    for partial in partials:
+        key = tuple([join_key_value(get_joined(partial[joined_table])) for (joined_table, get_joined, _) in keys])
+        for row in buckets.get(key, ()):
+            yield {**partial, table: row}
+
+
+def hash_join_build_partials(partials: Iterable[TableRows], table: TableName, rows: list[TableRow],
+                             keys: list[JoinKey]) -> Iterator[TableRows]:
+    """Same as hash_join, but builds the hash table on the partial combinations and probes it with the rows"""
+    buckets: dict[tuple[Value, ...], list[TableRows]] = {}
+    for partial in partials:
+        key = tuple([join_key_value(get_joined(partial[joined_table])) for (joined_table, get_joined, _) in keys])
+        if None not in key:
+            buckets.setdefault(key, []).append(partial)
+
+    for row in rows:
+        key = tuple([join_key_value(get_value(row)) for (_, _, get_value) in keys])
+        for partial in buckets.get(key, ()):
+            yield {**partial, table: row}
+
+
+def join_keys(table: TableName, joined: Iterable[TableName],
+              equi_joins: list[EquiJoin]) -> list[tuple[TableName, ColumnName, ColumnName]]:
+    """(joined table, joined column, column of the table) pairs of the equi-joins between the table and joined ones"""
+    keys: list[tuple[TableName, ColumnName, ColumnName]] = []
+    for (t1, c1, t2, c2) in equi_joins:
+        if t1 == table and t2 in joined:
+            keys.append((t2, c2, c1))
+        elif t2 == table and t1 in joined:
+            keys.append((t1, c1, c2))
+    return keys
+
+
+def choose_join_order(table_rows: dict[TableName, list[TableRow]], equi_joins: list[EquiJoin],
+                      table_stats: dict[TableName, TableStats]) -> tuple[list[TableName], set[TableName]]:
+    """Greedy join ordering from the statistics collected by ANALYZE.
+
+    Starts from the smallest (filtered) table, then repeatedly joins the table that keeps the estimated intermediate
+    result smallest, preferring tables connected by an equi-join over Cartesian products. The size of an equi-join is
+    estimated as |left| * |right| / max(distinct left, distinct right), with distinct counts scaled to the filtered row
+    counts. Returns the join order and the tables whose hash join should be built on the intermediate result (because
+    it is estimated to be smaller than the table) instead of on the table.
+    """
+    sizes = {t: len(rows) for t, rows in table_rows.items()}
+
+    def distinct(t: TableName, c: ColumnName) -> float:
+        stats = table_stats[t]
+        if stats['row_count'] == 0:
+            return max(1, sizes[t])
+        return max(1.0, min(sizes[t], stats['distinct_counts'].get(c, 0) * sizes[t] / stats['row_count']))
+
+    remaining = list(table_rows)  # Ties are broken by FROM order
+    first = min(remaining, key=lambda t: sizes[t])
+    remaining.remove(first)
+    join_order = [first]
+    build_on_partials: set[TableName] = set()
+    estimate: float = sizes[first]
+    while remaining:
+        candidates = []
+        for t in remaining:
+            keys = join_keys(t, join_order, equi_joins)
+            selectivity = 1.0
+            for (joined_table, joined_column, column) in keys:
+                selectivity = min(selectivity, 1 / max(distinct(joined_table, joined_column), distinct(t, column)))
+            candidates.append((not keys, estimate * sizes[t] * selectivity, t))
+        _, next_estimate, table = min(candidates, key=lambda candidate: candidate[:2])
+        if join_keys(table, join_order, equi_joins) and estimate < sizes[table]:
+            build_on_partials.add(table)
+        remaining.remove(table)
+        join_order.append(table)
+        estimate = max(1.0, next_estimate)
+    return join_order, build_on_partials
+
+
+def filter_table(my_db, t: TableName, table: Table, schema: TableSchema, conjuncts: list[Tree],
+                 table_columns: dict[TableName, list[ColumnName]]) -> list[TableRow]:
+    """Rows of a table satisfying all the conjuncts (which only reference that table), in row id order (see
+    scan_table)"""
+    return list(scan_table(my_db, t, table, schema, conjuncts, table_columns))
+
+
+def scan_table(my_db, t: TableName, table: Table, schema: TableSchema, conjuncts: list[Tree],
+               table_columns: dict[TableName, list[ColumnName]]) -> Iterable[TableRow]:
+    """Rows of a table satisfying all the conjuncts (which only reference that table), in row id order. Rows evaluated
+    row by row are produced as they are found.
+
+    The rows are read through an index if a conjunct allows it. Otherwise, a table of at least PARALLEL_SCAN_MIN_ROWS
+    rows is scanned by worker processes (see parallel_scan). Else, for a table of at least COLUMNAR_MIN_ROWS rows, the
+    conjuncts that compare a column with a value are evaluated on the columnar copy of the table, in batches. The
+    remaining conjuncts are evaluated row by row.
+    """
+    row_ids = index_row_ids(my_db, t, schema, conjuncts, table_columns)
+    conditions = [as_column_condition(conjunct, t, schema, table_columns) for conjunct in conjuncts]
+    if row_ids is None:
+        row_ids = parallel_scan(t, table, conjuncts, conditions, table_columns)
+        if row_ids is not None:  # All conjuncts have been evaluated
+            return [table[row_id] for row_id in row_ids]
+        rows = table.values()
+        if myColumns.COLUMNAR_MIN_ROWS is not None and len(table) >= myColumns.COLUMNAR_MIN_ROWS:
+            columnar = table.columnar() if any(conditions) else None
+            if columnar is not None:
+                rows = map(table.__getitem__, columnar.filter([c for c in conditions if c is not None]))
+                conjuncts = [conjunct for conjunct, condition in zip(conjuncts, conditions) if condition is None]
+    else:
+        rows = [table[row_id] for row_id in row_ids]
+    filters = [compile_where(conjunct, table_columns) for conjunct in conjuncts]
+    if not filters:
+        return rows
+    return (row for row in rows if all(where({t: row}) is True for where in filters))
+
+
+def filter_combinations(combinations: Iterable[TableRows], filters: list[WherePredicate]) -> Iterator[TableRows]:
+    for combination in combinations:
+        if all(where(combination) is True for where in filters):
+            yield combination
+
+
+def join_rows(my_db, table_dict: dict[TableName, Table], table_schemas: dict[TableName, TableSchema],
+              where_clause: WhereClause | None, table_stats: dict[TableName, TableStats] | None = None
+              ) -> Iterator[TableRows]:
+    """Combinations of rows of the tables that satisfy the where clause.
+
+    table_dict and table_schemas are keyed by the names the query uses for the tables (aliases, if given).
+
+    The where clause is split into its AND-ed conjuncts. Conjuncts over a single table filter the rows of that table
+    (read through an index if one of them allows it) before any join; equality conjuncts between two tables are
+    evaluated as hash joins; the other conjuncts are checked as soon as all the tables they reference have been joined.
+
+    If table_stats has statistics of every table, the join order and hash join build sides are chosen from them (see
+    choose_join_order). Otherwise, and always for a single table, combinations come out in the order of the Cartesian
+    product (the first table varying fastest).
+    """
+    if where_clause is not None:
+        # The errors of the where clause fail the query whatever the rows, even if the tables are empty or the filters
+        # and joins leave no combination to evaluate
+        check_where_clause(where_clause, table_schemas)
+    if any(len(table) == 0 for table in table_dict.values()):
+        return  # Nothing to evaluate the where clause on
+
+    table_columns = {t: list(schema['columns']) for t, schema in table_schemas.items()}
+    equi_joins: list[EquiJoin] = []
+    table_conjuncts: dict[TableName, list[Tree]] = {t: [] for t in table_dict}
+    join_filters: list[tuple[set[TableName], WherePredicate]] = []  # Conjuncts over several tables (or none)
+    if where_clause is not None:
+        for conjunct in split_conjuncts(where_clause):
+            equi_join = as_equi_join(conjunct, table_columns)
+            if equi_join is not None:
+                equi_joins.append(equi_join)
+                continue
+            tables = referenced_tables(conjunct, table_columns)
+            if len(tables) == 1:
+                table_conjuncts[tables.pop()].append(conjunct)
+            else:
+                join_filters.append((tables, compile_where(conjunct, table_columns)))
+
+    # Filter each table before joining. A single table is scanned as its rows are consumed, so that a LIMIT stops the
+    # scan once enough rows have been found.
+    scan = scan_table if len(table_dict) == 1 else filter_table
+    table_rows: dict[TableName, Iterable[TableRow]] = {
+        t: scan(my_db, t, table, table_schemas[t], table_conjuncts[t], table_columns)
+        for t, table in table_dict.items()}
+
+    if len(table_rows) > 1 and table_stats is not None and all(t in table_stats for t in table_rows):
+        join_order, build_on_partials = choose_join_order(table_rows, equi_joins, table_stats)
+    else:
+        # The last table is the outermost loop, so that the first table varies fastest
+        join_order, build_on_partials = list(table_rows)[::-1], set()
+
+    combinations: Iterable[TableRows] = ({join_order[0]: row} for row in table_rows[join_order[0]])
+    joined: set[TableName] = set()
+    for table in join_order:
+        if joined:
+            keys = [(joined_table, table_dict[joined_table].row_class.getter(joined_column),
+                     table_dict[table].row_class.getter(column))
+                    for (joined_table, joined_column, column) in join_keys(table, joined, equi_joins)]
+            if keys and table in build_on_partials:
+                combinations = hash_join_build_partials(combinations, table, table_rows[table], keys)
+            elif keys:
+                combinations = hash_join(combinations, table, table_rows[table], keys)
+            else:
+                combinations = nested_loop_join(combinations, table, table_rows[table])
+        joined.add(table)
+
+        # Check the conjuncts whose tables have all been joined now
+        ready = [where for (tables, where) in join_filters if tables <= joined]
+        if ready:
+            combinations = filter_combinations(combinations, ready)
+            join_filters = [(tables, where) for (tables, where) in join_filters if not tables <= joined]
+
+    yield from combinations
+
+
+def index_ordered_rows(my_db, t: TableName, table: Table, schema: TableSchema, where_clause: WhereClause | None,
+                       index_name: IndexName, descending: bool) -> Iterator[TableRows]:
+    """Combinations of the rows of a single table that satisfy the where clause, in the order of the column of the
+    index (see MyDB.scan_index_ordered). The index is read as the combinations are consumed."""
+    where = None
+    if where_clause is not None:
+        check_where_clause(where_clause, {t: schema})  # The errors of the where clause fail the query, as in join_rows
+        where = compile_where(where_clause, {t: list(schema['columns'])})
+    if len(table) == 0:
+        return
+    for row_id in my_db.scan_index_ordered(index_name, descending):
+        combination = {t: table[row_id]}
+        if where is None or where(combination) is True:
+            yield combination
@@ -0,0 +1,103 @@
+"""Compact row records with one slot per column"""
+
+from operator import attrgetter
+
+from myTypes import *
+
+
+class Row:
+    """A row of a table: a record with one slot per column, in the order of the table's columns.
+
+    Each list of columns has its own subclass, made by row_class. Code on hot paths reads values through getters by
+    column offset (see getter and values). row[column], row[column] = value, column in row, keys, values and items
+    behave as on the dict a row used to be, for the rest of the code.
+    """
+
+    __slots__ = ()
+    columns: tuple[ColumnName, ...] = ()
+    _slot_of: dict[ColumnName, str] = {}
+    _get_values: Callable[['Row'], tuple[Value, ...]]
+
+    @classmethod
+    def getter(cls, column: ColumnName) -> Callable[['Row'], Value]:
+        return attrgetter(cls._slot_of[column])
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping[ColumnName, Value]) -> 'Row':
+        return cls(*[mapping[column] for column in cls.columns])
+
+    def __getitem__(self, column: ColumnName) -> Value:
+        return getattr(self, self._slot_of[column])
+
+    def __setitem__(self, column: ColumnName, value: Value):
+        setattr(self, self._slot_of[column], value)
+
+    def __contains__(self, column: ColumnName) -> bool:
+        return column in self._slot_of
+
+    def __iter__(self) -> Iterator[ColumnName]:
+        return iter(self.columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def keys(self) -> tuple[ColumnName, ...]:
+        return self.columns
+
+    def values(self) -> tuple[Value, ...]:
+        """Values in the order of the columns"""
+        return self._get_values(self)
+
+    def items(self) -> Iterator[tuple[ColumnName, Value]]:
+        return zip(self.columns, self.values())
+
+    def with_value(self, column: ColumnName, value: Value) -> 'Row':
+        """Copy of the row with the value in the column"""
+        row = type(self)(*self.values())
+        row[column] = value
+        return row
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Row):
+            return self.columns == other.columns and self.values() == other.values()
+        if isinstance(other, dict):
+            return dict(self.items()) == other
+        return NotImplemented
+
+    __hash__ = None  # Mutable, as a dict
+
+    def __repr__(self) -> str:
+        return f'Row({dict(self.items())!r})'
+
+    def __reduce__(self):
+        return _make_row, (self.columns, self.values())
+
+
+_ROW_CLASSES: dict[tuple[ColumnName, ...], type[Row]] = {}
+
+
+def row_class(columns: tuple[ColumnName, ...]) -> type[Row]:
+    """Row subclass of the columns (made on first use)"""
+    cls = _ROW_CLASSES.get(columns)
+    if cls is None:
+        slots = tuple(f'_{i}' for i in range(len(columns)))  # Column names may clash with the methods
+        namespace: dict[str, Any] = {'__slots__': slots, 'columns': columns, '_slot_of': dict(zip(columns, slots))}
+        if len(slots) == 1:
+            namespace['_get_values'] = staticmethod(lambda row: (row._0,))
+        else:
+            namespace['_get_values'] = staticmethod(attrgetter(*slots))
+        # The constructor takes the values in column order and is generated (as namedtuple and dataclass ones are), so
+        # that making a row costs a single call
+        source = f"def __init__(self, {', '.join(slots)}):\n" + ''.join(f'    self.{slot} = {slot}\n' for slot in slots)
+        exec(source, namespace)
+        # Another thread may have made the class meanwhile: there is one class per columns
+        cls = _ROW_CLASSES.setdefault(columns, type('Row', (Row,), namespace))
+    return cls
+
+
+def schema_row_class(schema: TableSchema) -> type[Row]:
+    return row_class(tuple(schema['columns']))
+
+
+def _make_row(columns: tuple[ColumnName, ...], values: tuple[Value, ...]) -> Row:
+    return row_class(columns)(*values)
@@ -0,0 +1,191 @@
+"""Statement splitting and parsing: the parsed-statement cache, batches and prepared statements with '?' placeholders"""
+
+import re
+from functools import lru_cache
+
+from lark import Lark, Token, Tree
+from lark.exceptions import UnexpectedInput
+
+from myMsgs import ParameterCountError, UnexpectedParameterError
+from myTypes import *
+
+PARSE_CACHE_SIZE = 256  # Parsed statements kept by StatementParser
+
+_QUOTED = re.compile(r"""('[^']*'|"[^"]*")""")
+_STATEMENT_DELIMITERS = re.compile(r"""[;'"]""")
+
+
+class Parameter:
+    """'?' placeholder for a value of an INSERT or UPDATE, at a position of the statement text. Placeholders in a
+    where clause stay PARAM tokens of the where clause tree."""
+
+    __slots__ = ('position',)
+
+    def __init__(self, position: int):
+        self.position = position
+
+    def __repr__(self) -> str:
+        return f'Parameter({self.position})'
+
+
+class PreparedStatement:
+    """A parsed statement and the text positions of its placeholders, in order"""
+
+    def __init__(self, query: Query, positions: list[int]):
+        self.query = query
+        self.positions = positions
+
+    def bind(self, values: ValueList) -> Query:
+        """The statement with the values in place of its placeholders, without parsing it again"""
+        if len(values) != len(self.positions):
+            raise ParameterCountError(len(self.positions), len(values))
+        if not values:
+            return self.query
+        return _bind(self.query, dict(zip(self.positions, values)))
+
+
+def normalize_statement(text: str) -> str:
+    """The statement with runs of whitespace outside of quotes collapsed to one space"""
+    parts = _QUOTED.split(text)
+    parts[::2] = [' '.join(part.split()) for part in parts[::2]]
+    return ''.join(parts).strip()
+
+
+class StatementParser:
+    """Parses statements, keeping the PARSE_CACHE_SIZE most recently used ones by their normalized text.
+
+    Cached queries are shared between executions, so they must not be modified.
+    """
+
+    def __init__(self, parser: Lark, cache_size: int = PARSE_CACHE_SIZE):
+        self.parser = parser
+        self._parse_normalized = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, text: str) -> Query:
+        parsed_tree = self.parser.parse(text)
+        assert (isinstance(parsed_tree, list))  # To bypass type hint error
+        return _checked_query(parsed_tree[0])
+
+    def parse(self, text: str) -> Query:
+        """The query of a statement (with its ';'). A PREPARE query has a PreparedStatement in place of the
+        statement. Raises lark's UnexpectedInput on a syntax error, and UnexpectedParameterError on a placeholder
+        outside of PREPARE."""
+        return self._parse_normalized(normalize_statement(text))
+
+    def parse_batch(self, statements: list[str]) -> list[Query | Exception]:
+        """The query of each statement, or the error parsing it. The statements are parsed together, as one
+        query_list, unless one of them has an error. They are not cached."""
+        try:
+            parsed_tree = self.parser.parse(''.join(statements))
+            assert (isinstance(parsed_tree, list))  # To bypass type hint error
+            return [_checked_query(query) for query in parsed_tree]
+        except (UnexpectedInput, UnexpectedParameterError):
+            pass
+        # Parse them one by one to find the statements in error
+        queries: list[Query | Exception] = []
+        for statement in statements:
+            try:
+                queries.append(self.parse(statement))
+            except (UnexpectedInput, UnexpectedParameterError) as e:
+                queries.append(e)
+        return queries
+
+    def cache_info(self):
+        return self._parse_normalized.cache_info()
+
+
+def _checked_query(query: Query) -> Query:
+    """The query with the PreparedStatement of a PREPARE. Raises UnexpectedParameterError on a placeholder elsewhere."""
+    if query != 'exit' and query[0] == 'prepare':
+        return query[:2] + (PreparedStatement(query[2], placeholder_positions(query[2])),)
+    elif placeholder_positions(query):
+        raise UnexpectedParameterError()
+    return query
+
+
+class StatementSplitter:
+    """Splits a text fed in chunks (e.g. lines) into statements, each up to its ';'. A ';' within quotes does not end
+    a statement."""
+
+    def __init__(self):
+        self.pending = ''  # Text of the statement being read
+        self._position = 0  # Where to continue scanning pending
+        self._quote: str | None = None  # Quote of the string literal pending ends in
+
+    def feed(self, chunk: str) -> list[str]:
+        """The statements the chunk completes"""
+        statements = []
+        self.pending += chunk
+        while True:
+            if self._quote is not None:
+                end = self.pending.find(self._quote, self._position)
+                if end < 0:
+                    break
+                self._position, self._quote = end + 1, None
+            else:
+                match = _STATEMENT_DELIMITERS.search(self.pending, self._position)
+                if match is None:
+                    break
+                if match.group() == ';':
+                    statements.append(self.pending[:match.end()])
+                    self.pending, self._position = self.pending[match.end():], 0
+                else:
+                    self._position, self._quote = match.end(), match.group()
+        self._position = len(self.pending)
+        return statements
+
+
+def split_statements(chunks: Iterable[str]) -> Iterator[str]:
+    """The statements of a text read in chunks (see StatementSplitter). Text after the last ';' is also yielded if it
+    is not blank, to be reported as a syntax error."""
+    splitter = StatementSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    if splitter.pending.strip():
+        yield splitter.pending
+
+
+def placeholder_positions(node) -> list[int]:
+    """Text positions of the placeholders of a query, in order"""
+    positions = []
+    _collect_positions(node, positions)
+    return sorted(positions)
+
+
+def _collect_positions(node, positions: list[int]):
+    if isinstance(node, Parameter):
+        positions.append(node.position)
+    elif isinstance(node, Token):
+        if node.type == 'PARAM':
+            positions.append(node.start_pos)
+    elif isinstance(node, Tree):
+        for child in node.children:
+            _collect_positions(child, positions)
+    elif isinstance(node, (tuple, list)):
+        for child in node:
+            _collect_positions(child, positions)
+
+
+def _bind(node, values: dict[int, Value]):
+    if isinstance(node, Parameter):
+        return values[node.position]
+    elif isinstance(node, Token):
+        return _literal_token(values[node.start_pos]) if node.type == 'PARAM' else node
+    elif isinstance(node, Tree):
+        return Tree(node.data, [_bind(child, values) for child in node.children])
+    elif isinstance(node, tuple):
+        return tuple(_bind(child, values) for child in node)
+    elif isinstance(node, list):
+        return [_bind(child, values) for child in node]
+    return node
+
+
+def _literal_token(value: Value) -> Token:
+    """Token of a comparable value in a where clause, as if the value had been written in the statement"""
+    if value is None:
+        return Token('NULL', 'null')
+    elif isinstance(value, int):
+        return Token('INT', str(value))
+    elif isinstance(value, datetime):
+        return Token('DATE', value.strftime('%Y-%m-%d'))
+    return Token('STR', f'"{value}"' if "'" in value else f"'{value}'")
@@ -0,0 +1,140 @@
+from myColumns import ColumnarTable
+from myRow import schema_row_class
+from myTypes import *
+
+PrimaryKey = tuple[Value, ...]
+
+
+class Table(dict[RowId, TableRow]):
+    """Rows of a table keyed by row id, together with the in-memory indexes kept on them.
+
+    Rows must be added, removed and modified through add_row, remove_row and set_value so that the indexes stay
+    consistent. Indexes are not persisted; they are rebuilt when the table is loaded.
+
+    A columnar copy of the rows (see columnar) is kept too once it has been built.
+    """
+
+    def __init__(self, schema: TableSchema, rows: Iterable[tuple[RowId, TableRow]] = ()):
+        super().__init__()
+        self.schema = schema
+        self.row_class = schema_row_class(schema)
+        self._columnar: ColumnarTable | None = None
+        # Row id of the next new row: above every row id the table has had, so that a row id is never reused
+        self.next_row_id: RowId = 0
+        self.pkey_cols: list[ColumnName] = schema['primary_key']
+        self._pkey_getters = [self.row_class.getter(col) for col in self.pkey_cols]
+        self.pkey_index: dict[PrimaryKey, RowId] = {}  # Empty if the table has no primary key
+        # Number of rows holding each value of each column of a composite primary key. Foreign keys reference single
+        # primary-key columns, so these answer referential integrity checks. (A single-column key uses pkey_index.)
+        self.pkey_value_counts: dict[ColumnName, dict[Value, int]] = {}
+        if len(self.pkey_cols) > 1:
+            self.pkey_value_counts = {col: {} for col in self.pkey_cols}
+        # Reverse index of each foreign-key column: referenced value -> row ids of the rows holding it (NULLs left out)
+        self.fkey_index: dict[ColumnName, dict[Value, set[RowId]]] = {col: {} for col in schema['foreign_keys']}
+        self._fkey_getters = {col: self.row_class.getter(col) for col in self.fkey_index}
+        for row_id, row in rows:
+            self.add_row(row_id, row)
+
+    def pkey_of(self, row: TableRow) -> PrimaryKey:
+        return tuple([get(row) for get in self._pkey_getters])
+
+    def find_pkey(self, pkey: PrimaryKey) -> RowId | None:
+        """Row id of the row with the given primary key, if any"""
+        return self.pkey_index.get(pkey)
+
+    def has_value(self, column_name: ColumnName, value: Value) -> bool:
+        """Whether any row holds the value in the given primary-key column"""
+        if len(self.pkey_cols) == 1:
+            return (value,) in self.pkey_index
+        return value in self.pkey_value_counts[column_name]
+
+    def find_referencing(self, column_name: ColumnName, value: Value) -> list[RowId]:
+        """Row ids of the rows whose foreign-key column holds the value"""
+        return list(self.fkey_index[column_name].get(value, ()))
+
+    def _index_fkey(self, column_name: ColumnName, value: Value, row_id: RowId):
+        if value is not None:
+            self.fkey_index[column_name].setdefault(value, set()).add(row_id)
+
+    def _unindex_fkey(self, column_name: ColumnName, value: Value, row_id: RowId):
+        if value is not None:
+            row_ids = self.fkey_index[column_name][value]
+            row_ids.discard(row_id)
+            if not row_ids:
+                del self.fkey_index[column_name][value]
+
+    def _count_value(self, column_name: ColumnName, value: Value, delta: int):
+        counts = self.pkey_value_counts[column_name]
+        count = counts.get(value, 0) + delta
+        if count == 0:
+            del counts[value]
+        else:
+            counts[value] = count
+
+    def columnar(self) -> ColumnarTable | None:
+        """Columnar copy of the rows, built on first use and then kept up to date: new rows are appended to it, and
+        removed and modified rows are changed in place. It is built again only once more than half of its positions
+        are those of removed rows. None if some value does not fit in its column vector."""
+        if self._columnar is None:
+            try:
+                self._columnar = ColumnarTable(self.schema, self.items())
+            except OverflowError:
+                return None
+        return self._columnar
+
+    def add_row(self, row_id: RowId, row: TableRow | Mapping[ColumnName, Value]):
+        """Add a row (a dict of the columns is made a Row)"""
+        if not isinstance(row, self.row_class):
+            row = self.row_class.from_mapping(row)
+        self[row_id] = row
+        if row_id >= self.next_row_id:
+            self.next_row_id = row_id + 1
+        if self._columnar is not None:
+            try:
+                self._columnar.append(row_id, row)
+            except (OverflowError, ValueError):  # The columnar copy is built again on its next use
+                self._columnar = None
+        if self.pkey_cols:
+            self.pkey_index[self.pkey_of(row)] = row_id
+        for col in self.pkey_value_counts:
+            self._count_value(col, row[col], 1)
+        for col, get in self._fkey_getters.items():
+            self._index_fkey(col, get(row), row_id)
+
+    def remove_row(self, row_id: RowId) -> TableRow:
+        row = self.pop(row_id)
+        if self._columnar is not None:
+            try:
+                self._columnar.remove(row_id)
+            except KeyError:
+                self._columnar = None
+            else:
+                if self._columnar.num_removed > len(self._columnar) // 2:
+                    self._columnar = None
+        if self.pkey_cols:
+            del self.pkey_index[self.pkey_of(row)]
+        for col in self.pkey_value_counts:
+            self._count_value(col, row[col], -1)
+        for col, get in self._fkey_getters.items():
+            self._unindex_fkey(col, get(row), row_id)
+        return row
+
+    def set_value(self, row_id: RowId, column_name: ColumnName, value: Value):
+        row = self[row_id]
+        if self._columnar is not None:
+            try:
+                self._columnar.set_value(row_id, column_name, value)
+            except (OverflowError, KeyError):
+                self._columnar = None
+        if column_name in self.fkey_index:
+            self._unindex_fkey(column_name, row[column_name], row_id)
+            self._index_fkey(column_name, value, row_id)
+        if column_name in self.pkey_cols:
+            del self.pkey_index[self.pkey_of(row)]
+            if column_name in self.pkey_value_counts:
+                self._count_value(column_name, row[column_name], -1)
+                self._count_value(column_name, value, 1)
+            row[column_name] = value
+            self.pkey_index[self.pkey_of(row)] = row_id
+        else:
+            row[column_name] = value
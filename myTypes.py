@@ -1,10 +1,15 @@
 from datetime import datetime
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, Callable, Iterable, Iterator, Mapping, NotRequired, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from myRow import Row
 
 """Type Aliases"""
 
 ColumnName = str
 TableName = str
+IndexName = str
+StatementName = str
 DataType = tuple[Literal['int', 'char', 'date'], int | None]
 ColumnNameList = list[ColumnName]
 ReferentialConstraint = tuple[Literal['ref'],
@@ -22,21 +27,37 @@ ValueList = list[Value]
 WhereClause = Any
 T_A = tuple[TableName, TableName | None]  # T_A means TableName+Alias
 C_A = tuple[TableName | None, ColumnName, ColumnName | None]  # (table_name, column_name, alias)
+ColumnReference = tuple[TableName | None, ColumnName]
+AggregateFunction = Literal['count', 'sum', 'min', 'max', 'avg']
+# (function, table_name, column_name, alias); column_name is None for COUNT(*)
+AggregateColumn = tuple[AggregateFunction, TableName | None, ColumnName | None, ColumnName | None]
+SortKey = tuple[ColumnReference, bool]  # (column, descending)
 
 CreateTableQuery = tuple[Literal['create_table'], TableName, TableElementList]
-SelectQuery = tuple[Literal['select'], list[C_A], list[T_A], WhereClause | None]
+# ('select', select list, FROM list, WHERE, GROUP BY list, ORDER BY list, LIMIT, OFFSET)
+SelectQuery = tuple[Literal['select'], list[C_A | AggregateColumn], list[T_A], WhereClause | None,
+                    list[ColumnReference] | None, list[SortKey] | None, int | None, int]
 InsertQuery = tuple[Literal['insert'],
-                    TableName, ColumnNameList | None, ValueList]
+                    TableName, ColumnNameList | None, list[ValueList]]
+CopyQuery = tuple[Literal['copy'], TableName, str]
 DeleteQuery = tuple[Literal['delete'], TableName, WhereClause | None]
 UpdateQuery = tuple[Literal['update'], TableName, ColumnName, Value, WhereClause]
 DropTableQuery = tuple[Literal['drop_table'], TableName]
 DescTableQuery = tuple[Literal['desc_table'], TableName]
 ShowTablesQuery = tuple[Literal['show_tables']]
+AnalyzeQuery = tuple[Literal['analyze'], TableName | None]  # None means all tables
+CreateIndexQuery = tuple[Literal['create_index'], IndexName, TableName, ColumnName]
+DropIndexQuery = tuple[Literal['drop_index'], IndexName]
+TransactionQuery = tuple[Literal['begin', 'commit', 'rollback']]
+PrepareQuery = tuple[Literal['prepare'], StatementName, Any]  # The statement is a PreparedStatement (see myStatements)
+ExecuteQuery = tuple[Literal['execute'], StatementName, ValueList]
+DeallocateQuery = tuple[Literal['deallocate'], StatementName]
 
 Query = CreateTableQuery | DropTableQuery | DescTableQuery | ShowTablesQuery \
-        | SelectQuery | InsertQuery | DeleteQuery | UpdateQuery | Literal[
-            'exit']
+        | SelectQuery | InsertQuery | CopyQuery | DeleteQuery | UpdateQuery | AnalyzeQuery | CreateIndexQuery \
+        | DropIndexQuery | TransactionQuery | PrepareQuery | ExecuteQuery | DeallocateQuery | Literal['exit']
 QueryList = list[Query]
+StatementTables = tuple[set[TableName], set[TableName]]  # (tables read, tables modified)
 
 """Types to be saved and loaded to Berkeley DB"""
 
@@ -51,7 +72,15 @@ class TableSchema(TypedDict):
     columns: dict[ColumnName, ColumnMeta]
     primary_key: list[ColumnName]  # If no primary key, empty list (not None!!)
     foreign_keys: dict[ColumnName, tuple[TableName, ColumnName]]
+    indexes: NotRequired[dict[IndexName, ColumnName]]  # Secondary indexes (missing in schemas saved before indexes)
+
+
+class TableStats(TypedDict):
+    """Statistics collected by ANALYZE, used by the planner"""
+    row_count: int
+    distinct_counts: dict[ColumnName, int]  # Number of distinct non-null values of each column
 
 
-TableRow = dict[ColumnName, Value]
-TableData = list[TableRow]
+RowId = int
+TableRow = 'Row'  # A record with a slot per column, which can be used as a dict of the columns (see myRow)
+TableData = dict[RowId, TableRow]  # Rows keyed by row id, in insertion (= row id) order
@@ -1,12 +1,52 @@
+import itertools
+import sys
+
 from myTypes import *
 
 PROMPT = 'DB_2019-18873> '
+RESULT_SAMPLE_ROWS = 1000  # Rows of a result read ahead to fit the column widths before it starts streaming
+RESULT_BUFFER_LINES = 1000  # Lines of a result written to stdout at once
 
 
 def print_after_prompt(msg):
     print(PROMPT + str(msg))
 
 
+def print_result_table(headers: list[str], rows: Iterator[list[str]], width_bounds: list[int]):
+    """Print the rows as a table while they are produced.
+
+    Column widths are fitted to the headers and the first RESULT_SAMPLE_ROWS rows, so a result no longer than that is
+    printed exactly as if it had been fully materialized. If there are more rows, each width is also raised to its
+    bound (the char_len of a char column, for instance) so that later rows still line up.
+    """
+    sample = list(itertools.islice(rows, RESULT_SAMPLE_ROWS))
+    widths = [max([len(header)] + [len(row[i]) for row in sample]) for i, header in enumerate(headers)]
+    next_row = next(rows, None)
+    if next_row is not None:
+        widths = [max(width, bound) for width, bound in zip(widths, width_bounds)]
+        rows = itertools.chain(sample, [next_row], rows)
+    else:
+        rows = iter(sample)
+
+    hr_line = '+' + '+'.join('-' * (width + 2) for width in widths) + '+'
+    row_format = '|' + '|'.join(f' {{:<{width}}} ' for width in widths) + '|'
+
+    buffer: list[str] = [hr_line, row_format.format(*headers), hr_line]
+    try:
+        for row in rows:
+            buffer.append(row_format.format(*row))
+            if len(buffer) >= RESULT_BUFFER_LINES:
+                sys.stdout.write('\n'.join(buffer) + '\n')
+                sys.stdout.flush()
+                buffer.clear()
+        buffer.append(hr_line)
+    finally:
+        # Lines produced before an error are written out too
+        if buffer:
+            sys.stdout.write('\n'.join(buffer) + '\n')
+        sys.stdout.flush()
+
+
 def type_check(data_type: Literal['int', 'char', 'date'], char_len: int | None, value: Value,
                char_len_strict=False) -> bool:
     if data_type == 'int':
@@ -21,15 +61,36 @@ def type_check(data_type: Literal['int', 'char', 'date'], char_len: int | None,
         return isinstance(value, datetime) or value is None
 
 
+def parse_csv_value(data_type: Literal['int', 'char', 'date'], text: str) -> Value:
+    """Value of a CSV field for a column of the type. An empty field or NULL (in any case) is NULL.
+
+    A field that does not parse as the type is returned as is, so that type_check rejects it.
+    """
+    if text == '' or text.upper() == 'NULL':
+        return None
+    try:
+        if data_type == 'int':
+            return int(text)
+        elif data_type == 'date':
+            # fromisoformat is much faster than strptime, but also accepts other formats than YYYY-MM-DD
+            if len(text) == 10 and text[4] == text[7] == '-':
+                return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    return text
+
+
 def select_pkey_cols(schema: TableSchema, row: dict[str, Value]) -> dict[str, Value]:
     if len(schema['primary_key']) == 0:
         raise Exception('No primary key')
     return {col: row[col] for col in schema['primary_key']}
 
 
-def value_to_str(value: Value) -> str:
+def value_to_str(value: Value | float) -> str:
     if isinstance(value, int):
         return str(value)
+    elif isinstance(value, float):  # Average
+        return f'{value:.4f}'
     elif isinstance(value, str):
         return value
     elif isinstance(value, datetime):
@@ -39,7 +100,7 @@ def value_to_str(value: Value) -> str:
         return 'NULL'
 
 
-def pkey_unique_check(schema: TableSchema, rows: list[TableRow]) -> bool:
+def pkey_unique_check(schema: TableSchema, rows: Iterable[TableRow]) -> bool:
     pkey_cols = schema['primary_key']
     if len(pkey_cols) == 0:
         return True
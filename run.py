@@ -1,80 +1,108 @@
-"""Simple Database Management System using Berkeley DB."""
+"""Simple Database Management System using Berkeley DB.
+
+Usage: python run.py                                    interactive prompt
+       python run.py -f FILE|- [--checkpoint N]         run the statements of a script (- for stdin) without prompts
+"""
+
+import argparse
+import itertools
+import sys
 
-from berkeleydb import db
 from lark.exceptions import UnexpectedInput
-from lark.lark import Lark
 
+import myUtils
 from execute import *
+from myStatements import StatementParser, split_statements
 from myUtils import *
-from transformers import SQLTransformer
+from transformers import load_sql_parser
 
-with open('grammar.lark') as file:
-    sql_parser = Lark(file.read(), start="command", lexer="basic",
-                      transformer=SQLTransformer(), parser="lalr")
+SCRIPT_BATCH_STATEMENTS = 1000  # Statements of a script parsed together
 
-# Load from Berkeley DB
-myDB = db.DB()
-myDB.open('myDB', dbtype=db.DB_HASH, flags=db.DB_CREATE)
+arg_parser = argparse.ArgumentParser(description='Simple Database Management System using Berkeley DB.')
+arg_parser.add_argument('-f', '--file', help="run the statements of the script file ('-' for stdin) and exit")
+arg_parser.add_argument('--checkpoint', type=int, default=0, metavar='N',
+                        help='in a script, commit every N statements (default: once, at the end)')
+args = arg_parser.parse_args()
 
+# The compiled parser is loaded from its cache file unless the grammar (or Lark) has changed
+sql_parser = load_sql_parser()
+# Statements parsed recently are not parsed again
+statement_parser = StatementParser(sql_parser)
+prepared_statements: dict[StatementName, PreparedStatement] = {}
+
+# Load from Berkeley DB
 table_schemas: dict[TableName, TableSchema] = {}
-table_data: dict[TableName, TableData] = {}
-
-for key, value in myDB.items():
-    # if key ends with '.schema', it is a table schema. If it ends with '.data', it is a table data.
-    if key.decode().endswith('.schema'):
-        table_schemas[key.decode()[:-7]] = json.loads(value.decode(),
-                                                      cls=MyDecoder)
-    elif key.decode().endswith('.data'):
-        table_data[key.decode()[:-5]] = json.loads(value.decode(),
-                                                   cls=MyDecoder)
-
-exit_flag = False
-
-while not exit_flag:
-    # Get input until query ends with semicolon
-    buf = input(PROMPT)
-    buf = buf.rstrip()  # Strip trailing whitespaces for semicolon check
-    while not buf.endswith(';'):
-        buf += ' '  # Add whitespace between lines
-        buf += input()
-        buf = buf.rstrip()
-
-    query_strings = buf.split(';')
-    query_strings = query_strings[:-1]  # Remove last empty string
-    # Re-append semicolon to each entry of buf
-    query_strings = [entry + ';' for entry in query_strings]
-
-    for query_string in query_strings:
-        try:
-            parsed_tree = sql_parser.parse(query_string)
-            assert (isinstance(parsed_tree, list))  # To bypass type hint error
-            query: Query = parsed_tree[0]
-
-            # Execute query
-            if query == 'exit':
+table_stats: dict[TableName, TableStats] = {}
+
+myDB = MyDB('myDB', table_schemas)
+
+# Only schemas (and statistics) are loaded here; rows of a table are read when a statement first references the table
+myDB.load_catalog(table_stats)
+
+table_data: dict[TableName, TableData] = LazyTableData(myDB)
+
+
+def run_script(file, checkpoint_statements: int):
+    """Run the statements of the file, parsed SCRIPT_BATCH_STATEMENTS at a time, until its end or EXIT.
+
+    Statements outside of BEGIN ... COMMIT are committed together every checkpoint_statements statements (0: at the
+    end only), instead of one by one.
+    """
+    myUtils.PROMPT = ''
+    myDB.batching = True
+    statements = split_statements(file)
+    batched = 0  # Statements run since the last checkpoint
+    while batch := list(itertools.islice(statements, SCRIPT_BATCH_STATEMENTS)):
+        for query in statement_parser.parse_batch(batch):
+            if isinstance(query, UnexpectedInput):
+                print_after_prompt("Syntax error")
+                continue
+            elif isinstance(query, Exception):
+                print_after_prompt(query)
+                continue
+            if not run_query(myDB, table_schemas, table_data, table_stats, prepared_statements, query):
+                return
+            batched += 1
+            if batched == checkpoint_statements:
+                myDB.checkpoint()
+                batched = 0
+
+
+def run_prompt():
+    exit_flag = False
+    while not exit_flag:
+        # Get input until query ends with semicolon
+        buf = input(PROMPT)
+        buf = buf.rstrip()  # Strip trailing whitespaces for semicolon check
+        while not buf.endswith(';'):
+            buf += ' '  # Add whitespace between lines
+            buf += input()
+            buf = buf.rstrip()
+
+        # Split at the semicolons outside of string literals
+        for query_string in split_statements([buf]):
+            try:
+                query: Query = statement_parser.parse(query_string)
+            except UnexpectedInput:
+                print_after_prompt("Syntax error")
+                continue
+            except UnexpectedParameterError as e:
+                print_after_prompt(e)
+                continue
+            if not run_query(myDB, table_schemas, table_data, table_stats, prepared_statements, query):
                 exit_flag = True
                 break
-            elif query[0] == 'create_table':
-                create_table(myDB, table_schemas, table_data, query)
-            elif query[0] == 'drop_table':
-                table_name: TableName = query[1]
-                drop_table(myDB, table_schemas, table_data, table_name)
-            elif query[0] == 'desc_table':
-                table_name: TableName = query[1]
-                desc_table(table_schemas, table_name)
-            elif query[0] == 'show_tables':
-                show_tables(table_schemas)
-            elif query[0] == 'insert':
-                insert_data(myDB, table_schemas, table_data, query)
-            elif query[0] == 'delete':
-                delete_data(myDB, table_schemas, table_data, query)
-            elif query[0] == 'update':
-                update_data(myDB, table_schemas, table_data, query)
-            elif query[0] == 'select':
-                select_data(table_schemas, table_data, query)
-        except UnexpectedInput:
-            print_after_prompt("Syntax error")
-            continue
-
-# Close Berkeley DB
+
+
+if args.file is None:
+    run_prompt()
+elif args.file == '-':
+    run_script(sys.stdin, args.checkpoint)
+else:
+    with open(args.file) as script_file:
+        run_script(script_file, args.checkpoint)
+
+# Commit the statements of a script run since the last checkpoint, then close Berkeley DB (an open transaction is
+# rolled back)
+myDB.checkpoint()
 myDB.close()
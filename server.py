@@ -0,0 +1,250 @@
+"""Local TCP server of the database: one copy of the catalog and of the tables, shared by many client connections.
+
+Usage: python server.py [--host HOST] [--port PORT]
+
+Protocol (UTF-8, newline-delimited): a client sends SQL text, split into statements at the semicolons outside of
+quotes, as in scripts. For each statement the server answers with JSON objects, one per line:
+  {"columns": [name, ...]}, then {"rows": [[value, ...], ...]} in batches    result set of a SELECT
+  {"message": text}                                                           each line a statement prints otherwise
+  {"end": true}                                                               end of the answer to the statement
+Values are ints, strings, dates as 'YYYY-MM-DD' strings, or null. EXIT closes the connection.
+
+Statements run in a pool of threads, under the table locks of myLocks: SELECTs run together, and a statement modifying
+tables waits only for the statements using those tables. Statements modifying different tables still write one after
+the other (see MyDB), while the SELECTs of other tables go on. Statements changing the catalog have the database to
+themselves, and so does a connection that has begun a transaction until it commits or rolls back (or disconnects, which
+rolls back). The threads share the interpreter, so concurrent SELECTs overlap rather than run in parallel.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from lark.exceptions import UnexpectedInput, VisitError
+
+import myUtils
+from execute import *
+from myLocks import TableLocks
+from myParallel import shutdown_worker_pool, start_worker_pool
+from myStatements import StatementParser, StatementSplitter
+from myUtils import *
+from transformers import load_sql_parser
+
+DEFAULT_PORT = 5455
+RESULT_BATCH_ROWS = 1000  # Rows of a result set sent in one line
+WORKER_THREADS = 8  # Statements running at the same time
+
+
+class ThreadOutput(io.TextIOBase):
+    """sys.stdout of the server: what a thread prints while capturing goes to its own buffer"""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.local = threading.local()
+
+    @contextlib.contextmanager
+    def capture(self):
+        self.local.buffer = io.StringIO()
+        try:
+            yield self.local.buffer
+        finally:
+            self.local.buffer = None
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.local, 'buffer', None)
+        return (self.stdout if buffer is None else buffer).write(text)
+
+    def flush(self):
+        self.stdout.flush()
+
+
+def result_batch(rows: Iterator[list[Value]]) -> list[list[Value]]:
+    """The next rows of a result set, dates converted to strings"""
+    return [[value.strftime('%Y-%m-%d') if isinstance(value, datetime) else value for value in row]
+            for row in itertools.islice(rows, RESULT_BATCH_ROWS)]
+
+
+def first_result_batch(my_db, table_schemas: dict[TableName, TableSchema], table_data: dict[TableName, TableData],
+                       table_stats: dict[TableName, TableStats],
+                       query: SelectQuery) -> tuple[list[ColumnName], Iterator[list[Value]], list[list[Value]]]:
+    """The column names and the rows of the result set of the SELECT, with its first batch of rows"""
+    headers, _, rows = select_rows(my_db, table_schemas, table_data, table_stats, query)
+    return headers, rows, result_batch(rows)
+
+
+class Server:
+    """The database and the state shared by the connections"""
+
+    def __init__(self):
+        start_worker_pool()  # Forked before the threads of the server start (see myParallel)
+        self.statement_parser = StatementParser(load_sql_parser())
+        self.table_schemas: dict[TableName, TableSchema] = {}
+        self.table_stats: dict[TableName, TableStats] = {}
+        self.my_db = MyDB('myDB', self.table_schemas)
+        self.my_db.load_catalog(self.table_stats)
+        self.table_data: dict[TableName, TableData] = LazyTableData(self.my_db)
+        self.locks = TableLocks()  # The session with an open transaction holds the catalog lock exclusively
+        self.transaction_owner: Session | None = None
+        self.workers = ThreadPoolExecutor(WORKER_THREADS, thread_name_prefix='statement')
+        self.output = ThreadOutput(sys.stdout)
+        sys.stdout = self.output
+
+    async def serve(self, host: str, port: int):
+        """Serve until SIGINT or SIGTERM"""
+        stopped = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signal_number, stopped.set)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Listening on {', '.join(str(sock.getsockname()) for sock in server.sockets)}", flush=True)
+        async with server:
+            await stopped.wait()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        session = Session(self, writer)
+        splitter = StatementSplitter()
+        try:
+            while line := await reader.readline():
+                for statement in splitter.feed(line.decode()):
+                    if not await session.run(statement):
+                        return
+        except ConnectionError:
+            pass
+        finally:
+            await session.close()
+            writer.close()
+
+    def close(self):
+        self.workers.shutdown()
+        shutdown_worker_pool()
+        sys.stdout = self.output.stdout
+        self.my_db.close()
+
+
+class Session:
+    """State of a connection: its prepared statements and what its current statement printed"""
+
+    def __init__(self, server: Server, writer: asyncio.StreamWriter):
+        self.server = server
+        self.writer = writer
+        self.prepared_statements: dict[StatementName, PreparedStatement] = {}
+        self._output = ''  # Printed by the statement, not sent yet
+
+    async def run(self, statement: str) -> bool:
+        """Run the statement and send its answer. Returns False for EXIT."""
+        server = self.server
+        try:
+            query: Query = server.statement_parser.parse(statement)
+        except UnexpectedInput:
+            await self.send_messages("Syntax error\n")
+            return True
+        except UnexpectedParameterError as e:
+            await self.send_messages(f'{e}\n')
+            return True
+        if query == 'exit':
+            return False
+
+        if query[0] == 'execute':
+            query = self.capture(bind_statement, self.prepared_statements, query)
+        if query is None:
+            pass
+        elif query[0] in ('prepare', 'deallocate'):  # Only the session's statements change
+            self.capture(run_query, server.my_db, server.table_schemas, server.table_data, server.table_stats,
+                         self.prepared_statements, query)
+        elif server.transaction_owner is self:
+            await self.run_locked(query)
+            if not server.my_db.in_transaction:  # COMMIT or ROLLBACK
+                server.transaction_owner = None
+                server.locks.release(None)
+        else:
+            held = await server.locks.acquire(server.table_schemas, query)
+            try:
+                await self.run_locked(query)
+            finally:
+                if held is None and server.my_db.in_transaction:  # BEGIN: the catalog lock is kept
+                    server.transaction_owner = self
+                else:
+                    server.locks.release(held)
+        await self.send_messages('')
+        return True
+
+    async def run_locked(self, query: Query):
+        """Run the statement in a worker thread, its locks held"""
+        server = self.server
+        if query[0] == 'select':
+            await self.send_rows(query)
+        else:
+            await self.in_thread(self.capture, run_query, server.my_db, server.table_schemas, server.table_data,
+                                 server.table_stats, self.prepared_statements, query)
+
+    def in_thread(self, function, *args) -> asyncio.Future:
+        return asyncio.get_running_loop().run_in_executor(self.server.workers, function, *args)
+
+    def capture(self, function, *args):
+        """Call the function, buffering what it prints in this thread, to be sent by the next send_messages"""
+        with self.server.output.capture() as output:
+            result = function(*args)
+        self._output += output.getvalue()
+        return result
+
+    async def send_rows(self, query: SelectQuery):
+        """Send the result set of the SELECT as it is produced"""
+        server = self.server
+        try:
+            # A SELECT does not write, so it runs outside of MyDB.statement, which runs one statement at a time
+            headers, rows, batch = await self.in_thread(first_result_batch, server.my_db, server.table_schemas,
+                                                        server.table_data, server.table_stats, query)
+            await self.send({'columns': headers})
+            while batch:
+                await self.send({'rows': batch})
+                batch = await self.in_thread(result_batch, rows) if len(batch) == RESULT_BATCH_ROWS else []
+        except VisitError as e:
+            self.capture(print_after_prompt, e.orig_exc)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            self.capture(print_after_prompt, e)
+
+    async def send_messages(self, output: str):
+        """Send the lines printed since the last call (and those of output), then the end of the answer"""
+        output, self._output = self._output + output, ''
+        for line in output.splitlines():
+            self.writer.write(json.dumps({'message': line}).encode() + b'\n')
+        await self.send({'end': True})
+
+    async def send(self, obj: dict):
+        self.writer.write(json.dumps(obj).encode() + b'\n')
+        await self.writer.drain()
+
+    async def close(self):
+        """Roll back the transaction the session left open"""
+        server = self.server
+        if server.transaction_owner is self:
+            self.capture(rollback_transaction, server.my_db, server.table_schemas, server.table_data,
+                         server.table_stats)
+            server.transaction_owner = None
+            server.locks.release(None)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Local TCP server of the database.')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = arg_parser.parse_args()
+
+    myUtils.PROMPT = ''  # Messages are sent without the prompt
+    server = Server()
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
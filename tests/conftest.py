@@ -0,0 +1,97 @@
+"""Fixtures of the tests: databases in temporary directories, run statement by statement or by a server process"""
+
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import myUtils
+from execute import *
+from myStatements import StatementParser, split_statements
+from transformers import load_sql_parser
+
+
+@pytest.fixture(scope='session')
+def statement_parser() -> StatementParser:
+    return StatementParser(load_sql_parser(os.path.join(ROOT, 'grammar.lark'), None))
+
+
+class Database:
+    """A database in a directory, whose statements run as in run.py (each one committed on its own)"""
+
+    def __init__(self, home: str, statement_parser: StatementParser):
+        self.home = home
+        self.statement_parser = statement_parser
+        self.prepared_statements: dict[StatementName, PreparedStatement] = {}
+        self.open()
+
+    def open(self):
+        self.table_schemas: dict[TableName, TableSchema] = {}
+        self.table_stats: dict[TableName, TableStats] = {}
+        self.my_db = MyDB('myDB', self.table_schemas, home=self.home)
+        self.my_db.load_catalog(self.table_stats)
+        self.table_data: dict[TableName, TableData] = LazyTableData(self.my_db)
+
+    def close(self):
+        self.my_db.close()
+
+    def reopen(self):
+        """Close the database and open it again, with only what has been committed"""
+        self.close()
+        self.open()
+
+    def run(self, text: str) -> str:
+        """Run the statements of the text, and return what they printed"""
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for statement in split_statements([text]):
+                run_query(self.my_db, self.table_schemas, self.table_data, self.table_stats,
+                          self.prepared_statements, self.statement_parser.parse(statement))
+        return output.getvalue()
+
+
+@pytest.fixture
+def database(tmp_path, statement_parser, monkeypatch) -> Database:
+    monkeypatch.setattr(myUtils, 'PROMPT', '')  # Messages are printed without the prompt
+    database = Database(str(tmp_path), statement_parser)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def spawn_server(tmp_path):
+    """Start server.py in a temporary directory, setting the module constants given as 'module.NAME': value first, and
+    return its port. The servers are stopped at the end of the test."""
+    from loadtest import wait_for_server
+
+    servers = []
+
+    def spawn(constants: dict[str, object] | None = None) -> int:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        home = tmp_path / f'server{len(servers)}'
+        home.mkdir()
+        shutil.copy(os.path.join(ROOT, 'grammar.lark'), home)
+        setup = ''.join(f'import {name.split(".")[0]}; {name} = {value!r}; '
+                        for name, value in (constants or {}).items())
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join([ROOT] + os.environ.get('PYTHONPATH', '').split(os.pathsep))}
+        servers.append(subprocess.Popen(
+            [sys.executable, '-c', f'{setup}import server, sys; sys.argv[1:] = ["--port", "{port}"]; server.main()'],
+            cwd=home, env=env, stdout=subprocess.DEVNULL))
+        asyncio.run(wait_for_server('127.0.0.1', port))
+        return port
+
+    yield spawn
+    for server in servers:
+        server.terminate()  # The server closes the database on SIGTERM
+        assert server.wait() == 0
@@ -0,0 +1,68 @@
+import myColumns
+from myTable import Table
+
+SCHEMA = {'columns': {'id': {'data_type': 'int', 'char_len': None, 'not_null': False}}, 'primary_key': [],
+          'foreign_keys': {}}
+
+
+def test_columnar_copy_follows_updates_and_deletes(database, monkeypatch):
+    monkeypatch.setattr(myColumns, 'COLUMNAR_MIN_ROWS', 0)
+    database.run('create table t (id int, name char(3), born date);')
+    values = ', '.join(f"({i}, 'n{i:02}', 2000-01-{i % 28 + 1:02})" for i in range(100))
+    database.run(f'insert into t values {values};')
+    assert database.run("select count(*) from t where id >= 0 and name != 'x';") == database.run(
+        'select count(*) from t;')
+    columnar = database.table_data['t'].columnar()
+
+    database.run('update t set name = null where id < 10;')
+    database.run("update t set name = 'abc' where id < 5;")
+    database.run("update t set name = 'xyz' where id >= 90;")
+    database.run('update t set born = null where id = 50;')
+    database.run('delete from t where id >= 20 and id < 40;')
+    assert database.table_data['t'].columnar() is columnar
+    assert columnar.num_removed == 20
+
+    def ids(where: str) -> list[int]:
+        output = database.run(f'select id from t where {where};')
+        return sorted(int(line.strip('| ')) for line in output.splitlines() if line.strip('| ').isdigit())
+
+    assert ids("name = 'abc'") == list(range(5))
+    assert ids('name is null') == list(range(5, 10))
+    assert ids("name = 'xyz'") == list(range(90, 100))
+    assert ids("name >= 'n15' and name <= 'n25'") == list(range(15, 20))
+    assert ids('born is null') == [50]
+    assert ids('id >= 15 and id < 45') == list(range(15, 20)) + list(range(40, 45))
+    assert database.table_data['t'].columnar() is columnar
+
+
+def test_replaced_char_values_are_compacted():
+    column = myColumns.CharColumn()
+    for value in ('abc', None, 'de'):
+        column.append(value)
+    for _ in range(10):
+        column.set(0, 'a longer value')
+        column.set(2, 'é')
+    assert [column[position] for position in range(3)] == ['a longer value', None, 'é']
+    assert len(column.buffer) <= 2 * len('a longer valueé'.encode())
+
+
+def test_columnar_copy_after_deleting_the_last_row(database, monkeypatch):
+    monkeypatch.setattr(myColumns, 'COLUMNAR_MIN_ROWS', 0)
+    database.run('create table t (id int, v int); insert into t values (0, 0), (1, 1), (2, 2);')
+    database.run('select * from t where v = 0;')  # Builds the columnar copy
+    database.run('delete from t where id = 2; insert into t values (10, 10); update t set v = 99 where id = 10;')
+    assert database.run('select id from t where v = 99;').splitlines()[3:-1] == ['| 10 |']
+    assert database.run('select id from t where v = 10;').splitlines()[3:-1] == []
+
+    database.run('delete from t where id = 10;')
+    assert database.run('select id from t where v >= 0;').splitlines()[3:-1] == ['| 0  |', '| 1  |']
+
+
+def test_columnar_copy_is_dropped_rather_than_corrupted():
+    table = Table(SCHEMA, [(0, {'id': 0}), (1, {'id': 1})])
+    columnar = table.columnar()
+    table.remove_row(1)
+    table.add_row(1, {'id': 2})  # A reused row id
+    assert table.columnar() is not columnar
+    assert list(table.columnar().filter([('id', 'gte', 0)])) == [0, 1]
+    assert table[1]['id'] == 2
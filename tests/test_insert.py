@@ -0,0 +1,57 @@
+import execute
+
+
+def row_ids(database) -> list[int]:
+    return list(database.table_data['t'])
+
+
+def test_row_ids_of_deleted_rows_are_not_reused(database):
+    database.run('create table t (id int, v int); insert into t values (0, 0), (1, 1), (2, 2);')
+    database.run('delete from t where id = 2;')
+    database.run('insert into t values (10, 10);')
+    assert row_ids(database) == [0, 1, 3]
+
+    database.run('delete from t where id >= 1;')
+    database.reopen()
+    database.run('insert into t values (20, 20), (21, 21);')
+    assert row_ids(database) == [0, 4, 5]
+
+    database.run('drop table t; create table t (id int, v int); insert into t values (30, 30);')
+    assert row_ids(database) == [0]
+
+
+def copy_file(tmp_path, ids: list[int]) -> str:
+    path = tmp_path / 'rows.csv'
+    path.write_text(''.join(f'{row_id},{row_id}\n' for row_id in ids))
+    return str(path)
+
+
+def test_copy_inserts_each_batch_before_reading_the_next(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(execute, 'COPY_BATCH_ROWS', 2)
+    calls = []
+
+    def recorded(function):
+        def record(*args):
+            calls.append((function.__name__, len(args[-1])))  # The value lists or the rows of the batch
+            return function(*args)
+        return record
+
+    monkeypatch.setattr(execute, 'check_rows', recorded(execute.check_rows))
+    monkeypatch.setattr(execute, 'insert_rows', recorded(execute.insert_rows))
+    database.run('create table t (id int, v int, primary key (id));')
+    assert database.run(f"copy t from '{copy_file(tmp_path, [1, 2, 3, 4, 5])}';").startswith('5 row(s)')
+    assert calls == [('check_rows', 2), ('insert_rows', 2), ('check_rows', 2), ('insert_rows', 2),
+                     ('check_rows', 1), ('insert_rows', 1)]
+    assert row_ids(database) == [0, 1, 2, 3, 4]
+
+
+def test_failed_copy_loads_no_row(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(execute, 'COPY_BATCH_ROWS', 2)
+    database.run('create table t (id int, v int, primary key (id)); insert into t values (0, 0);')
+    # The duplicate is in the third batch, after two batches have been inserted
+    assert database.run(f"copy t from '{copy_file(tmp_path, [1, 2, 3, 4, 1])}';") == \
+        'Insertion has failed: Primary key duplication\n'
+    assert row_ids(database) == [0]
+    database.reopen()
+    assert row_ids(database) == [0]
+    assert database.run(f"copy t from '{copy_file(tmp_path, [1, 2, 3])}';").startswith('3 row(s)')
@@ -0,0 +1,50 @@
+import bdbUtils
+from myUtils import RESULT_SAMPLE_ROWS
+
+
+def test_wide_values_after_the_sample_line_up(database):
+    database.run('create table t (id int, n int);')
+    values = ', '.join(f'({i}, {i % 10})' for i in range(RESULT_SAMPLE_ROWS + 1))
+    database.run(f'insert into t values {values}, (-1, -9223372036854775808), (-2, 9223372036854775807);')
+    lines = database.run('select * from t;').splitlines()
+    assert len(lines) == RESULT_SAMPLE_ROWS + 7
+    assert lines[-2] == f"| {'-2':<20} | 9223372036854775807  |"
+    assert len({len(line) for line in lines}) == 1
+
+    lines = database.run('select id, count(*), sum(n), avg(n), max(n) from t group by id;').splitlines()
+    assert lines[-3].startswith(f"| {'-1':<20} | {'1':<20} | -9223372036854775808 | -9223372036854775808.0000 |")
+    assert len({len(line) for line in lines}) == 1
+
+
+def counts(database, query: str) -> list[str]:
+    """The values of the single row of the result"""
+    return [value.strip() for value in database.run(query).splitlines()[3].strip('|').split('|')]
+
+
+def test_count_star_reads_no_row(database, monkeypatch):
+    database.run('create table t (id int, n int, primary key (id)); create table u (id int);')
+    database.run('insert into t values (1, 1), (2, 2), (3, 3); insert into u values (1), (2);')
+    database.run('delete from t where id = 2; insert into t values (4, 4), (5, 5); insert into t values (1, 1);')
+    database.run('begin; delete from t; rollback;')
+    database.reopen()
+    decoded = []
+    decode_row = bdbUtils.decode_row
+    monkeypatch.setattr(bdbUtils, 'decode_row', lambda *args: decoded.append(args) or decode_row(*args))
+
+    assert counts(database, 'select count(*), count(*) as n from t, u;') == ['8', '8']
+    assert counts(database, 'select count(*) from u as a;') == ['2']
+    assert decoded == []
+    assert 't' not in database.table_data
+
+    database.run('drop table t; create table t (id int);')
+    assert counts(database, 'select count(*) from t;') == ['0']
+
+
+def test_count_star_of_a_table_without_row_count(database):
+    database.run('create table t (id int); insert into t values (1), (2);')
+    database.run('begin;')
+    database.my_db.delete(bdbUtils.tname_to_row_count_key('t').encode())  # As in a database written before it was kept
+    database.run('commit;')
+    database.reopen()
+    database.run('insert into t values (3);')
+    assert counts(database, 'select count(*) from t;') == ['3']
@@ -0,0 +1,83 @@
+import asyncio
+
+from client import Client
+
+WRITERS = 4
+INSERTS = 20  # Per writer
+INSERT_ROWS = 10  # Per INSERT
+
+
+async def write(port: int, writer: int):
+    """INSERTs of INSERT_ROWS rows each, into table w0 or w1"""
+    client = await Client.connect('127.0.0.1', port)
+    try:
+        for i in range(INSERTS):
+            first_id = (writer * INSERTS + i) * INSERT_ROWS
+            values = ', '.join(f'({row_id}, {writer})' for row_id in range(first_id, first_id + INSERT_ROWS))
+            result = await client.execute(f'insert into w{writer % 2} values {values};')
+            assert result.messages == [f'{INSERT_ROWS} row(s) are inserted']
+    finally:
+        await client.close()
+
+
+async def read(port: int, done: asyncio.Event) -> int:
+    """Number of SELECTs run until the writers are done, each checking that no INSERT is seen in part"""
+    client = await Client.connect('127.0.0.1', port)
+    selects = 0
+    try:
+        while selects == 0 or not done.is_set():
+            for table in ('w0', 'w1'):
+                result = await client.execute(f'select id, writer from {table};')
+                counts = {}
+                for _, writer in result.rows:
+                    counts[writer] = counts.get(writer, 0) + 1
+                assert all(count % INSERT_ROWS == 0 for count in counts.values()), counts
+                selects += 1
+    finally:
+        await client.close()
+    return selects
+
+
+async def write_and_read(port: int) -> list[list]:
+    client = await Client.connect('127.0.0.1', port)
+    for table in ('w0', 'w1'):
+        await client.execute(f'create table {table} (id int not null, writer int, primary key (id));')
+    done = asyncio.Event()
+    readers = [asyncio.create_task(read(port, done)) for _ in range(4)]
+    await asyncio.gather(*[write(port, writer) for writer in range(WRITERS)])
+    done.set()
+    await asyncio.gather(*readers)
+    tables = [(await client.execute(f'select id from {table};')).rows for table in ('w0', 'w1')]
+    await client.close()
+    return tables
+
+
+def test_concurrent_inserts_are_seen_whole_and_none_is_lost(spawn_server):
+    tables = asyncio.run(write_and_read(spawn_server()))
+    ids = sorted(row_id for table in tables for [row_id] in table)
+    assert ids == list(range(WRITERS * INSERTS * INSERT_ROWS))
+    assert len(tables[0]) == len(tables[1])
+
+
+async def scan_in_parallel(port: int) -> list[list]:
+    client = await Client.connect('127.0.0.1', port)
+    await client.execute('create table p (id int not null, n int, primary key (id));')
+    values = ', '.join(f'({row_id}, {row_id % 10})' for row_id in range(1000))
+    await client.execute(f'insert into p values {values};')
+    clients = [await Client.connect('127.0.0.1', port) for _ in range(4)]
+    results = await asyncio.gather(*[other.execute(f'select id from p where n = {i} and id < 500;')
+                                     for i, other in enumerate(clients)])
+    await client.execute('update p set n = 0 where id < 100;')
+    await client.execute('delete from p where id >= 400;')
+    results.append(await client.execute('select id from p where n = 0 and id >= 50;'))
+    for other in clients + [client]:
+        await other.close()
+    return [result.rows for result in results]
+
+
+def test_parallel_scans_through_the_server(spawn_server):
+    port = spawn_server({'myParallel.PARALLEL_SCAN_MIN_ROWS': 100, 'myParallel.PARALLEL_SCAN_WORKERS': 2})
+    results = asyncio.run(scan_in_parallel(port))
+    for i, rows in enumerate(results[:4]):
+        assert rows == [[row_id] for row_id in range(i, 500, 10)]
+    assert results[4] == [[row_id] for row_id in list(range(50, 100)) + list(range(100, 400, 10))]
@@ -0,0 +1,8 @@
+def test_cached_select_queries_are_left_unchanged(database):
+    database.run("create table t (id int, name char(1)); insert into t values (1, 'a');")
+    first = database.run('select * from t;')
+    assert database.run('select * from t;') == first
+    assert database.statement_parser.parse('select * from t;')[1] == []
+
+    database.run('prepare s as select * from t where id = ?;')
+    assert database.run('execute s (1);') == database.run('execute s (1);') == first
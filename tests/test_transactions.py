@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def names(database):
+    database.run("create table t (id int, name char(3), primary key (id));"
+                 "insert into t values (1, 'abc'), (2, 'bcd'), (3, 'cde');")
+    return database
+
+
+def fail_second_put_row(database):
+    """Make the second row written by the database raise, as if the disk were full"""
+    put_row = database.my_db.put_row
+    calls = []
+
+    def failing_put_row(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError('No space left on device')
+        put_row(*args, **kwargs)
+
+    database.my_db.put_row = failing_put_row
+
+
+def selected_rows(database, statement: str) -> list[str]:
+    return database.run(statement).splitlines()[3:-1]
+
+
+def test_failed_update_leaves_no_write(names):
+    fail_second_put_row(names)
+    assert names.run("update t set name = 'xyz';") == 'No space left on device\n'
+    assert selected_rows(names, 'select * from t;') == ['| 1  | abc  |', '| 2  | bcd  |', '| 3  | cde  |']
+    names.reopen()
+    assert selected_rows(names, 'select * from t;') == ['| 1  | abc  |', '| 2  | bcd  |', '| 3  | cde  |']
+
+
+def test_failed_statement_keeps_its_transaction(names):
+    names.run("begin; insert into t values (4, 'def');")
+    fail_second_put_row(names)
+    assert names.run("update t set name = 'xyz' where id > 1;") == 'No space left on device\n'
+    assert names.run("delete from t where id = 1; commit;") == '1 row(s) are deleted\nTransaction is committed\n'
+    names.reopen()
+    assert selected_rows(names, 'select * from t;') == ['| 2  | bcd  |', '| 3  | cde  |', '| 4  | def  |']
+
+
+def test_reads_of_other_threads_are_outside_the_statement_transaction(names):
+    my_db = names.my_db
+    seen = []
+    with my_db.statement():
+        assert my_db.txn is not None
+        reader = threading.Thread(target=lambda: seen.append((my_db.txn, list(my_db.iter_rows('t')))))
+        reader.start()
+        reader.join()
+    assert seen[0][0] is None
+    assert len(seen[0][1]) == 3
@@ -0,0 +1,37 @@
+import pytest
+
+INCOMPARABLE = 'Where clause try to compare incomparable values\n'
+
+
+@pytest.fixture
+def people(database):
+    database.run("create table p (id int, name char(3), primary key (id));"
+                 "create index p_id on p (id);"
+                 "insert into p values (1, 'abc'), (2, 'bcd');")
+    return database
+
+
+@pytest.mark.parametrize('where', ['id = 5 and name < 3', 'name < 3 and id = 5', 'id = 1 and name < 3',
+                                   'id > 7 and name >= 3', 'id = 5 and (name < 3 or id = 1)'])
+@pytest.mark.parametrize('statement', ['select * from p where {};', 'delete from p where {};',
+                                       "update p set name = 'xyz' where {};"])
+def test_incomparable_conjunct_after_index_conjunct(people, statement, where):
+    # The index finds no row (or one) for the first conjunct, so the second one may never be evaluated on a row
+    assert people.run(statement.format(where)) == INCOMPARABLE
+    assert people.run('select count(*) from p;').splitlines()[3] == '| 2        |'
+
+
+def test_incomparable_conjunct_of_join(people):
+    assert people.run('select * from p as a, p as b where a.id = 5 and a.name < b.id;') == INCOMPARABLE
+    assert people.run('select * from p as a, p as b where a.id = b.id and a.name < 3;') == INCOMPARABLE
+
+
+def test_incomparable_conjunct_on_empty_table(database):
+    database.run('create table e (id int, d date);')
+    assert database.run("select * from e where id < 'x';") == INCOMPARABLE
+    assert database.run('delete from e where d > 3 or id = 1;') == INCOMPARABLE
+
+
+def test_equality_of_different_types_is_false(people):
+    assert people.run("select * from p where id = 'abc' or name = 1;").splitlines()[3:] == ['+----+------+']
+    assert people.run('select * from p where id > 1 and name != 1;').splitlines()[3] == '| 2  | bcd  |'
@@ -1,7 +1,13 @@
+import operator
+from typing import Callable
+
+from lark import Lark
 from lark.lexer import Token
 from lark.visitors import Transformer
 
 from myMsgs import *
+from myRow import row_class
+from myStatements import Parameter
 from myTypes import *
 
 
@@ -84,6 +90,8 @@ class SQLTransformer(Transformer):
             val = datetime.strptime(val, '%Y-%m-%d')
         elif val_token.type == 'NULL':
             val = None
+        elif val_token.type == 'PARAM':
+            val = Parameter(val_token.start_pos)
         return val
 
     def value_list(self, args) -> ValueList:
@@ -92,8 +100,42 @@ class SQLTransformer(Transformer):
     def insert_query(self, args) -> InsertQuery:
         table_name: TableName = args[2]
         column_name_list: ColumnNameList | None = args[3]
-        value_list: ValueList = args[5]
-        return 'insert', table_name, column_name_list, value_list
+        value_lists: list[ValueList] = args[5:]
+        return 'insert', table_name, column_name_list, value_lists
+
+    def begin_query(self, args) -> TransactionQuery:
+        return 'begin',
+
+    def commit_query(self, args) -> TransactionQuery:
+        return 'commit',
+
+    def rollback_query(self, args) -> TransactionQuery:
+        return 'rollback',
+
+    def statement_name(self, args) -> StatementName:
+        return args[0].value.lower()
+
+    def preparable_query(self, args) -> Query:
+        return args[0]
+
+    def prepare_query(self, args) -> PrepareQuery:
+        statement_name: StatementName = args[1]
+        query: Query = args[3]
+        return 'prepare', statement_name, query
+
+    def execute_query(self, args) -> ExecuteQuery:
+        statement_name: StatementName = args[1]
+        values: ValueList = args[2] if args[2] is not None else []
+        return 'execute', statement_name, values
+
+    def deallocate_query(self, args) -> DeallocateQuery:
+        statement_name: StatementName = args[1]
+        return 'deallocate', statement_name
+
+    def copy_query(self, args) -> CopyQuery:
+        table_name: TableName = args[1]
+        file_name: str = args[3].value[1:-1]  # remove quotes
+        return 'copy', table_name, file_name
 
     def delete_query(self, args) -> DeleteQuery:
         table_name: TableName = args[2]
@@ -101,11 +143,11 @@ class SQLTransformer(Transformer):
         return 'delete', table_name, where_clause
 
     def select_query(self, args) -> SelectQuery:
-        select_list: list[C_A] = args[1]
-        (t_a_list, where_clause) = args[2]
-        return 'select', select_list, t_a_list, where_clause
+        select_list: list[C_A | AggregateColumn] = args[1]
+        (t_a_list, where_clause, group_by, order_by, (limit, offset)) = args[2]
+        return 'select', select_list, t_a_list, where_clause, group_by, order_by, limit, offset
 
-    def select_list(self, args: list[C_A]) -> list[C_A]:
+    def select_list(self, args: list[C_A | AggregateColumn]) -> list[C_A | AggregateColumn]:
         return args
 
     def selected_column(self, args) -> C_A:
@@ -114,10 +156,48 @@ class SQLTransformer(Transformer):
         column_alias: ColumnName | None = args[3]
         return table_name, column_name, column_alias
 
-    def table_expression(self, args) -> tuple[list[T_A], WhereClause | None]:
+    def aggregate_column(self, args) -> AggregateColumn:
+        function: AggregateFunction = args[0]
+        argument: ColumnReference | None = args[2]
+        column_alias: ColumnName | None = args[5]
+        (table_name, column_name) = argument if argument is not None else (None, None)
+        return function, table_name, column_name, column_alias
+
+    def aggregate_function(self, args) -> AggregateFunction:
+        return args[0].value.lower()
+
+    def aggregate_argument(self, args) -> ColumnReference | None:
+        return args[0] if args else None  # None for '*'
+
+    def column_reference(self, args) -> ColumnReference:
+        table_name: TableName | None = args[0]
+        column_name: ColumnName = args[1]
+        return table_name, column_name
+
+    def table_expression(self, args) -> tuple[list[T_A], WhereClause | None, list[ColumnReference] | None,
+                                              list[SortKey] | None, tuple[int | None, int]]:
         t_a_list: list[T_A] = args[0]
         where_clause: WhereClause | None = args[1]
-        return t_a_list, where_clause
+        group_by: list[ColumnReference] | None = args[2]
+        order_by: list[SortKey] | None = args[3]
+        limit_offset: tuple[int | None, int] = args[4] if args[4] is not None else (None, 0)
+        return t_a_list, where_clause, group_by, order_by, limit_offset
+
+    def group_by_clause(self, args) -> list[ColumnReference]:
+        return args[2:]
+
+    def order_by_clause(self, args) -> list[SortKey]:
+        return args[2:]
+
+    def sort_key(self, args) -> SortKey:
+        column: ColumnReference = args[0]
+        descending: bool = args[1] is not None and args[1].type == 'DESC'
+        return column, descending
+
+    def limit_clause(self, args) -> tuple[int, int]:
+        limit = int(args[1].value)
+        offset = int(args[3].value) if args[3] is not None else 0
+        return limit, offset
 
     def from_clause(self, args) -> list[T_A]:
         return args[1]
@@ -130,6 +210,23 @@ class SQLTransformer(Transformer):
         table_alias: TableName | None = args[2]
         return table_name, table_alias
 
+    def index_name(self, args) -> IndexName:
+        return args[0].value.lower()
+
+    def create_index_query(self, args) -> CreateIndexQuery:
+        index_name: IndexName = args[2]
+        table_name: TableName = args[4]
+        column_name: ColumnName = args[6]
+        return 'create_index', index_name, table_name, column_name
+
+    def drop_index_query(self, args) -> DropIndexQuery:
+        index_name: IndexName = args[2]
+        return 'drop_index', index_name
+
+    def analyze_query(self, args) -> AnalyzeQuery:
+        table_name: TableName | None = args[1]
+        return 'analyze', table_name
+
     def update_query(self, args) -> UpdateQuery:
         table_name: TableName = args[1]
         column_name: ColumnName = args[3]
@@ -138,100 +235,128 @@ class SQLTransformer(Transformer):
         return 'update', table_name, column_name, value, where_clause
 
 
-class WhereClauseTransformer(Transformer):
-    """If return type is bool | None, None means Unknown (i.e., Possible values : true, false, unknown)"""
+GRAMMAR_FILE = 'grammar.lark'
+PARSER_CACHE_FILE = 'grammar.lark.cache'  # Compiled parser, next to the database files
 
-    def __init__(self, table_rows: dict[TableName, TableRow]):
-        self.table_rows = table_rows
+
+def load_sql_parser(grammar_file: str = GRAMMAR_FILE, cache_file: str | None = PARSER_CACHE_FILE) -> Lark:
+    """The LALR parser of the grammar, which transforms statements with SQLTransformer.
+
+    Building the LALR tables takes most of the startup time, so they are saved to cache_file (unless it is None) and
+    loaded from it while its header matches the SHA-256 of the grammar, the parser options, the Lark version and the
+    Python version. Otherwise the tables are rebuilt and the cache is rewritten.
+    """
+    with open(grammar_file) as file:
+        return Lark(file.read(), start="command", lexer="basic", transformer=SQLTransformer(), parser="lalr",
+                    cache=cache_file or False)
+
+
+WherePredicate = Callable[[dict[TableName, TableRow]], bool | None]
+OperandGetter = Callable[[dict[TableName, TableRow]], Value]
+
+_COMPARISON_OPERATORS = {'lt': operator.lt, 'gt': operator.gt, 'eq': operator.eq,
+                         'gte': operator.ge, 'lte': operator.le, 'neq': operator.ne}
+
+
+class WhereClauseCompiler(Transformer):
+    """Compiles a where clause into a predicate over {table name: row}, to be evaluated once per candidate row.
+
+    Column references are resolved and literals converted once, at compile time. The predicate returns True, False,
+    or None for Unknown. Every sub-expression is evaluated (no short-circuit), and a reference that cannot be resolved
+    raises its error when the predicate is evaluated, as when the tree was transformed for each row.
+    """
+
+    def __init__(self, table_columns: dict[TableName, list[ColumnName]]):
+        self.table_columns = table_columns
         super().__init__()
 
-    def where_clause(self, args) -> bool | None:
+    def where_clause(self, args) -> WherePredicate:
         return args[1]
 
-    def boolean_expr(self, args) -> bool | None:
-        boolean_terms: list[bool] = args[::2]
-        intermediate_result: bool | None = False
-        for term in boolean_terms:
-            if term is True or intermediate_result is True:
-                intermediate_result = True
-            elif term is None or intermediate_result is None:
-                intermediate_result = None
-            else:
-                intermediate_result = intermediate_result or term
-        return intermediate_result
-
-    def boolean_term(self, args) -> bool | None:
-        boolean_factors: list[bool | None] = args[::2]
-        intermediate_result: bool | None = True
-        for factor in boolean_factors:
-            if factor is False or intermediate_result is False:
-                intermediate_result = False
-            elif factor is None or intermediate_result is None:
-                intermediate_result = None
-            else:
-                intermediate_result = intermediate_result and factor
-        return intermediate_result
-
-    def boolean_factor(self, args) -> bool | None:
+    def boolean_expr(self, args) -> WherePredicate:
+        boolean_terms: list[WherePredicate] = args[::2]
+        if len(boolean_terms) == 1:
+            return boolean_terms[0]
+
+        def evaluate(table_rows):
+            results = [term(table_rows) for term in boolean_terms]
+            if True in results:
+                return True
+            elif None in results:
+                return None
+            return False
+
+        return evaluate
+
+    def boolean_term(self, args) -> WherePredicate:
+        boolean_factors: list[WherePredicate] = args[::2]
+        if len(boolean_factors) == 1:
+            return boolean_factors[0]
+
+        def evaluate(table_rows):
+            results = [factor(table_rows) for factor in boolean_factors]
+            if False in results:
+                return False
+            elif None in results:
+                return None
+            return True
+
+        return evaluate
+
+    def boolean_factor(self, args) -> WherePredicate:
         not_keyword_exists = args[0] is not None
-        boolean_test: bool | None = args[1]
+        boolean_test: WherePredicate = args[1]
+        if not not_keyword_exists:
+            return boolean_test
 
-        if boolean_test is None:
-            return None
-        else:
-            if not_keyword_exists:
-                return not boolean_test
-            else:
-                return boolean_test
+        def evaluate(table_rows):
+            result = boolean_test(table_rows)
+            return None if result is None else not result
 
-    def boolean_test(self, args) -> bool | None:
+        return evaluate
+
+    def boolean_test(self, args) -> WherePredicate:
         return args[0]
 
-    def parenthesized_boolean_expr(self, args) -> bool:
+    def parenthesized_boolean_expr(self, args) -> WherePredicate:
         return args[1]
 
-    def predicate(self, args) -> bool | None:
+    def predicate(self, args) -> WherePredicate:
         return args[0]
 
-    def comparison_predicate(self, args) -> bool | None:
-        left = args[0]
-        right = args[2]
-        comp_operator: Literal['lt', 'gt', 'eq',
-                               'gte', 'lte', 'neq'] = args[1].data
-        # If either operand is None(NULL), the comparison is unknown -> return None
-        if left is None or right is None:
-            return None
-
-        # Case-insensitive comparison for string
-        if isinstance(left, str):
-            left = left.lower()
-        if isinstance(right, str):
-            right = right.lower()
+    def comparison_predicate(self, args) -> WherePredicate:
+        get_left: OperandGetter = args[0]
+        get_right: OperandGetter = args[2]
+        compare = _COMPARISON_OPERATORS[args[1].data]
 
-        try:
-            # Compare left and right values
-            if comp_operator == 'lt':
-                return left < right
-            elif comp_operator == 'gt':
-                return left > right
-            elif comp_operator == 'eq':
-                return left == right
-            elif comp_operator == 'gte':
-                return left >= right
-            elif comp_operator == 'lte':
-                return left <= right
-            elif comp_operator == 'neq':
-                return left != right
-        except TypeError:
-            raise WhereIncomparableError()
-
-    def comp_operand(self, args) -> Value:
+        def evaluate(table_rows):
+            left = get_left(table_rows)
+            right = get_right(table_rows)
+            # If either operand is None(NULL), the comparison is unknown -> return None
+            if left is None or right is None:
+                return None
+
+            # Case-insensitive comparison for string
+            if isinstance(left, str):
+                left = left.lower()
+            if isinstance(right, str):
+                right = right.lower()
+
+            try:
+                return compare(left, right)
+            except TypeError:
+                raise WhereIncomparableError()
+
+        return evaluate
+
+    def comp_operand(self, args) -> OperandGetter:
         if len(args) == 1:
-            # Comparable value
-            return args[0]
+            # Comparable value (strings are lowered once here, as they are compared case-insensitively)
+            value: Value = args[0].lower() if isinstance(args[0], str) else args[0]
+            return lambda table_rows: value
         elif len(args) == 2:
             # (Table name,) Column name
-            return self.get_value_from_row(args[0], args[1])
+            return self.column_getter(args[0], args[1])
 
     def comparable_value(self, args) -> Value:
         val_token: Token = args[0]
@@ -246,12 +371,12 @@ class WhereClauseTransformer(Transformer):
             val = None
         return val
 
-    def null_predicate(self, args) -> bool:
+    def null_predicate(self, args) -> WherePredicate:
         table_name: TableName | None = args[0]
         column_name: ColumnName = args[1]
         check_is_null: bool = args[2]
-        val: Value = self.get_value_from_row(table_name, column_name)
-        return check_is_null == (val is None)
+        get_value = self.column_getter(table_name, column_name)
+        return lambda table_rows: check_is_null == (get_value(table_rows) is None)
 
     def null_operation(self, args) -> bool:
         """Returns True if "IS NULL" and False if "IS NOT NULL\""""
@@ -260,12 +385,12 @@ class WhereClauseTransformer(Transformer):
         else:  # IS NULL
             return True
 
-    def get_value_from_row(self, table_name: TableName | None, column_name: ColumnName) -> Value:
-        """Helper function to get value from row"""
+    def resolve_column(self, table_name: TableName | None, column_name: ColumnName) -> TableName:
+        """Helper function to find the table a column reference belongs to"""
         if table_name is None:
             # If column_name occurs only once across tables, use that table. Otherwise, raise error.
-            for tn in self.table_rows:
-                if column_name in self.table_rows[tn]:
+            for tn in self.table_columns:
+                if column_name in self.table_columns[tn]:
                     if table_name is None:
                         table_name = tn
                     else:
@@ -275,8 +400,27 @@ class WhereClauseTransformer(Transformer):
                 # Column name does not occur in any table
                 raise WhereColumnNotExist()
         else:
-            if table_name not in self.table_rows:
+            if table_name not in self.table_columns:
                 raise WhereTableNotSpecified()
-            if column_name not in self.table_rows[table_name]:
+            if column_name not in self.table_columns[table_name]:
                 raise WhereColumnNotExist()
-        return self.table_rows[table_name][column_name]
+        return table_name
+
+    def column_getter(self, table_name: TableName | None, column_name: ColumnName) -> OperandGetter:
+        try:
+            table_name = self.resolve_column(table_name, column_name)
+        except Exception as e:
+            error = e
+
+            def raise_error(table_rows):
+                raise error
+
+            return raise_error
+        # Rows are records in the order of table_columns, so the value is read at the column's offset
+        get_value = row_class(tuple(self.table_columns[table_name])).getter(column_name)
+        return lambda table_rows: get_value(table_rows[table_name])
+
+
+def compile_where(where_clause: WhereClause, table_columns: dict[TableName, list[ColumnName]]) -> WherePredicate:
+    """Compile a where clause over the given {table name (or alias): column names}"""
+    return WhereClauseCompiler(table_columns).transform(where_clause)